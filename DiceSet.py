@@ -1,4 +1,3 @@
-import random
 import numpy as np
 
 
@@ -6,6 +5,26 @@ class DiceSet:
     POSSIBLE_VALUES = [1, 2, 3, 4, 5, 6]
     DICE_TYPE_AUTO = 1
     DICE_TYPE_MANUAL = 2
+    DICE_TYPE_TAPE = 3  # read from a DiceTape
+    # each face adds its own power of 6 to a dice key, so the key counts how many of each face there are.
+    # Keys don't depend on the order of the dice, and are less than NUM_DICE_KEYS for up to 5 dice.
+    FACE_KEYS = (0, 1, 6, 36, 216, 1296, 7776)  # indexed by face value
+    FACE_KEY_ARRAY = np.array(FACE_KEYS, dtype=np.int32)
+    NUM_DICE_KEYS = 6 ** 6
+    # automatic dice are drawn from blocks of this many random values, refilled when they run out
+    RANDOM_BLOCK_SIZE = 4096
+
+    @staticmethod
+    def dice_key(dice_values):
+        key = 0
+        for value in dice_values:
+            key += DiceSet.FACE_KEYS[value]
+        return key
+
+    @staticmethod
+    def dice_keys(dice):
+        # keys for each row of a 2-D array of dice
+        return np.sum(DiceSet.FACE_KEY_ARRAY[dice], axis=-1)
 
     @staticmethod
     def parse_dice_values(user_entered_str):
@@ -27,9 +46,33 @@ class DiceSet:
     def default_format(x):
         return x
 
-    def __init__(self, dice_type=DICE_TYPE_AUTO, dice_format=None):
+    @staticmethod
+    def roll_many(rng, num_sets, fixed_dice=None, fixed_mask=None):
+        # rolls num_sets sets of 5 dice at once, keeping the values of fixed_dice where fixed_mask is True.
+        # Each row of the result is sorted.
+        dice = rng.integers(1, 7, size=(num_sets, 5), dtype=np.int8)
+        return DiceSet.fix_dice(dice, fixed_dice, fixed_mask)
+
+    @staticmethod
+    def fix_dice(dice, fixed_dice=None, fixed_mask=None):
+        # replaces dice with fixed_dice where fixed_mask is True, and sorts each row
+        if fixed_dice is not None:
+            dice = np.where(fixed_mask, fixed_dice, dice)
+        dice.sort(axis=1)
+        return dice
+
+    def __init__(self, dice_type=DICE_TYPE_AUTO, dice_format=None, rng=None, tape=None):
         self.dice_values = np.ndarray(5, dtype=np.byte)
         self.dice_type = dice_type
+        # a numpy Generator, so automatic dice can be seeded for each game or worker
+        if rng is None:
+            rng = np.random.default_rng()
+        self.rng = rng
+        self.random_block = []
+        self.random_block_index = 0
+        # for DICE_TYPE_TAPE, the DiceTape and where we are on it
+        self.tape = tape
+        self.start_tape_game(0)
         if dice_type == DiceSet.DICE_TYPE_AUTO:
             # initialize the dice
             self.roll(None)
@@ -38,6 +81,12 @@ class DiceSet:
         else:
             self.dice_format = dice_format
 
+    def start_tape_game(self, game):
+        # the next roll with nothing fixed is the first turn of this game on the tape
+        self.tape_game = game
+        self.tape_turn = -1
+        self.tape_roll = 0
+
     def roll(self, fixed):
         if self.dice_type == DiceSet.DICE_TYPE_MANUAL:
             example_str = "12345"
@@ -69,13 +118,33 @@ class DiceSet:
                     fix_index += 1
             self.dice_values.sort()  # results always sorted
             return self.dice_values
+        elif self.dice_type == DiceSet.DICE_TYPE_TAPE:
+            # a roll with nothing fixed starts a new turn
+            if fixed is None:
+                values = []
+                self.tape_turn += 1
+                self.tape_roll = 0
+            else:
+                values = list(fixed)
+            dice_to_roll = len(self.dice_values) - len(values)
+            faces = self.tape.roll_faces(self.tape_game, self.tape_turn, self.tape_roll)
+            values.extend(faces[len(faces) - dice_to_roll:])
+            self.tape_roll += 1
+            values.sort()  # results always sorted
+            self.dice_values[:] = values
+            return self.dice_values
         else:
             # automatically roll dice
-            fix_index = 0
-            for i in range(len(self.dice_values)):
-                if fixed is None or fix_index == len(fixed) or self.dice_values[i] != fixed[fix_index]:
-                    self.dice_values[i] = random.randint(1, 6)
-                else:
-                    fix_index += 1
-            self.dice_values.sort()  # results always sorted
+            if fixed is None:
+                values = []
+            else:
+                values = list(fixed)
+            dice_to_roll = len(self.dice_values) - len(values)
+            if self.random_block_index + dice_to_roll > len(self.random_block):
+                self.random_block = self.rng.integers(1, 7, DiceSet.RANDOM_BLOCK_SIZE, dtype=np.int8).tolist()
+                self.random_block_index = 0
+            values.extend(self.random_block[self.random_block_index:self.random_block_index + dice_to_roll])
+            self.random_block_index += dice_to_roll
+            values.sort()  # results always sorted
+            self.dice_values[:] = values
             return self.dice_values
@@ -0,0 +1,59 @@
+import numpy as np
+import os
+from YahtzeeTableCache import YahtzeeTableCache
+
+
+class DiceTape:
+    # dice rolled ahead of time and saved to a file, so games played with different position_costs
+    # can see the same dice. faces[game, turn, roll] are 5 dice for that roll of that turn.
+    # A roll that keeps some dice uses the last dice of its row for the others, so two strategies
+    # keep getting the same dice for as long as they make the same choices.
+    MAX_TURNS = 16  # turns after this (only possible after several bonus yahtzees) reuse rows from the start
+    ROLLS_PER_TURN = 3
+    NUM_DICE = 5
+    FILE_PREFIX = 'yahtzee_dice_tape'
+
+    @classmethod
+    def create(cls, path, num_games, seed=None):
+        rng = np.random.default_rng(seed)
+        shape = (num_games, cls.MAX_TURNS, cls.ROLLS_PER_TURN, cls.NUM_DICE)
+
+        def write(temp_path):
+            faces = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.int8, shape=shape)
+            # in blocks of games, so a long tape doesn't have to fit in memory
+            games_per_block = 10000
+            for start in range(0, num_games, games_per_block):
+                end = min(start + games_per_block, num_games)
+                faces[start:end] = rng.integers(1, 7, (end - start,) + shape[1:], dtype=np.int8)
+            faces.flush()
+            del faces
+        YahtzeeTableCache.write_path_atomically(path, write, prefix=cls.FILE_PREFIX)
+
+    @classmethod
+    def default_path(cls, num_games, seed):
+        return os.path.join(YahtzeeTableCache.cache_directory(), f'{cls.FILE_PREFIX}_{num_games}_{seed}.npy')
+
+    @classmethod
+    def load_or_create(cls, num_games, seed=0):
+        # the same num_games and seed always give the same tape
+        path = cls.default_path(num_games, seed)
+        if not os.path.exists(path):
+            cls.create(path, num_games, seed)
+        return DiceTape(path)
+
+    @classmethod
+    def in_memory(cls, num_games, rng):
+        # a tape that isn't saved, for dice that are only needed while a few strategies play them
+        shape = (num_games, cls.MAX_TURNS, cls.ROLLS_PER_TURN, cls.NUM_DICE)
+        return DiceTape(None, rng.integers(1, 7, shape, dtype=np.int8))
+
+    def __init__(self, path, faces=None):
+        self.path = path
+        if faces is None:
+            faces = np.load(path, mmap_mode='r')
+        self.faces = faces
+        self.num_games = len(self.faces)
+
+    def roll_faces(self, games, turns, rolls):
+        # works for one roll, or arrays of them
+        return self.faces[games % self.num_games, turns % self.MAX_TURNS, rolls]
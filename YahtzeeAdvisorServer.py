@@ -0,0 +1,302 @@
+import numpy as np
+import argparse
+import asyncio
+import json
+import sys
+import time
+from YahtzeeGame import YahtzeeGame
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeDefaults import POSITION_COSTS
+
+
+class YahtzeeAdvisorServer:
+    # gives advice to many players at once, with one copy of the tables. Each session's score sheet is a row
+    # of a YahtzeeBatchGame's state arrays, and recommendations asked for at the same time are worked out
+    # together. Requests and responses are JSON objects, one per line. A line can also be a list of requests,
+    # which gets a list of responses.
+    #   {"op": "new_session"} -> {"session": id}
+    #   {"op": "dice_rolled", "session": id} -> {"rolls_left": n}
+    #   {"op": "recommend", "session": id, "dice": [5 dice]} -> {"position": p, "position_name": name} or {"keep": [dice]}
+    #   {"op": "accept_score", "session": id, "position": p, "dice": [5 dice]} -> {"score": s, "rounds_remaining": n}
+    #   {"op": "end_session", "session": id} -> {}
+    # Any request can have an "id", which is copied to its response. Errors are returned as {"error": message}.
+    DEFAULT_HOST = '127.0.0.1'
+    DEFAULT_PORT = 8765
+    INITIAL_SESSIONS = 64
+
+    def __init__(self, position_costs=None):
+        self.batch_game = YahtzeeBatchGame(position_costs)
+        self.batch_game.reset_games(self.INITIAL_SESSIONS, position_costs)
+        self.free_rows = list(range(self.INITIAL_SESSIONS - 1, -1, -1))
+        self.sessions = {}  # session id -> row of the state arrays
+        self.next_session_id = 1
+        # (row, dice, future) for recommendations waiting to be worked out together
+        self.pending = []
+        self.requests = 0
+        self.recommend_batches = 0
+
+    def grow(self):
+        # doubles the number of rows, keeping the state of existing sessions
+        bg = self.batch_game
+        num_rows = bg.num_games
+        state = [bg.rolls_left, bg.dice, bg.scores, bg.position_available, bg.turns]
+        bg.reset_games(2 * num_rows)
+        for old, new in zip(state, [bg.rolls_left, bg.dice, bg.scores, bg.position_available, bg.turns]):
+            new[0:num_rows] = old
+        self.free_rows.extend(range(2 * num_rows - 1, num_rows - 1, -1))
+
+    def new_session(self):
+        if len(self.free_rows) == 0:
+            self.grow()
+        row = self.free_rows.pop()
+        bg = self.batch_game
+        bg.rolls_left[row] = 3
+        bg.scores[row] = 0
+        bg.turns[row] = 0
+        bg.position_available[row] = 1
+        bg.position_available[row, YahtzeeGame.BONUS_YAHTZEE] = 0  # not available until there's been a Yahtzee
+        session = self.next_session_id
+        self.next_session_id += 1
+        self.sessions[session] = row
+        return session
+
+    @staticmethod
+    def is_integer(value):
+        # bool is a kind of int, but true isn't a session, a die or a position
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def session_row(self, request):
+        session = request.get('session')
+        if not self.is_integer(session):
+            raise ValueError(f'session must be a number, not {json.dumps(session)}')
+        row = self.sessions.get(session)
+        if row is None:
+            raise ValueError(f'unknown session {session}')
+        return row
+
+    @classmethod
+    def request_dice(cls, request):
+        dice = request.get('dice')
+        if not isinstance(dice, list) or len(dice) != 5 or \
+                any(not cls.is_integer(value) or value not in range(1, 7) for value in dice):
+            raise ValueError(f'dice must be a list of 5 values from 1 to 6')
+        return sorted(dice)
+
+    def dice_rolled(self, row):
+        bg = self.batch_game
+        if bg.rolls_left[row] == 0:
+            raise ValueError(f'no rolls left this turn')
+        bg.rolls_left[row] -= 1
+        return {'rolls_left': int(bg.rolls_left[row])}
+
+    def accept_score(self, row, position, dice):
+        bg = self.batch_game
+        if not self.is_integer(position) or position not in range(YahtzeeGame.NUM_SLOTS):
+            raise ValueError(f'invalid position {json.dumps(position)}')
+        # the Bonus Yahtzee position can be used more than once
+        if position != YahtzeeGame.BONUS_YAHTZEE and bg.position_available[row, position] == 0:
+            raise ValueError(f'position {position} {YahtzeeGame.position_name(position)} was already taken.')
+        rows = np.array([row])
+        score = bg.accept_scores(rows, np.array([position]), bg.dice_values_to_ids(np.array([dice])))[0]
+        return {'score': int(score), 'rounds_remaining': int(bg.rounds_remaining()[row])}
+
+    def recommend_batch(self, rows, dice):
+        # same decisions as YahtzeeGame.recommended_next_step, for a roll of each session in rows
+        bg = self.batch_game
+        dice_value_ids = bg.dice_values_to_ids(dice)
+        positions, scores = bg.best_positions(rows, dice_value_ids)
+        can_roll = bg.rolls_left[rows] > 0
+        keep_ids = np.zeros(len(rows), dtype=np.int64)
+        expected_next_roll_scores = np.full(len(rows), -np.inf)
+        if np.any(can_roll):
+            keep_ids[can_roll], expected_next_roll_scores[can_roll] = bg.best_keeps(rows[can_roll],
+                                                                                      dice_value_ids[can_roll])
+        recommendations = []
+        for position, score, keep_id, expected_next_roll_score in \
+                zip(positions, scores, keep_ids, expected_next_roll_scores):
+            if expected_next_roll_score > score:
+                num_fixed = bg.rules.keep_sizes[keep_id]
+                recommendations.append({'keep': bg.rules.keep_dice_values[keep_id, 0:num_fixed].tolist()})
+            else:
+                recommendations.append({'position': int(position), 'position_name': YahtzeeGame.position_name(position)})
+        return recommendations
+
+    def run_pending(self):
+        pending = self.pending
+        self.pending = []
+        rows = np.array([row for row, dice, future in pending])
+        dice = np.array([dice for row, dice, future in pending], dtype=np.int8)
+        self.recommend_batches += 1
+        for (row, dice, future), recommendation in zip(pending, self.recommend_batch(rows, dice)):
+            if not future.cancelled():
+                future.set_result(recommendation)
+
+    async def recommend(self, row, dice):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((row, dice, future))
+        if len(self.pending) == 1:
+            # other sessions whose requests have already arrived get to add theirs before this runs
+            loop.call_soon(self.run_pending)
+        return await future
+
+    async def handle_request(self, request):
+        self.requests += 1
+        try:
+            if not isinstance(request, dict):
+                raise ValueError(f'a request must be a JSON object')
+            op = request.get('op')
+            if op == 'new_session':
+                response = {'session': self.new_session()}
+            elif op == 'dice_rolled':
+                response = self.dice_rolled(self.session_row(request))
+            elif op == 'recommend':
+                response = await self.recommend(self.session_row(request), self.request_dice(request))
+            elif op == 'accept_score':
+                response = self.accept_score(self.session_row(request), request.get('position'),
+                                             self.request_dice(request))
+            elif op == 'end_session':
+                self.free_rows.append(self.session_row(request))
+                del self.sessions[request['session']]
+                response = {}
+            else:
+                raise ValueError(f'unknown op {op}')
+        except (ValueError, TypeError, KeyError) as e:
+            # a bad request only gets an error response, and the connection carries on
+            response = {'error': str(e)}
+        if isinstance(request, dict) and 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    response = {'error': 'not JSON'}
+                else:
+                    if isinstance(message, list):
+                        # in order, since later requests can depend on earlier ones for the same session
+                        response = [await self.handle_request(request) for request in message]
+                    else:
+                        response = await self.handle_request(message)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f'advisor listening on {host}:{port}')
+        async with server:
+            await server.serve_forever()
+
+
+class YahtzeeAdvisorLoadTest:
+    # plays games through a YahtzeeAdvisorServer from many sessions at once, following its advice
+    # with random dice, and reports requests per second and latency
+
+    def __init__(self, host, port, num_sessions, duration, batch_requests=False, seed=None):
+        self.host = host
+        self.port = port
+        self.num_sessions = num_sessions
+        self.duration = duration
+        # send dice_rolled and recommend together, as one line
+        self.batch_requests = batch_requests
+        self.rng = np.random.default_rng(seed)
+        self.latencies = []
+        self.requests = 0
+        self.games = 0
+
+    async def send(self, reader, writer, message):
+        start = time.perf_counter()
+        writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        self.latencies.append(time.perf_counter() - start)
+        self.requests += len(message) if isinstance(message, list) else 1
+        responses = response if isinstance(response, list) else [response]
+        for r in responses:
+            if 'error' in r:
+                raise RuntimeError(f'advisor error: {r["error"]}')
+        return response
+
+    def roll(self, kept):
+        dice = list(kept) + self.rng.integers(1, 7, 5 - len(kept)).tolist()
+        return sorted(dice)
+
+    async def play_turn(self, reader, writer, session):
+        kept = []
+        while True:
+            dice = self.roll(kept)
+            rolled = {'op': 'dice_rolled', 'session': session}
+            recommend = {'op': 'recommend', 'session': session, 'dice': dice}
+            if self.batch_requests:
+                advice = (await self.send(reader, writer, [rolled, recommend]))[1]
+            else:
+                await self.send(reader, writer, rolled)
+                advice = await self.send(reader, writer, recommend)
+            if 'keep' in advice:
+                kept = advice['keep']
+            else:
+                accept = {'op': 'accept_score', 'session': session, 'position': advice['position'], 'dice': dice}
+                return (await self.send(reader, writer, accept))['rounds_remaining']
+
+    async def run_session(self, end_time):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while time.perf_counter() < end_time:
+                session = (await self.send(reader, writer, {'op': 'new_session'}))['session']
+                while await self.play_turn(reader, writer, session) > 0 and time.perf_counter() < end_time:
+                    pass
+                await self.send(reader, writer, {'op': 'end_session', 'session': session})
+                self.games += 1
+        finally:
+            writer.close()
+
+    async def run(self):
+        start = time.perf_counter()
+        await asyncio.gather(*[self.run_session(start + self.duration) for i in range(self.num_sessions)])
+        elapsed = time.perf_counter() - start
+        latencies = 1000 * np.array(self.latencies)
+        print(f'{self.num_sessions} sessions, {self.requests} requests in {np.around(elapsed, 1)} s: '
+              f'{np.around(self.requests / elapsed, 1)} requests/sec, {self.games} games')
+        print(f'latency per message: p50 {np.around(np.percentile(latencies, 50), 2)} ms, '
+              f'p99 {np.around(np.percentile(latencies, 99), 2)} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Yahtzee advisor server, and a load test for it.')
+    parser.add_argument('--host', default=YahtzeeAdvisorServer.DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=YahtzeeAdvisorServer.DEFAULT_PORT)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve')
+    serve_parser.add_argument('--position-costs', type=int, nargs=YahtzeeGame.NUM_SLOTS,
+                              default=POSITION_COSTS)
+    load_test_parser = subparsers.add_parser('load-test')
+    load_test_parser.add_argument('--sessions', type=int, default=50)
+    load_test_parser.add_argument('--duration', type=float, default=10, help='seconds')
+    load_test_parser.add_argument('--batch', action='store_true', help='send dice_rolled and recommend together')
+    load_test_parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server = YahtzeeAdvisorServer(args.position_costs)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            print(f'{server.requests} requests, {server.recommend_batches} recommendation batches')
+    else:
+        load_test = YahtzeeAdvisorLoadTest(args.host, args.port, args.sessions, args.duration, args.batch, args.seed)
+        asyncio.run(load_test.run())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
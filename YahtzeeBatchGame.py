@@ -0,0 +1,191 @@
+import numpy as np
+from DiceSet import DiceSet
+from YahtzeeGame import YahtzeeGame, YahtzeeRules, YahtzeeGameState, GameLog
+from YahtzeeProfiler import YahtzeeProfiler
+
+
+class YahtzeeBatchGame:
+    # plays many games at once. Each row of the state arrays is one game, and all games move through
+    # each turn in lockstep, making the same decisions as YahtzeeGame.recommended_next_step would.
+    NUM_DICE = 5
+
+    def __init__(self, position_costs=None, rng=None, rules=None, dice_tape=None, game_log=None, decision_table=None):
+        if rules is None:
+            rules = YahtzeeRules.shared()
+        # the precomputed score tables are shared with the scalar game
+        self.rules = rules
+        if rng is None:
+            rng = np.random.default_rng()
+        self.rng = rng
+        # if set, a DiceTape the dice are read from instead of rng
+        self.dice_tape = dice_tape
+        # if set, a GameLog that every step of every game is added to
+        self.game_log = game_log
+        # if set, a YahtzeeDecisionTable the decisions are looked up in, instead of being worked out
+        self.decision_table = decision_table
+        self.position_costs = np.zeros_like(YahtzeeGame.UPPER_SECTION_MASK)
+        self.calculate_keep_tables()
+        self.reset_games(0, position_costs)
+
+    def calculate_keep_tables(self):
+        rules = self.rules
+        self.roll_keep_matrix = rules.keep_roll_matrix().T
+        self.bonus_yahtzee_rolls = rules.dice_scores[:, YahtzeeGame.BONUS_YAHTZEE] > 0
+        # which dice positions of keep_dice_values are kept, for each keep
+        self.keep_masks = np.arange(self.NUM_DICE) < rules.keep_sizes[:, np.newaxis]
+
+    def reset_games(self, num_games, position_costs=None, first_tape_game=0):
+        self.num_games = num_games
+        self.rolls_left = np.full(num_games, 3, dtype=np.int8)
+        # the turn each game is on, and which game of the dice tape it plays
+        self.turns = np.zeros(num_games, dtype=np.int16)
+        self.tape_games = np.arange(first_tape_game, first_tape_game + num_games)
+        self.dice = np.zeros((num_games, self.NUM_DICE), dtype=np.int8)
+        self.scores = np.zeros((num_games, YahtzeeGame.NUM_SLOTS), dtype=np.int16)
+        self.position_available = np.ones((num_games, YahtzeeGame.NUM_SLOTS), dtype=np.int8)
+        self.position_available[:, YahtzeeGame.BONUS_YAHTZEE] = 0  # not available until there's been a Yahtzee
+        if position_costs is not None:
+            self.position_costs = np.array(position_costs, dtype=np.int8)
+        if self.decision_table is not None and not np.array_equal(self.decision_table.position_costs,
+                                                                  self.position_costs):
+            raise ValueError(f'the decision table is for position costs {self.decision_table.position_costs.tolist()}, '
+                             f'not {self.position_costs.tolist()}')
+
+    def dice_values_to_ids(self, dice):
+        return self.rules.combination_ids[DiceSet.dice_keys(dice)]
+
+    def rounds_remaining(self):
+        return np.dot(self.position_available, YahtzeeGame.BONUS_YAHTZEE_MASK)
+
+    def total_scores(self):
+        upper_section = np.dot(self.scores, YahtzeeGame.UPPER_SECTION_MASK)
+        bonus = np.where(upper_section >= YahtzeeGameState.UPPER_BONUS_THRESHOLD, YahtzeeGameState.UPPER_BONUS, 0)
+        lower_section = np.dot(self.scores, YahtzeeGame.LOWER_SECTION_MASK)
+        return upper_section + bonus + lower_section
+
+    def roll_dice(self, games, keep_ids=None):
+        fixed_dice = None
+        fixed_mask = None
+        if keep_ids is not None:
+            fixed_dice = self.rules.keep_dice_values[keep_ids]
+            fixed_mask = self.keep_masks[keep_ids]
+        if self.dice_tape is None:
+            dice = DiceSet.roll_many(self.rng, len(games), fixed_dice, fixed_mask)
+        else:
+            # kept dice are first in keep_dice_values, so rerolled dice come from the end of the tape's row,
+            # as in DiceSet.roll
+            faces = self.dice_tape.roll_faces(self.tape_games[games], self.turns[games], 3 - self.rolls_left[games])
+            dice = DiceSet.fix_dice(faces, fixed_dice, fixed_mask)
+        self.dice[games] = dice
+        if self.game_log is not None:
+            self.log_steps(games, dice, keep_ids)
+        self.rolls_left[games] -= 1
+        return dice
+
+    def log_steps(self, games, dice, keep_ids=None, positions=None, scores=None):
+        steps = np.zeros(len(games), dtype=GameLog.STEP_DTYPE)
+        steps['game'] = self.game_log.game + games
+        steps['turn'] = self.turns[games]
+        steps['dice'] = dice
+        steps['position'] = GameLog.NO_POSITION
+        if positions is not None:
+            steps['kind'] = GameLog.STEP_SCORE
+            steps['position'] = positions
+            steps['score'] = scores
+        elif keep_ids is None:
+            steps['kind'] = GameLog.STEP_FIRST_ROLL
+        else:
+            steps['kind'] = GameLog.STEP_REROLL
+            steps['kept'] = np.where(self.keep_masks[keep_ids], self.rules.keep_dice_values[keep_ids], 0)
+            steps['num_kept'] = self.rules.keep_sizes[keep_ids]
+        self.game_log.add_steps(steps)
+
+    def best_positions(self, games, dice_value_ids):
+        # same rules as YahtzeeGame.best_position, for one roll per game
+        dice_scores = self.rules.dice_scores[dice_value_ids].astype(np.int16)
+        position_available = self.position_available[games]
+        feasible_values = dice_scores * position_available - self.position_costs
+        min_value = np.min(feasible_values, axis=1, keepdims=True)
+        # make sure that infeasible numbers are not the max
+        feasible_values = np.where(position_available == 0, min_value - 1, feasible_values)
+        no_bonus_yahtzee = dice_scores[:, YahtzeeGame.BONUS_YAHTZEE] == 0
+        feasible_values[no_bonus_yahtzee, YahtzeeGame.BONUS_YAHTZEE] = min_value[no_bonus_yahtzee, 0] - 1
+        positions = np.argmax(feasible_values, axis=1)
+        scores = feasible_values[np.arange(len(games)), positions]
+        return positions, scores
+
+    def roll_values(self, games):
+        # same rules as YahtzeeGame.roll_values, with a row for each game
+        position_values = self.rules.dice_scores - self.position_costs.astype(float)
+        # can only use the Bonus Yahtzee slot if we actually have a bonus yahtzee
+        position_values[~self.bonus_yahtzee_rolls, YahtzeeGame.BONUS_YAHTZEE] = -np.inf
+        # -inf for positions that aren't available
+        penalties = np.where(self.position_available[games] == 1, 0, -np.inf)
+        roll_values = np.full((len(games), len(position_values)), -np.inf)
+        for pos in range(YahtzeeGame.NUM_SLOTS):
+            np.maximum(roll_values, position_values[:, pos] + penalties[:, pos, np.newaxis], out=roll_values)
+        return roll_values
+
+    def best_keeps(self, games, dice_value_ids):
+        # same rules as YahtzeeGame.best_dice_to_fix, for every game.
+        # Weights and roll values are whole numbers, so these sums are exact and match the scalar game.
+        keep_values = np.dot(self.roll_values(games), self.roll_keep_matrix) / YahtzeeGame.ROLL_OUTCOMES
+        roll_keep_ids = self.rules.roll_keep_ids[dice_value_ids]
+        expected_values = np.take_along_axis(keep_values, roll_keep_ids, axis=1)
+        best = np.argmax(expected_values, axis=1)
+        rows = np.arange(len(games))
+        return roll_keep_ids[rows, best], expected_values[rows, best]
+
+    def accept_scores(self, games, positions, dice_value_ids):
+        scores = self.rules.dice_scores[dice_value_ids, positions]
+        # bonus yahtzees are cumulative
+        self.scores[games, positions] += scores
+        # bonus yahtzee slot can be used multiple times
+        taken = positions != YahtzeeGame.BONUS_YAHTZEE
+        self.position_available[games[taken], positions[taken]] = 0
+        # bonus yahtzee not available if we put a zero in yahtzee
+        yahtzee = (positions == YahtzeeGame.YAHTZEE) & (scores > 0)
+        self.position_available[games[yahtzee], YahtzeeGame.BONUS_YAHTZEE] = 1
+        if self.game_log is not None:
+            self.log_steps(games, self.dice[games], positions=positions, scores=scores)
+        self.rolls_left[games] = 3
+        self.turns[games] += 1
+        return scores
+
+    def play_turn(self, games):
+        dice = self.roll_dice(games)
+        while len(games) > 0:
+            dice_value_ids = self.dice_values_to_ids(dice)
+            if self.decision_table is not None:
+                position_masks = np.dot(self.position_available[games], YahtzeeGame.POSITION_BITS)
+                positions, roll_again, keep_ids = self.decision_table.batch_decisions(
+                    position_masks, self.rolls_left[games], dice_value_ids)
+                keep_ids = keep_ids[roll_again]
+            else:
+                positions, scores = self.best_positions(games, dice_value_ids)
+                can_roll = self.rolls_left[games] > 0
+                roll_again = np.zeros(len(games), dtype=bool)
+                if np.any(can_roll):
+                    keep_ids, expected_next_roll_scores = self.best_keeps(games[can_roll], dice_value_ids[can_roll])
+                    keep = expected_next_roll_scores > scores[can_roll]
+                    roll_again[can_roll] = keep
+                    keep_ids = keep_ids[keep]
+            take = ~roll_again
+            self.accept_scores(games[take], positions[take], dice_value_ids[take])
+            games = games[roll_again]
+            if len(games) > 0:
+                dice = self.roll_dice(games, keep_ids)
+
+    def play_games(self, num_games, position_costs=None, first_tape_game=0):
+        self.reset_games(num_games, position_costs, first_tape_game)
+        games = np.arange(num_games)
+        while len(games) > 0:
+            self.play_turn(games)
+            # a bonus yahtzee doesn't use up a round, so some games take more turns than others
+            games = np.flatnonzero(self.rounds_remaining() > 0)
+        if self.game_log is not None:
+            self.game_log.end_games(num_games)
+        return self.total_scores()
+
+
+YahtzeeProfiler.register(YahtzeeBatchGame, ['roll_dice', 'best_keeps', 'best_positions', 'accept_scores', 'play_turn'])
@@ -0,0 +1,149 @@
+import numpy as np
+import argparse
+import json
+import os
+import sys
+import time
+from DiceSet import DiceSet
+from YahtzeeGame import YahtzeeGame, YahtzeeRules
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeePositionCostOptimizer import YahtzeePositionCostOptimizer
+from YahtzeeDefaults import POSITION_COSTS
+
+
+class YahtzeeBenchmark:
+    # times the engine's hot paths, and compares the results with a saved baseline. The baseline is only
+    # meaningful on the machine it was recorded on, and for the code it was recorded with, so after changing
+    # the hot paths, record it again with --update-baseline and commit benchmark_baseline.json with the change.
+    BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+    DEFAULT_TOLERANCE = 0.25  # fraction a result can be worse than the baseline before it's a regression
+    SEED = 12345
+
+    def __init__(self, quick=False):
+        # quick runs fewer repeats, for checking that the harness works
+        self.scale = 0.1 if quick else 1
+        self.results = {}
+
+    def repeats(self, count):
+        return max(1, int(count * self.scale))
+
+    def add_result(self, name, value, unit, higher_is_better):
+        self.results[name] = {'value': float(value), 'unit': unit, 'higher_is_better': higher_is_better}
+
+    def time_table_builds(self):
+        # a separate copy of the rules, so rebuilding its tables doesn't touch the shared ones
+        rules = YahtzeeRules()
+        for method in [rules.calculate_dice_combination_scores, rules.calculate_next_roll_possibilities]:
+            times = []
+            for i in range(self.repeats(20)):
+                start = time.perf_counter()
+                method()
+                times.append(time.perf_counter() - start)
+            self.add_result(f'{method.__name__} ms', 1000 * np.min(times), 'ms', False)
+
+    def decision_corpus(self, num_decisions):
+        # a fixed set of score sheets and rolls, the same for every run
+        rng = np.random.default_rng(self.SEED)
+        position_available = rng.integers(0, 2, (num_decisions, YahtzeeGame.NUM_SLOTS), dtype=np.int8)
+        position_available[:, YahtzeeGame.CHANCE] = 1  # at least one position is open
+        rolls_left = rng.integers(0, 3, num_decisions)
+        dice = DiceSet.roll_many(rng, num_decisions)
+        return position_available, rolls_left, dice
+
+    def time_recommended_next_step(self):
+        yg = YahtzeeGame(DiceSet.DICE_TYPE_AUTO, POSITION_COSTS)
+        position_available, rolls_left, dice = self.decision_corpus(self.repeats(5000))
+        times = np.zeros(len(dice))
+        for i in range(len(dice)):
+            yg.position_available = position_available[i]
+            yg.rolls_left = rolls_left[i]
+            start = time.perf_counter()
+            yg.recommended_next_step(dice[i])
+            times[i] = time.perf_counter() - start
+        for percentile in [50, 90, 99]:
+            self.add_result(f'recommended_next_step p{percentile} us', 1e6 * np.percentile(times, percentile), 'us', False)
+
+    def time_play_game(self):
+        yg = YahtzeeGame(DiceSet.DICE_TYPE_AUTO, POSITION_COSTS, rng=np.random.default_rng(self.SEED))
+        num_games = self.repeats(200)
+        start = time.perf_counter()
+        for i in range(num_games):
+            yg.play_game()
+        self.add_result('play_game games/sec', num_games / (time.perf_counter() - start), 'games/sec', True)
+        batch_game = YahtzeeBatchGame(POSITION_COSTS, np.random.default_rng(self.SEED))
+        num_games = self.repeats(3000)
+        start = time.perf_counter()
+        batch_game.play_games(num_games)
+        self.add_result('batch play_games games/sec', num_games / (time.perf_counter() - start), 'games/sec', True)
+
+    def time_optimizer(self):
+        optimizer = YahtzeePositionCostOptimizer(seed=self.SEED)
+        optimizer.init_worker()
+        num_candidates = self.repeats(10)
+        start = time.perf_counter()
+        for i in range(num_candidates):
+            optimizer.play_games(POSITION_COSTS, 300)
+        self.add_result('optimizer ms per candidate', 1000 * (time.perf_counter() - start) / num_candidates, 'ms', False)
+
+    def run(self):
+        self.time_table_builds()
+        self.time_recommended_next_step()
+        self.time_play_game()
+        self.time_optimizer()
+        return self.results
+
+    @staticmethod
+    def compare(results, baseline, tolerance):
+        # returns the names of results that are worse than the baseline by more than tolerance
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            baseline_value = baseline[name]['value']
+            if result['higher_is_better']:
+                change = baseline_value / result['value'] - 1
+            else:
+                change = result['value'] / baseline_value - 1
+            flag = ''
+            if change > tolerance:
+                regressions.append(name)
+                flag = '  <-- REGRESSION'
+            direction = 'slower' if change > 0 else 'faster'
+            print(f'{name}: {np.around(result["value"], 2)} {result["unit"]} '
+                  f'(baseline {np.around(baseline_value, 2)}, {np.around(100 * abs(change), 1)}% {direction}){flag}')
+        return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Yahtzee engine against a saved baseline.')
+    parser.add_argument('--output', help='file to write the results to, as JSON')
+    parser.add_argument('--baseline', default=YahtzeeBenchmark.BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=YahtzeeBenchmark.DEFAULT_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true', help='save these results as the new baseline')
+    parser.add_argument('--quick', action='store_true')
+    args = parser.parse_args(argv)
+
+    results = YahtzeeBenchmark(args.quick).run()
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'saved baseline to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print(json.dumps(results, indent=2))
+        print(f'no baseline at {args.baseline}')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = YahtzeeBenchmark.compare(results, baseline, args.tolerance)
+    if len(regressions) > 0:
+        print(f'{len(regressions)} regression(s) beyond {np.around(100 * args.tolerance)}%: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
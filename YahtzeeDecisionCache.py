@@ -0,0 +1,62 @@
+import numpy as np
+from collections import OrderedDict
+
+
+class YahtzeeDecisionCache:
+    # remembers recent results of YahtzeeGame.recommended_next_step, keyed by the open positions,
+    # the number of rolls left and the roll. Decisions also depend on position_costs, so the cache
+    # is cleared when they change.
+    EVICT_LEAST_RECENTLY_USED = 1
+    EVICT_OLDEST = 2
+    MAX_ROLLS_LEFT = 3
+
+    @classmethod
+    def key(cls, position_mask, rolls_left, dice_value_id, num_combinations=252):
+        return (position_mask * (cls.MAX_ROLLS_LEFT + 1) + rolls_left) * num_combinations + dice_value_id
+
+    def __init__(self, capacity=100000, eviction=EVICT_LEAST_RECENTLY_USED):
+        if capacity < 1:
+            raise ValueError(f'a decision cache needs room for at least 1 decision, not {capacity}')
+        self.capacity = capacity
+        self.eviction = eviction
+        self.decisions = OrderedDict()
+        self.position_costs = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        decision = self.decisions.get(key)
+        if decision is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            if self.eviction == YahtzeeDecisionCache.EVICT_LEAST_RECENTLY_USED:
+                self.decisions.move_to_end(key)
+        return decision
+
+    def put(self, key, decision):
+        if len(self.decisions) >= self.capacity:
+            # least recently used, or oldest, is first
+            self.decisions.popitem(last=False)
+            self.evictions += 1
+        self.decisions[key] = decision
+
+    def set_position_costs(self, position_costs):
+        if self.position_costs is None or not np.array_equal(self.position_costs, position_costs):
+            if len(self.decisions) > 0:
+                self.invalidations += 1
+            self.decisions.clear()
+            self.position_costs = np.copy(position_costs)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0
+        return self.hits / lookups
+
+    def summary(self):
+        return (f'decision cache: {len(self.decisions)}/{self.capacity} entries, '
+                f'hit rate {np.around(100 * self.hit_rate(), 1)}% ({self.hits} hits, {self.misses} misses), '
+                f'{self.evictions} evictions, {self.invalidations} invalidations')
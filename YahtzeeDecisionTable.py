@@ -0,0 +1,124 @@
+import numpy as np
+import argparse
+import os
+import sys
+from DiceSet import DiceSet
+from YahtzeeGame import YahtzeeGame, YahtzeeRules
+from YahtzeeTableCache import YahtzeeTableCache
+from YahtzeePolicyEvaluator import YahtzeePolicyEvaluator
+from YahtzeeDefaults import POSITION_COSTS
+
+
+class YahtzeeDecisionTable:
+    # every decision YahtzeeGame.recommended_next_step would make with a position_costs, worked out ahead of
+    # time and saved to a file, which is memory-mapped so looking up a decision is a single array read.
+    # Decisions are indexed by the open positions, as in YahtzeeGameState.position_mask (which includes
+    # whether Bonus Yahtzee is available), then 0 for no rolls left or 1 for some, then the roll. With
+    # position costs, one or two rolls left give the same decisions. A decision less than KEEP_OFFSET is
+    # the position to use the roll for, otherwise it's KEEP_OFFSET plus the keep id of the dice to keep.
+    FILE_PREFIX = 'yahtzee_decisions'
+    FORMAT_VERSION = 1  # increase if the layout of the saved file changes
+    KEEP_OFFSET = YahtzeeGame.NUM_SLOTS
+    NUM_MASKS = 2 ** YahtzeeGame.NUM_SLOTS
+    MASKS_PER_CHUNK = 1024
+
+    @classmethod
+    def default_path(cls, position_costs):
+        costs = '_'.join(str(int(cost)) for cost in position_costs)
+        rules_version = YahtzeeTableCache.rules_version(YahtzeeRules)
+        file_name = f'{cls.FILE_PREFIX}_v{cls.FORMAT_VERSION}_{rules_version}_{costs}.npy'
+        return os.path.join(YahtzeeTableCache.cache_directory(), file_name)
+
+    @classmethod
+    def compile(cls, position_costs, path=None):
+        # works out the decisions for position_costs, and saves them to path. Returns the path.
+        if path is None:
+            path = cls.default_path(position_costs)
+        rules = YahtzeeRules.shared()
+        policy_evaluator = YahtzeePolicyEvaluator(rules)
+        position_costs = np.array(position_costs, dtype=np.int16)
+        record = np.zeros(1, dtype=[('position_costs', np.int8, YahtzeeGame.NUM_SLOTS),
+                                    ('decisions', np.int16, (cls.NUM_MASKS, 2, len(rules.dice_scores)))])
+        record['position_costs'][0] = position_costs
+        decisions = record['decisions'][0]
+        for start in range(0, cls.NUM_MASKS, cls.MASKS_PER_CHUNK):
+            masks = np.arange(start, min(start + cls.MASKS_PER_CHUNK, cls.NUM_MASKS))
+            # masks without any regular positions open are for finished games, which don't need decisions
+            positions, roll_again, best_keeps = policy_evaluator.turn_policy(masks, position_costs)
+            decisions[masks, 0] = positions
+            decisions[masks, 1] = np.where(roll_again, best_keeps + cls.KEEP_OFFSET, positions)
+        YahtzeeTableCache.save(record, path)
+        return path
+
+    @classmethod
+    def load_or_compile(cls, position_costs):
+        path = cls.default_path(position_costs)
+        if not os.path.exists(path):
+            cls.compile(position_costs, path)
+        return cls(path)
+
+    def __init__(self, path):
+        self.path = path
+        self.rules = YahtzeeRules.shared()
+        record = np.load(path, mmap_mode='r')
+        self.position_costs = np.array(record['position_costs'][0])
+        self.decisions = record['decisions'][0]
+
+    def recommended_next_step(self, game, dice_values):
+        # same return values as YahtzeeGame.recommended_next_step
+        dice_value_id = self.rules.dice_values_to_id(dice_values)
+        state = game.state
+        decision = int(self.decisions[state.position_mask, min(state.rolls_left, 1), dice_value_id])
+        if decision < self.KEEP_OFFSET:
+            return decision, None
+        keep_id = decision - self.KEEP_OFFSET
+        return None, list(self.rules.keep_dice_values[keep_id, 0:self.rules.keep_sizes[keep_id]])
+
+    def batch_decisions(self, position_masks, rolls_left, dice_value_ids):
+        # for many games at once: the position each game uses its roll for, whether it rolls again instead,
+        # and the keep id of the dice it keeps if it does
+        decisions = self.decisions[position_masks, np.minimum(rolls_left, 1), dice_value_ids]
+        roll_again = decisions >= self.KEEP_OFFSET
+        return np.where(roll_again, 0, decisions), roll_again, np.where(roll_again, decisions - self.KEEP_OFFSET, 0)
+
+    def check(self, num_games=100, seed=None):
+        # plays num_games games with the live computation, comparing every decision with the table's.
+        # Returns the number of decisions and the number that were different.
+        yg = YahtzeeGame(DiceSet.DICE_TYPE_AUTO, self.position_costs, rng=np.random.default_rng(seed))
+        num_decisions = 0
+        num_different = 0
+        for i in range(num_games):
+            yg.reset_game(self.position_costs)
+            dice_to_fix = None
+            while not yg.game_complete():
+                dice_values = yg.roll_dice(dice_to_fix)
+                position_to_take, dice_to_fix = yg.recommended_next_step(dice_values)
+                table_position, table_dice_to_fix = self.recommended_next_step(yg, dice_values)
+                num_decisions += 1
+                if dice_to_fix is None:
+                    num_different += table_dice_to_fix is not None or table_position != position_to_take
+                    yg.accept_score(position_to_take, dice_values)
+                else:
+                    num_different += table_dice_to_fix is None or list(table_dice_to_fix) != list(dice_to_fix)
+        return num_decisions, num_different
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile and check the decision table for a position_costs.')
+    parser.add_argument('--position-costs', type=int, nargs=YahtzeeGame.NUM_SLOTS,
+                        default=POSITION_COSTS)
+    parser.add_argument('--path', help='where to save the table, instead of the cache directory')
+    parser.add_argument('--check-games', type=int, default=100,
+                        help='games to play comparing the table with the live computation')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    path = YahtzeeDecisionTable.compile(args.position_costs, args.path)
+    print(f'saved decisions to {path}')
+    num_decisions, num_different = YahtzeeDecisionTable(path).check(args.check_games, args.seed)
+    print(f'{num_decisions} decisions checked in {args.check_games} games, {num_different} different')
+    return 1 if num_different > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
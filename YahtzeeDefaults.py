@@ -0,0 +1,4 @@
+# defaults shared by the command-line tools. This has no imports, so main.py can use it just to parse arguments.
+
+# the best position costs found so far, which the tools play with or start searching from
+POSITION_COSTS = [1, 1, 2, 6, 6, 7, 11, 6, 2, 4, 0, -3, 1, 9]  # best average score = 231.6 +/- 3.2
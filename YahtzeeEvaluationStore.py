@@ -0,0 +1,115 @@
+import numpy as np
+import hashlib
+import inspect
+import json
+import os
+from DiceSet import DiceSet
+from DiceTape import DiceTape
+from YahtzeeGame import YahtzeeGame, YahtzeeRules
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeDecisionCache import YahtzeeDecisionCache
+from YahtzeeDecisionTable import YahtzeeDecisionTable
+from YahtzeePolicyEvaluator import YahtzeePolicyEvaluator
+from YahtzeeTableCache import YahtzeeTableCache
+
+
+class YahtzeeEvaluationStore:
+    # saves the results of playing games with each position_costs, so the optimizer doesn't play them
+    # again, and can carry on where it left off. Each entry keeps the number of games, the mean score
+    # and the sum of squared differences from the mean, so more games can be added to it later.
+    # Entries are kept separately for each source of dice, and the file name includes a hash of the
+    # code that plays the games, so changes to the strategy start a new file.
+    VERSION = 1  # increase if the layout of the file changes
+    FILE_PREFIX = 'yahtzee_evaluations'
+    # the modules of these classes are hashed whole, since almost anything in them can change the scores:
+    # the dice, the decisions, the decision tables and cache, and how positions are scored and totalled
+    ENGINE_CLASSES = [YahtzeeGame, YahtzeeBatchGame, DiceSet, DiceTape, YahtzeeDecisionTable, YahtzeeDecisionCache,
+                      YahtzeePolicyEvaluator]
+
+    @classmethod
+    def engine_version(cls):
+        engine_hash = hashlib.sha1(f'{cls.VERSION} {YahtzeeTableCache.rules_version(YahtzeeRules)}'.encode())
+        for owner in cls.ENGINE_CLASSES:
+            engine_hash.update(inspect.getsource(inspect.getmodule(owner)).encode())
+        return engine_hash.hexdigest()[0:12]
+
+    @classmethod
+    def default_path(cls):
+        return os.path.join(YahtzeeTableCache.cache_directory(), f'{cls.FILE_PREFIX}_{cls.engine_version()}.json')
+
+    @staticmethod
+    def key(position_costs):
+        return ','.join(str(int(cost)) for cost in position_costs)
+
+    @staticmethod
+    def mean_and_sem(entry):
+        if entry['games'] <= 1:
+            return entry['mean'], 0
+        # standard error of the mean, using unbiased variance
+        return entry['mean'], (entry['sum_squares'] / (entry['games'] - 1) / entry['games'])**0.5
+
+    def __init__(self, path=None):
+        if path is None:
+            path = self.default_path()
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, dice_source, position_costs):
+        return self.entries.get(dice_source, {}).get(self.key(position_costs))
+
+    @staticmethod
+    def games_entry(game_scores):
+        # an entry for just game_scores
+        game_scores = np.asarray(game_scores, dtype=np.float64)
+        mean = np.mean(game_scores)
+        return {'games': len(game_scores), 'mean': float(mean), 'sum_squares': float(np.sum((game_scores - mean) ** 2))}
+
+    def add(self, dice_source, position_costs, game_scores):
+        # combines game_scores with what's already stored, and saves the file
+        if len(game_scores) == 0:
+            return self.get(dice_source, position_costs)
+        return self.add_entry(dice_source, position_costs, self.games_entry(game_scores))
+
+    def add_entry(self, dice_source, position_costs, new_entry):
+        # combines an entry for more games, such as one made by games_entry in another process,
+        # with what's already stored, and saves the file
+        if new_entry['games'] == 0:
+            return self.get(dice_source, position_costs)
+        entry = self.combine_entries(self.get(dice_source, position_costs), new_entry)
+        self.entries.setdefault(dice_source, {})[self.key(position_costs)] = entry
+        self.save()
+        return entry
+
+    @staticmethod
+    def combine_entries(entry, new_entry):
+        # an entry for the games of both, where entry can be None
+        games = new_entry['games']
+        mean = new_entry['mean']
+        sum_squares = new_entry['sum_squares']
+        if entry is not None:
+            total_games = entry['games'] + games
+            delta = mean - entry['mean']
+            sum_squares += entry['sum_squares'] + delta ** 2 * entry['games'] * games / total_games
+            mean = entry['mean'] + delta * games / total_games
+            games = total_games
+        return {'games': int(games), 'mean': float(mean), 'sum_squares': float(sum_squares)}
+
+    def best(self, dice_source, min_games):
+        # the position costs with the highest mean score from at least min_games games, and its entry
+        best_key = None
+        best_entry = None
+        for key, entry in self.entries.get(dice_source, {}).items():
+            if entry['games'] >= min_games and (best_entry is None or entry['mean'] > best_entry['mean']):
+                best_key = key
+                best_entry = entry
+        if best_key is None:
+            return None, None
+        return np.array([int(cost) for cost in best_key.split(',')]), best_entry
+
+    def save(self):
+        YahtzeeTableCache.write_atomically(self.path, lambda f: json.dump(self.entries, f), binary=False,
+                                           prefix=self.FILE_PREFIX)
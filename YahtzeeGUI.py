@@ -3,18 +3,26 @@ from tkinter import ttk
 from tkinter import font
 from YahtzeeGame import YahtzeeGame
 from DiceSet import DiceSet
+from YahtzeeRecommendationWorker import YahtzeeRecommendationWorker
 
 class YahtzeeGUI:
+    POLL_MILLISECONDS = 20  # how often to check for results from the worker
+
     def __init__(self, position_costs=None, debug=False):
-        self.yahtzee_game = YahtzeeGame(DiceSet.DICE_TYPE_MANUAL, position_costs, debug, None)
+        # the game is kept on the worker's thread, and the tables are loaded there once the window is up
+        self.worker = YahtzeeRecommendationWorker(position_costs, debug)
+        self.root = None
         self.dice_values_text = None
         self.rounds_remaining = None
         self.instructions = None
         self.fixed_dice = None
+        self.dice_values = None  # the last roll entered
         self.position_scores = []
         self.position_labels = []
 
     def ok_click(self, *args):
+        if self.ok_button.instate(['disabled']):
+            return  # still loading, or waiting for the last roll's recommendation
         dice_value_string = self.dice_values_text.get()
         dice_entered = DiceSet.parse_dice_values(dice_value_string)
         if dice_entered is None:
@@ -32,33 +40,47 @@ class YahtzeeGUI:
                 extra_message = "Dice values not recognized"
                 self.set_instructions(extra_message)
             else:
-                self.yahtzee_game.dice_rolled_manually(self.fixed_dice, dice_values)
-                position_to_take, dice_to_fix = self.yahtzee_game.recommended_next_step(dice_values)
+                # the recommendation is shown by show_recommendation when the worker has it
+                self.ok_button.state(['disabled'])
+                self.dice_values = dice_values
+                self.worker.dice_rolled(self.fixed_dice, dice_values)
                 # clear the dice textbox
                 self.dice_values_text.set("")
-                self.fixed_dice = dice_to_fix
-                if dice_to_fix is not None:
-                    self.set_instructions(None)
-                else:
-                    self.yahtzee_game.accept_score(position_to_take, dice_values)
-                    # have to get score from the scores array, because bonus yahtzees are cumulative
-                    score = self.yahtzee_game.scores[position_to_take]
-                    # show score on interface
-                    self.show_position_score(position_to_take, score)
-
-                    game_complete = self.yahtzee_game.game_complete()
-                    if game_complete:
-                        # disable the OK button
-                        self.ok_button.state(['disabled'])
-                        # show the overall scores
-                        total, upper_section, bonus, lower_section = self.yahtzee_game.total_score()
-                        self.upper_section.set(upper_section)
-                        self.bonus.set(bonus)
-                        self.lower_section.set(lower_section)
-                        self.total_score.set(total)
-                    extra_message = f'Used dice {dice_values} as {YahtzeeGame.position_name(position_to_take)} with score {score}'
-                    self.set_rounds_remaining()
-                    self.set_instructions(extra_message, game_complete)
+
+    def poll_worker(self):
+        for message in self.worker.results():
+            if message[0] == YahtzeeRecommendationWorker.READY:
+                self.set_rounds_remaining(message[1])
+                self.set_instructions(None)
+                self.ok_button.state(['!disabled'])
+            elif message[0] == YahtzeeRecommendationWorker.ERROR:
+                error_message, worker_running = message[1:]
+                self.set_instructions(error_message)
+                if worker_running:
+                    self.ok_button.state(['!disabled'])
+            else:
+                self.show_recommendation(*message[1:])
+        self.root.after(YahtzeeGUI.POLL_MILLISECONDS, self.poll_worker)
+
+    def show_recommendation(self, position_to_take, dice_to_fix, score, game_complete, total_score, rounds_remaining):
+        self.fixed_dice = dice_to_fix
+        if dice_to_fix is not None:
+            self.set_instructions(None)
+        else:
+            # show score on interface
+            self.show_position_score(position_to_take, score)
+            if game_complete:
+                # show the overall scores
+                total, upper_section, bonus, lower_section = total_score
+                self.upper_section.set(upper_section)
+                self.bonus.set(bonus)
+                self.lower_section.set(lower_section)
+                self.total_score.set(total)
+            extra_message = f'Used dice {self.dice_values} as {YahtzeeGame.position_name(position_to_take)} with score {score}'
+            self.set_rounds_remaining(rounds_remaining)
+            self.set_instructions(extra_message, game_complete)
+        if not game_complete:
+            self.ok_button.state(['!disabled'])
 
     def initialize_position_score(self, position_number):
         self.position_scores[position_number].set('-')
@@ -72,8 +94,7 @@ class YahtzeeGUI:
     def set_focus_on_dice_values(self):
         self.dice_entry.focus()
 
-    def set_rounds_remaining(self):
-        rr = self.yahtzee_game.rounds_remaining()
+    def set_rounds_remaining(self, rr):
         if rr == 0:
             self.rounds_remaining.set("")
         else:
@@ -100,6 +121,7 @@ class YahtzeeGUI:
     def show_form(self):
         root = Tk()
         root.title = "Yahtzee"
+        self.root = root
 
         mainframe = ttk.Frame(root, padding="3 3 12 12")
         mainframe.grid(column=0, row=0, sticky=(N, W, E, S))
@@ -155,13 +177,12 @@ class YahtzeeGUI:
         # rounds remaining
         self.rounds_remaining = StringVar()
         ttk.Label(mainframe, textvariable=self.rounds_remaining).grid(column=1, row=row, columnspan=2, sticky=W)
-        self.set_rounds_remaining()
         row += 1
 
         # instructions
         self.instructions = StringVar()
         ttk.Label(mainframe, textvariable=self.instructions).grid(column=1, row=row, columnspan=2, sticky=W)
-        self.set_instructions(None)
+        self.instructions.set("Loading...")
         row += 1
 
         dice_frame = Frame(mainframe)
@@ -176,6 +197,8 @@ class YahtzeeGUI:
         button_frame.grid(column=1, columnspan=2, row=row, sticky=E)
         self.ok_button = ttk.Button(button_frame, text="OK", command=self.ok_click, default="active")
         self.ok_button.grid(column=1, row=1, sticky=W)
+        # enabled when the worker has loaded the tables
+        self.ok_button.state(['disabled'])
         ttk.Button(button_frame, text="Exit", command=exit).grid(column=2, row=1, sticky=E)
 
         # add some padding around each element in mainframe
@@ -185,6 +208,8 @@ class YahtzeeGUI:
         root.bind("<Return>", self.ok_click)
         self.set_focus_on_dice_values()
 
+        self.worker.start()
+        root.after(YahtzeeGUI.POLL_MILLISECONDS, self.poll_worker)
         root.mainloop()
 
 
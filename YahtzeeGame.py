@@ -1,32 +1,180 @@
 import numpy as np
+import atexit
 import itertools
+import math
+import os
 from DiceSet import DiceSet
+from YahtzeeTableCache import YahtzeeTableCache
+from YahtzeeProfiler import YahtzeeProfiler
 
 
 class GameLog:
-    def __init__(self):
-        self.log = []
+    # the steps of games, as fixed-size records that can be appended to a file as games are played,
+    # and read back by GameLogReader. Without a path, only the steps of the current game are kept.
+    STEP_FIRST_ROLL = 0
+    STEP_REROLL = 1
+    STEP_SCORE = 2
+    NO_POSITION = -1
+    # kept holds num_kept dice, followed by zeros
+    STEP_DTYPE = np.dtype([('game', '<u4'), ('turn', 'u1'), ('kind', 'i1'), ('dice', 'i1', 5), ('kept', 'i1', 5),
+                           ('num_kept', 'i1'), ('position', 'i1'), ('score', '<i2')])
+    FILE_HEADER = b'YAHTZEE GAMELOG1'  # change the number if STEP_DTYPE changes
+    BUFFER_STEPS = 65536  # steps are written to the file in blocks of about this many
+
+    @staticmethod
+    def digits(dice):
+        return ''.join(str(value) for value in dice)
+
+    @staticmethod
+    def newly_rolled(dice, kept):
+        # the dice that weren't kept. Both are sorted, so this walks through them together.
+        rolled = []
+        k = 0
+        for value in dice:
+            if k < len(kept) and kept[k] == value:
+                k += 1
+            else:
+                rolled.append(value)
+        return rolled
+
+    @classmethod
+    def format_step(cls, step):
+        dice = cls.digits(step['dice'])
+        if step['kind'] == cls.STEP_REROLL:
+            kept = step['kept'][0:step['num_kept']]
+            return f'kept {cls.digits(kept) or "nothing"}, rolled {cls.digits(cls.newly_rolled(step["dice"], kept))}'
+        elif step['kind'] == cls.STEP_SCORE:
+            return f'used {dice} for {YahtzeeGame.position_name(step["position"])} with score {step["score"]}'
+        else:
+            return f'rolled {dice}'
+
+    def __init__(self, path=None):
+        self.path = path
+        self.steps = np.zeros(64, dtype=self.STEP_DTYPE)
+        self.num_steps = 0
+        self.game_start = 0  # index in steps of the current game's first step
+        self.game = 0
+        self.turn = 0
+        if path is not None:
+            if os.path.exists(path):
+                # carry on numbering from the games already in the file
+                self.game = GameLogReader(path).num_games()
+            atexit.register(self.flush)
+
+    def start_game(self):
+        if self.num_steps > self.game_start:
+            self.game += 1
+        self.turn = 0
+        if self.path is None:
+            self.num_steps = 0
+        elif self.num_steps >= self.BUFFER_STEPS:
+            self.flush()
+        self.game_start = self.num_steps
+
+    def reserve(self, num_steps):
+        if self.num_steps + num_steps > len(self.steps):
+            steps = np.zeros(max(2 * len(self.steps), self.num_steps + num_steps), dtype=self.STEP_DTYPE)
+            steps[0:self.num_steps] = self.steps[0:self.num_steps]
+            self.steps = steps
+
+    def add_step(self, kind, dice_values, dice_fixed=None, position=NO_POSITION, score=0):
+        self.reserve(1)
+        num_kept = 0 if dice_fixed is None else len(dice_fixed)
+        kept = np.zeros(5, dtype=np.int8)
+        if num_kept > 0:
+            kept[0:num_kept] = np.sort(dice_fixed)
+        self.steps[self.num_steps] = (self.game, self.turn, kind, dice_values, kept, num_kept, position, score)
+        self.num_steps += 1
+        if kind == GameLog.STEP_SCORE:
+            self.turn += 1
 
-    def add_step(self, dice_values, dice_fixed, position_taken, score):
-        self.log.append([dice_values, dice_fixed, position_taken, score])
+    def add_steps(self, steps):
+        # steps of several games at once, from YahtzeeBatchGame. Their game numbers start at self.game.
+        self.reserve(len(steps))
+        self.steps[self.num_steps:self.num_steps + len(steps)] = steps
+        self.num_steps += len(steps)
+
+    def end_games(self, num_games):
+        # after add_steps, puts each game's steps together, in the order they were added
+        steps = self.steps[self.game_start:self.num_steps]
+        steps[:] = steps[np.argsort(steps['game'], kind='stable')]
+        self.game += num_games
+        self.game_start = self.num_steps
+        self.start_game()
+
+    def flush(self):
+        # writes the steps so far to the file
+        if self.path is None or self.num_steps == 0:
+            return
+        with open(self.path, 'ab') as f:
+            if f.tell() == 0:
+                f.write(self.FILE_HEADER)
+            f.write(self.steps[0:self.num_steps].tobytes())
+        self.num_steps = 0
+        self.game_start = 0
 
     def print(self):
         print(f'----Game log----')
-        for line in self.log:
-            dice_values, dice_fixed, position_name, score = line
-            if dice_fixed is not None:
-                newly_rolled = str(dice_values)
-                for digit in str(dice_fixed):
-                    index = newly_rolled.find(str(digit))
-                    newly_rolled = newly_rolled[0: index] + newly_rolled[index + 1:]
-                print(f'kept {dice_fixed}, rolled {newly_rolled}')
-            elif position_name is not None:
-                print(f'used {dice_values} for {position_name} with score {score}')
-            else:
-                print(f'rolled {dice_values}')
+        for step in self.steps[self.game_start:self.num_steps]:
+            print(self.format_step(step))
         print(f'----End of game log----')
 
 
+class GameLogReader:
+    # reads a file written by GameLog through a memory map, so logs of many games don't have to fit in memory
+    CHUNK_STEPS = 2 ** 20  # summaries go through the file this many steps at a time
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(len(GameLog.FILE_HEADER))
+        if header != GameLog.FILE_HEADER:
+            raise ValueError(f'{path} is not a game log')
+        num_steps = (os.path.getsize(path) - len(header)) // GameLog.STEP_DTYPE.itemsize
+        if num_steps == 0:
+            self.steps = np.zeros(0, dtype=GameLog.STEP_DTYPE)
+        else:
+            self.steps = np.memmap(path, dtype=GameLog.STEP_DTYPE, mode='r', offset=len(header), shape=(num_steps,))
+
+    def num_games(self):
+        if len(self.steps) == 0:
+            return 0
+        return int(self.steps[-1]['game']) + 1
+
+    def game_steps(self, game):
+        # each game's steps are together, in order of game, so this only reads a few pages of the file
+        games = self.steps['game']
+        return self.steps[np.searchsorted(games, game, 'left'):np.searchsorted(games, game, 'right')]
+
+    def print_game(self, game):
+        print(f'----Game {game}----')
+        for step in self.game_steps(game):
+            print(GameLog.format_step(step))
+
+    def final_scores(self):
+        num_games = self.num_games()
+        totals = np.zeros(num_games, dtype=np.int64)
+        upper_section = np.zeros(num_games, dtype=np.int64)
+        for start in range(0, len(self.steps), self.CHUNK_STEPS):
+            steps = self.steps[start:start + self.CHUNK_STEPS]
+            steps = steps[steps['kind'] == GameLog.STEP_SCORE]
+            games = steps['game'].astype(np.int64)
+            scores = steps['score'].astype(np.int64)
+            totals += np.bincount(games, scores, num_games).astype(np.int64)
+            upper = steps['position'] <= YahtzeeGame.UPPER_SECTION_END
+            upper_section += np.bincount(games[upper], scores[upper], num_games).astype(np.int64)
+        bonus = np.where(upper_section >= YahtzeeGameState.UPPER_BONUS_THRESHOLD, YahtzeeGameState.UPPER_BONUS, 0)
+        return totals + bonus
+
+    def summary(self):
+        final_scores = self.final_scores()
+        if len(final_scores) == 0:
+            return f'{self.path}: no games'
+        return (f'{self.path}: {len(final_scores)} games, {len(self.steps)} steps, '
+                f'average score {np.around(np.mean(final_scores), 1)} +/- {np.around(np.std(final_scores), 1)} sd, '
+                f'min {np.min(final_scores)}, max {np.max(final_scores)}')
+
+
 class YahtzeeGame:
     # class variables
     UPPER_SECTION_END = 5
@@ -44,7 +192,10 @@ class YahtzeeGame:
     LOWER_SECTION_MASK = -1 * (UPPER_SECTION_MASK - 1)
     BONUS_YAHTZEE_MASK = np.ones(NUM_SLOTS, dtype=np.int8)
     BONUS_YAHTZEE_MASK[BONUS_YAHTZEE] = 0
-    POSITION_MULTIPLIER = np.array([10000, 1000, 100, 10, 1], dtype=np.int32)
+    # probabilities of rolls are stored as a number of these equally likely outcomes, so sums are exact
+    ROLL_OUTCOMES = 6 ** 5
+    MAX_KEEPS = 2 ** 5  # 5 different dice can be kept in 32 ways
+    POSITION_BITS = 2 ** np.arange(NUM_SLOTS, dtype=np.int32)
 
     @staticmethod
     def position_name(position):
@@ -67,182 +218,138 @@ class YahtzeeGame:
         elif position == YahtzeeGame.CHANCE:
             return "Chance"
 
-    @classmethod
-    def dice_values_to_num(cls, dice_values):
-        if dice_values is None:
-            return None
-        else:
-            num = np.dot(dice_values, cls.POSITION_MULTIPLIER[-len(dice_values):])
-            return num
-
-    @classmethod
-    def score_dice(cls, dice_values):
-        position_scores = np.zeros(cls.NUM_SLOTS, dtype=np.int8)
-        dice_sum = np.sum(dice_values)
-        # upper section
-        for position in range(6):
-            position_dice_value = position + 1
-            position_scores[position] = position_dice_value * np.count_nonzero(dice_values == position_dice_value)
-        # three and four of a kind
-        unique, counts = np.unique(dice_values, return_counts=True)
-        for i in range(len(counts)):
-            if counts[i] >= 3:
-                position_scores[cls.THREE_OF_A_KIND] = dice_sum
-            if counts[i] >= 4:
-                position_scores[cls.FOUR_OF_A_KIND] = dice_sum
-            if counts[i] == 5:
-                position_scores[cls.YAHTZEE] = 50
-                position_scores[cls.BONUS_YAHTZEE] = 100
-        # full house
-        if len(counts) == 2:
-            if counts[0] * counts[1] == 6:
-                # it's a full house
-                position_scores[cls.FULL_HOUSE] = 25
-        # small and large straights
-        dice_values.sort()
-        in_a_row = 1
-        last_value = dice_values[0]
-        for i in range(1, len(dice_values)):
-            if dice_values[i] == last_value + 1:
-                in_a_row += 1
-                if in_a_row == 4:  # need 4 in a row for small straight
-                    position_scores[cls.SMALL_STRAIGHT] = 30  # score for small straight
-                if in_a_row == 5:
-                    position_scores[cls.LARGE_STRAIGHT] = 40  # score for small straight
-            elif dice_values[i] > last_value + 1:
-                in_a_row = 1
-            last_value = dice_values[i]
-        # chance
-        position_scores[cls.CHANCE] = dice_sum
-        return position_scores
-
-    def __init__(self, dice_type, position_costs=None, debug=False, dice_format=None):
+    def __init__(self, dice_type, position_costs=None, debug=False, dice_format=None, solver=None,
+                 decision_cache=None, rng=None, dice_tape=None, game_log_path=None, decision_table=None):
         self.debug = debug
-        self.dice = DiceSet(dice_type, dice_format)
+        # steps of the current game are kept for debug, and steps of every game are appended to game_log_path
+        self.game_log = None
+        if debug or game_log_path is not None:
+            self.game_log = GameLog(game_log_path)
+        # if set, a YahtzeeOptimalSolver makes the recommendations instead of position_costs
+        self.solver = solver
+        # optional YahtzeeDecisionCache for recommendations made with position_costs
+        self.decision_cache = decision_cache
+        # optional YahtzeeDecisionTable with every recommendation for position_costs worked out ahead of time
+        self.decision_table = decision_table
+        # dice_tape is a DiceTape, for DiceSet.DICE_TYPE_TAPE
+        self.dice = DiceSet(dice_type, dice_format, rng, dice_tape)
+        # the precomputed tables, shared by every game in this process
+        self.rules = YahtzeeRules.shared()
         self.reset_game(position_costs)
-        self.calculate_dice_combination_scores()
-        self.calculate_next_roll_possibilities()
 
     def reset_game(self, position_costs=None):
-        self.rolls_left = 3
-        self.scores = np.zeros(YahtzeeGame.NUM_SLOTS, dtype=np.int16)
-        self.game_log = GameLog()
-        self.position_available = np.ones(YahtzeeGame.NUM_SLOTS, dtype=np.int8)
-        self.position_available[YahtzeeGame.BONUS_YAHTZEE] = 0  # not available until there's been a Yahtzee
+        self.state = YahtzeeGameState()
+        if self.game_log is not None:
+            self.game_log.start_game()
         # position cost = opportunity cost of using up this position.
         if position_costs is None:
             self.position_costs = np.zeros_like(YahtzeeGame.UPPER_SECTION_MASK)
         else:
             self.position_costs = np.array(position_costs, dtype=np.int8)
+        if self.decision_cache is not None:
+            self.decision_cache.set_position_costs(self.position_costs)
+        if self.decision_table is not None and not np.array_equal(self.decision_table.position_costs,
+                                                                  self.position_costs):
+            raise ValueError(f'the decision table is for position costs {self.decision_table.position_costs.tolist()}, '
+                             f'not {self.position_costs.tolist()}')
 
-    def calculate_dice_combination_scores(self):
-        num_combinations = 252  # the number of combinations
-        self.dice_scores = np.zeros((num_combinations, YahtzeeGame.NUM_SLOTS), dtype=np.int8)
-        self.combination_ids = {}
-        dice_score_id = 0
-        for dice_value_list in itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, 5):
-            values_array = np.array(dice_value_list, dtype=np.int8)
-            num = self.dice_values_to_num(values_array)
-            self.combination_ids[num] = dice_score_id
-            self.dice_scores[dice_score_id, :] = self.score_dice(values_array)
-            dice_score_id += 1
+    # the score sheet is kept in self.state. These give the views of it that callers used before.
+    @property
+    def position_available(self):
+        # 1 for each open position, as a read-only row of a table
+        return self.rules.available_positions[self.state.position_mask]
 
-    def calculate_next_roll_possibilities(self):
-        num_combinations = 209
-        self.expected_value_if_rolled = np.zeros((num_combinations, YahtzeeGame.NUM_SLOTS), dtype=np.float)
-        self.next_roll_probabilities = np.zeros((num_combinations, YahtzeeGame.NUM_SLOTS), dtype=np.float)
-        fixed_value_list_id = 0
-
-        for num_fixed in range(1, 5):
-            num_to_roll = 5 - num_fixed
-            for fixed_values in itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, num_fixed):
-                num_rolls = 0
-                num_nonzero_scores = np.zeros(YahtzeeGame.NUM_SLOTS, dtype=np.int8)
-                scores = np.zeros(YahtzeeGame.NUM_SLOTS, dtype=np.int32)
-                for roll_results in itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, num_to_roll):
-                    full_list = np.array(fixed_values + roll_results, dtype=np.int8)
-                    full_list.sort()
-                    full_list_id = self.dice_values_to_id(full_list)
-                    score = self.dice_scores[full_list_id, :]
-                    num_nonzero_scores[score > 0] += 1
-                    scores += score
-                    num_rolls += 1
-                # average_scores = 0 for positions we never get to
-                possible_positions = (num_nonzero_scores > 0)
-                average_scores = np.zeros_like(scores, dtype=np.int32)
-                average_scores[possible_positions] = scores[possible_positions] / num_nonzero_scores[possible_positions]
-                fixed_values_number = self.dice_values_to_num(fixed_values)
-                self.combination_ids[fixed_values_number] = fixed_value_list_id
-                self.expected_value_if_rolled[fixed_value_list_id] = average_scores
-                self.next_roll_probabilities[fixed_value_list_id] = num_nonzero_scores / num_rolls
-                fixed_value_list_id += 1
+    @position_available.setter
+    def position_available(self, position_available):
+        self.state.position_mask = int(np.dot(position_available, YahtzeeGame.POSITION_BITS))
+
+    @property
+    def rolls_left(self):
+        return self.state.rolls_left
+
+    @rolls_left.setter
+    def rolls_left(self, rolls_left):
+        self.state.rolls_left = rolls_left
+
+    @property
+    def scores(self):
+        return np.array(self.state.scores, dtype=np.int16)
+
+    # the scoring rules and their tables are kept in YahtzeeRules. These forward to them for callers
+    # that used them on YahtzeeGame.
+    @classmethod
+    def score_dice(cls, dice_values):
+        return YahtzeeRules.score_dice(dice_values)
+
+    @classmethod
+    def score_dice_batch(cls, dice):
+        return YahtzeeRules.score_dice_batch(dice)
 
     def dice_values_to_id(self, dice_values):
-        # dice_values must be sorted
-        num = self.dice_values_to_num(dice_values)
-        return self.combination_ids[num]
+        return self.rules.dice_values_to_id(dice_values)
+
+    @property
+    def dice_scores(self):
+        return self.rules.dice_scores
+
+    @property
+    def combination_ids(self):
+        return self.rules.combination_ids
 
     def game_complete(self):
         return self.rounds_remaining() == 0
 
     def rounds_remaining(self):
-        rounds_remaining = np.sum(np.dot(self.position_available, YahtzeeGame.BONUS_YAHTZEE_MASK))
-        return rounds_remaining
+        return self.state.rounds_remaining()
 
     def total_score(self):
-        upper_section = np.sum(self.scores * YahtzeeGame.UPPER_SECTION_MASK)
-        if upper_section >= 63:
-            bonus = 35
-        else:
-            bonus = 0
-        lower_section = np.sum(self.scores * YahtzeeGame.LOWER_SECTION_MASK)
-        total = upper_section + bonus + lower_section
-        return total, upper_section, bonus, lower_section
+        return self.state.total_score()
 
     def is_taken(self, position):
         if position < YahtzeeGame.NUM_SLOTS:
             if position == YahtzeeGame.BONUS_YAHTZEE:
                 return False  # bonus yahtzee has space for more
             else:
-                return self.position_available[position] == 0
+                return not self.state.position_mask & (1 << position)
         else:
             raise Exception(f'Invalid position {position} '
                             f'{YahtzeeGame.position_name(position)} was passed to is_taken().')
 
     def best_dice_to_fix(self, dice_values):
-        best_score = None
-        best_fixed_values = None
-        for num_fixed in range(1, 5):
-            for fixed_values in itertools.combinations(dice_values, num_fixed):
-                fixed_value_list_id = self.dice_values_to_id(fixed_values)
-                score = self.expected_value(fixed_value_list_id)
-                if best_score is None or score > best_score:
-                    best_score = score
-                    best_fixed_values = list(fixed_values)
-        return best_fixed_values, best_score
-
-    def expected_value(self, fixed_value_list_id):
-        value_if_rolled = self.expected_value_if_rolled[fixed_value_list_id]
-        feasible_values = value_if_rolled * self.position_available - self.position_costs
-        prob = self.next_roll_probabilities[fixed_value_list_id]
-        expected_value = 0
-        sum_of_probabilities = 0
-        for index in np.argsort(- 1 * feasible_values):
-            # from largest to smallest
-            adjusted_prob = min(prob[index], 1-sum_of_probabilities)
-            sum_of_probabilities += adjusted_prob
-            expected_value += feasible_values[index] * adjusted_prob
-            if sum_of_probabilities >= 1:
-                break
-        return expected_value
+        # keeping all 5 dice comes first, so it wins ties
+        rules = self.rules
+        roll_keep_ids = rules.roll_keep_ids[rules.dice_values_to_id(dice_values)]
+        expected_values = self.keep_expected_values()[roll_keep_ids]
+        best_keep_id = roll_keep_ids[np.argmax(expected_values)]
+        num_fixed = rules.keep_sizes[best_keep_id]
+        best_fixed_values = list(rules.keep_dice_values[best_keep_id, 0:num_fixed])
+        return best_fixed_values, expected_values.max()
+
+    def roll_values(self):
+        # value of the best position for every roll, with the same rules as best_position
+        dice_scores = self.rules.dice_scores
+        position_available = self.position_available
+        feasible_values = dice_scores * position_available - self.position_costs
+        usable = np.broadcast_to(position_available == 1, feasible_values.shape).copy()
+        # can only use the Bonus Yahtzee slot if we actually have a bonus yahtzee
+        usable[:, YahtzeeGame.BONUS_YAHTZEE] &= dice_scores[:, YahtzeeGame.BONUS_YAHTZEE] > 0
+        return np.max(np.where(usable, feasible_values, -np.inf), axis=1)
+
+    def keep_expected_values(self):
+        # expected value of every keep, if the best position is taken after rolling the rest of the dice.
+        # This is the sparse keep x roll matrix times roll_values.
+        rules = self.rules
+        weighted_values = self.roll_values()[rules.transition_roll_ids] * rules.transition_weights
+        return np.add.reduceat(weighted_values, rules.keep_starts) / YahtzeeGame.ROLL_OUTCOMES
 
     def best_position(self, dice_values):
-        dice_value_id = self.dice_values_to_id(dice_values)
-        dice_scores = self.dice_scores[dice_value_id, :]
-        feasible_values = dice_scores * self.position_available - self.position_costs
+        dice_value_id = self.rules.dice_values_to_id(dice_values)
+        dice_scores = self.rules.dice_scores[dice_value_id, :]
+        position_available = self.position_available
+        feasible_values = dice_scores * position_available - self.position_costs
         min_value = np.min(feasible_values)
         # make sure that infeasible numbers are not the max
-        feasible_values[self.position_available == 0] = min_value - 1
+        feasible_values[position_available == 0] = min_value - 1
         if dice_scores[YahtzeeGame.BONUS_YAHTZEE] == 0:
             # can only use the Bonus Yahtzee slot if we actually have a bonus yahtzee. Can't put a zero there.
             feasible_values[YahtzeeGame.BONUS_YAHTZEE] = min_value - 1
@@ -251,10 +358,31 @@ class YahtzeeGame:
         return pos, score
 
     def recommended_next_step(self, dice_values):
+        if self.solver is not None:
+            return self.solver.recommended_next_step(self, dice_values)
+        if self.decision_table is not None:
+            return self.decision_table.recommended_next_step(self, dice_values)
+        if self.decision_cache is None:
+            return self.position_cost_next_step(dice_values)
+        dice_value_id = int(self.rules.dice_values_to_id(dice_values))
+        key = self.decision_cache.key(self.state.position_mask, self.state.rolls_left, dice_value_id,
+                                      len(self.rules.dice_scores))
+        decision = self.decision_cache.get(key)
+        if decision is None:
+            decision = self.position_cost_next_step(dice_values)
+            self.decision_cache.put(key, decision)
+        best_position, best_fixed_values = decision
+        if best_fixed_values is not None:
+            best_fixed_values = list(best_fixed_values)  # so callers can't change the cached list
+        return best_position, best_fixed_values
+
+    def position_cost_next_step(self, dice_values):
         best_position, score = self.best_position(dice_values)
-        if self.rolls_left > 0:
+        rolls_left = self.state.rolls_left
+        if rolls_left > 0:
             best_fixed_values, expected_next_roll_score = self.best_dice_to_fix(dice_values)
-        if self.rolls_left == 0 or score > expected_next_roll_score:
+        # keeping all the dice is worth the same as scoring them now, so a tie means there's no better keep
+        if rolls_left == 0 or score >= expected_next_roll_score:
             return best_position, None
         else:
             return None, best_fixed_values
@@ -263,46 +391,39 @@ class YahtzeeGame:
         if self.is_taken(position):
             raise Exception(f'position {position} {YahtzeeGame.position_name(position)} was already taken.')
         else:
-            dice_value_id = self.dice_values_to_id(dice_values)
-            score = self.dice_scores[dice_value_id, position]
-            # previous value of self.scores[position] will be zero,
-            # except if this is a bonus yahtzee and there was a previous bonus yahtzee
-            self.scores[position] += score
-            if position != YahtzeeGame.BONUS_YAHTZEE:
-                # mark as taken
-                # bonus yahtzee slot can be used multiple times
-                self.position_available[position] = 0
-            if position == YahtzeeGame.YAHTZEE and score > 0:
-                # if this was a yahtzee, then we can now score bonus yahtzees
-                # bonus yahtzee not available if we put a zero in yahtzee
-                self.position_available[YahtzeeGame.BONUS_YAHTZEE] = 1
-            if self.debug:
-                self.game_log.add_step(self.dice_values_to_num(dice_values), None,
-                                       YahtzeeGame.position_name(position), score)
-            self.rolls_left = 3
+            dice_value_id = self.rules.dice_values_to_id(dice_values)
+            score = self.rules.dice_scores[dice_value_id, position]
+            self.state.accept(position, int(score))
+            if self.game_log is not None:
+                self.game_log.add_step(GameLog.STEP_SCORE, dice_values, None, position, score)
             return score
 
     def dice_rolled_manually(self, dice_fixed, dice_values):
         # used if rolling dice in a GUI
-        self.rolls_left -= 1
-        if self.debug:
-            self.game_log.add_step(self.dice_values_to_num(dice_values), self.dice_values_to_num(dice_fixed), None, None)
+        self.state.rolls_left -= 1
+        if self.game_log is not None:
+            self.game_log.add_step(GameLog.STEP_FIRST_ROLL if dice_fixed is None else GameLog.STEP_REROLL,
+                                   dice_values, dice_fixed)
 
     def roll_dice(self, dice_fixed):
         dice_values = self.dice.roll(dice_fixed)
-        if self.debug:
-            self.game_log.add_step(self.dice_values_to_num(dice_values), self.dice_values_to_num(dice_fixed), None, None)
-        self.rolls_left -= 1
+        if self.game_log is not None:
+            self.game_log.add_step(GameLog.STEP_FIRST_ROLL if dice_fixed is None else GameLog.STEP_REROLL,
+                                   dice_values, dice_fixed)
+        self.state.rolls_left -= 1
         return dice_values
 
     def play_game(self):
-        if self.debug or self.dice.dice_type == DiceSet.DICE_TYPE_MANUAL:
+        # decided once per game, rather than on every roll
+        manual = self.dice.dice_type == DiceSet.DICE_TYPE_MANUAL
+        verbose = self.debug or manual
+        if verbose:
             print(f'Starting game.')
         self.reset_game(self.position_costs)
         dice_to_fix = None
         while not self.game_complete():
             dice_values = self.roll_dice(dice_to_fix)
-            if self.debug or self.dice.dice_type == DiceSet.DICE_TYPE_MANUAL:
+            if verbose:
                 print(f'rolled {self.dice.dice_format(dice_values)}')
             position_to_take, dice_to_fix = self.recommended_next_step(dice_values)
             if dice_to_fix is not None:
@@ -312,18 +433,18 @@ class YahtzeeGame:
             else:
                 # use the current dice for position_to_take
                 score = self.accept_score(position_to_take, dice_values)
-                if self.debug or self.dice.dice_type == DiceSet.DICE_TYPE_MANUAL:
+                if verbose:
                     print(f'used dice {self.dice.dice_format(dice_values)} '
                           f'for position {YahtzeeGame.position_name(position_to_take)} with score {score}')
-                if self.dice.dice_type == DiceSet.DICE_TYPE_MANUAL:
+                if manual:
                     print(f'===================')  # marker for new rolls of dice
                 rounds_remaining = self.rounds_remaining()
-                if rounds_remaining > 0 and (self.debug or self.dice.dice_type == DiceSet.DICE_TYPE_MANUAL):
+                if rounds_remaining > 0 and verbose:
                     print(f'- {rounds_remaining} rounds left -')
         total, upper_section, bonus, lower_section = self.total_score()
         if self.debug:
             self.game_log.print()
-        if self.debug or self.dice.dice_type == DiceSet.DICE_TYPE_MANUAL:
+        if verbose:
             self.print_score_sheet()
         return total
 
@@ -331,7 +452,7 @@ class YahtzeeGame:
         total, upper_section, bonus, lower_section = self.total_score()
         print(f'===========SCORE SHEET================')
         for pos in range(YahtzeeGame.NUM_SLOTS):
-            print(f'{YahtzeeGame.position_name(pos)}: {self.scores[pos]}')
+            print(f'{YahtzeeGame.position_name(pos)}: {self.state.scores[pos]}')
             if pos == YahtzeeGame.UPPER_SECTION_END:
                 print(f'===')
                 print(f'Upper section: {upper_section}')
@@ -341,3 +462,192 @@ class YahtzeeGame:
         print(f'Lower section: {lower_section}')
         print(f'===')
         print(f'FINAL SCORE: {total}')
+
+
+YahtzeeProfiler.register(YahtzeeGame, ['roll_dice', 'best_dice_to_fix', 'keep_expected_values', 'best_position',
+                                       'accept_score', 'recommended_next_step', 'play_game'])
+
+
+class YahtzeeRules:
+    # the scoring rules and the tables precomputed from them, which don't change during a game.
+    # They're the same for every game, so one copy is shared by all the games in a process.
+    # Tables are built by calculate_dice_combination_scores and calculate_next_roll_possibilities,
+    # and saved to a file so later processes can load them.
+    shared_rules = None
+
+    @classmethod
+    def shared(cls):
+        if cls.shared_rules is None:
+            cls.shared_rules = cls()
+        return cls.shared_rules
+
+    def __init__(self):
+        YahtzeeTableCache.load_or_build(self)
+        for name in YahtzeeTableCache.TABLE_NAMES:
+            getattr(self, name).setflags(write=False)
+        # position_available for each position_mask of a YahtzeeGameState
+        masks = np.arange(2 ** YahtzeeGame.NUM_SLOTS)
+        self.available_positions = ((masks[:, np.newaxis] >> np.arange(YahtzeeGame.NUM_SLOTS)) & 1).astype(np.int8)
+        self.available_positions.setflags(write=False)
+
+    @classmethod
+    def score_dice(cls, dice_values):
+        return cls.score_dice_batch(np.asarray(dice_values)[np.newaxis, :])[0]
+
+    @classmethod
+    def score_dice_batch(cls, dice):
+        # scores an (N, 5) array of rolls, in any order, giving an (N, NUM_SLOTS) array of scores
+        dice = np.asarray(dice)
+        faces = np.array(DiceSet.POSSIBLE_VALUES, dtype=np.int16)
+        counts = np.count_nonzero(dice[:, :, np.newaxis] == faces, axis=1)  # number of each face, for each roll
+        dice_sum = np.sum(dice, axis=1, dtype=np.int16)
+        max_count = np.max(counts, axis=1)
+        position_scores = np.zeros((len(dice), YahtzeeGame.NUM_SLOTS), dtype=np.int8)
+        # upper section
+        position_scores[:, 0:YahtzeeGame.UPPER_SECTION_END + 1] = counts * faces
+        # three and four of a kind
+        position_scores[:, YahtzeeGame.THREE_OF_A_KIND] = np.where(max_count >= 3, dice_sum, 0)
+        position_scores[:, YahtzeeGame.FOUR_OF_A_KIND] = np.where(max_count >= 4, dice_sum, 0)
+        position_scores[:, YahtzeeGame.YAHTZEE] = np.where(max_count == 5, 50, 0)
+        position_scores[:, YahtzeeGame.BONUS_YAHTZEE] = np.where(max_count == 5, 100, 0)
+        # full house
+        full_house = np.any(counts == 3, axis=1) & np.any(counts == 2, axis=1)
+        position_scores[:, YahtzeeGame.FULL_HOUSE] = np.where(full_house, 25, 0)
+        # small and large straights: every face of a run of 4 or 5 faces is there
+        present = counts > 0
+        small_straight = np.zeros(len(dice), dtype=bool)
+        for first_face in range(3):
+            small_straight |= np.all(present[:, first_face:first_face + 4], axis=1)
+        large_straight = np.all(present[:, 0:5], axis=1) | np.all(present[:, 1:6], axis=1)
+        position_scores[:, YahtzeeGame.SMALL_STRAIGHT] = np.where(small_straight, 30, 0)
+        position_scores[:, YahtzeeGame.LARGE_STRAIGHT] = np.where(large_straight, 40, 0)
+        # chance
+        position_scores[:, YahtzeeGame.CHANCE] = dice_sum
+        return position_scores
+
+    def calculate_dice_combination_scores(self):
+        num_combinations = 252  # the number of combinations
+        self.dice_scores = np.zeros((num_combinations, YahtzeeGame.NUM_SLOTS), dtype=np.int8)
+        # ids of rolls of 5 dice, indexed by DiceSet.dice_key
+        self.combination_ids = np.full(DiceSet.NUM_DICE_KEYS, -1, dtype=np.int16)
+        all_dice_values = np.array(list(itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, 5)),
+                                   dtype=np.int8)
+        self.combination_ids[DiceSet.dice_keys(all_dice_values)] = np.arange(num_combinations)
+        self.dice_scores[:, :] = self.score_dice_batch(all_dice_values)
+
+    def calculate_next_roll_possibilities(self):
+        # every combination of 0 to 5 dice that can be kept, and the rolls it can lead to after rolling the rest.
+        # The keep x roll matrix is sparse, so it's stored as a run of (roll id, weight) entries for each keep,
+        # starting at keep_starts. Weights are out of ROLL_OUTCOMES, and count how many orders the rolled dice
+        # could come up in.
+        keeps = [fixed_values for num_fixed in range(6)
+                 for fixed_values in itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, num_fixed)]
+        # ids of keeps, indexed by DiceSet.dice_key
+        self.keep_ids = np.full(DiceSet.NUM_DICE_KEYS, -1, dtype=np.int16)
+        self.keep_dice_values = np.zeros((len(keeps), 5), dtype=np.int8)
+        self.keep_sizes = np.zeros(len(keeps), dtype=np.int8)
+        keep_starts = []
+        roll_ids = []
+        weights = []
+        for keep_id, fixed_values in enumerate(keeps):
+            self.keep_ids[DiceSet.dice_key(fixed_values)] = keep_id
+            self.keep_dice_values[keep_id, 0:len(fixed_values)] = fixed_values
+            self.keep_sizes[keep_id] = len(fixed_values)
+            keep_starts.append(len(roll_ids))
+            num_to_roll = 5 - len(fixed_values)
+            for roll_results in itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, num_to_roll):
+                ways = math.factorial(num_to_roll)
+                for value in DiceSet.POSSIBLE_VALUES:
+                    ways //= math.factorial(roll_results.count(value))
+                roll_ids.append(self.dice_values_to_id(fixed_values + roll_results))
+                weights.append(ways * 6 ** len(fixed_values))
+        self.keep_starts = np.array(keep_starts, dtype=np.int32)
+        self.transition_roll_ids = np.array(roll_ids, dtype=np.int16)
+        self.transition_weights = np.array(weights, dtype=np.int32)
+        # the distinct keeps for each roll, from keeping all 5 dice down to keeping none.
+        # Rolls with fewer distinct keeps are padded by repeating the first one.
+        self.roll_keep_ids = np.zeros((len(self.dice_scores), YahtzeeGame.MAX_KEEPS), dtype=np.int16)
+        for dice_value_list in itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, 5):
+            counts = [dice_value_list.count(value) for value in DiceSet.POSSIBLE_VALUES]
+            roll_keep_ids = []
+            for keep_counts in itertools.product(*[range(count, -1, -1) for count in counts]):
+                keep_key = 0
+                for value, num_kept in zip(DiceSet.POSSIBLE_VALUES, keep_counts):
+                    keep_key += num_kept * DiceSet.FACE_KEYS[value]
+                roll_keep_ids.append(self.keep_ids[keep_key])
+            roll_keep_ids.extend([roll_keep_ids[0]] * (YahtzeeGame.MAX_KEEPS - len(roll_keep_ids)))
+            self.roll_keep_ids[self.dice_values_to_id(dice_value_list)] = roll_keep_ids
+
+    def keep_roll_matrix(self):
+        # dense keep x roll matrix of weights, for multiplying many sets of roll values at once
+        keep_roll_matrix = np.zeros((len(self.keep_starts), len(self.dice_scores)))
+        keep_of_transition = np.repeat(np.arange(len(self.keep_starts)),
+                                       np.diff(self.keep_starts, append=len(self.transition_roll_ids)))
+        keep_roll_matrix[keep_of_transition, self.transition_roll_ids] = self.transition_weights
+        return keep_roll_matrix
+
+    def dice_values_to_id(self, dice_values):
+        return self.combination_ids[DiceSet.dice_key(dice_values)]
+
+
+class YahtzeeGameState:
+    # what changes during a game: which positions are open, as a bit for each position like
+    # YahtzeeGame.POSITION_BITS, the section subtotals, the number of bonus yahtzees, the rolls left
+    # this turn and the score in each position. Small, so copying a state to look ahead is cheap.
+    __slots__ = ['position_mask', 'upper_section', 'lower_section', 'bonus_yahtzees', 'rolls_left', 'scores']
+    BONUS_YAHTZEE_BIT = 1 << YahtzeeGame.BONUS_YAHTZEE
+    ALL_POSITIONS_MASK = 2 ** YahtzeeGame.NUM_SLOTS - 1
+    # Bonus Yahtzee is not available until there's been a Yahtzee
+    NEW_GAME_MASK = ALL_POSITIONS_MASK & ~BONUS_YAHTZEE_BIT
+    UPPER_BONUS_THRESHOLD = 63
+    UPPER_BONUS = 35
+
+    def __init__(self):
+        self.position_mask = YahtzeeGameState.NEW_GAME_MASK
+        self.upper_section = 0
+        self.lower_section = 0
+        self.bonus_yahtzees = 0
+        self.rolls_left = 3
+        # a tuple, so copies can share it until one of them scores
+        self.scores = (0,) * YahtzeeGame.NUM_SLOTS
+
+    def copy(self):
+        state = YahtzeeGameState.__new__(YahtzeeGameState)
+        state.position_mask = self.position_mask
+        state.upper_section = self.upper_section
+        state.lower_section = self.lower_section
+        state.bonus_yahtzees = self.bonus_yahtzees
+        state.rolls_left = self.rolls_left
+        state.scores = self.scores
+        return state
+
+    def accept(self, position, score):
+        # the score in position will be zero, except if this is a bonus yahtzee and there was a previous one
+        self.scores = self.scores[0:position] + (self.scores[position] + score,) + self.scores[position + 1:]
+        if position <= YahtzeeGame.UPPER_SECTION_END:
+            self.upper_section += score
+        else:
+            self.lower_section += score
+        if position == YahtzeeGame.BONUS_YAHTZEE:
+            # bonus yahtzee slot can be used multiple times
+            if score > 0:
+                self.bonus_yahtzees += 1
+        else:
+            # mark as taken
+            self.position_mask &= ~(1 << position)
+        if position == YahtzeeGame.YAHTZEE and score > 0:
+            # if this was a yahtzee, then we can now score bonus yahtzees
+            # bonus yahtzee not available if we put a zero in yahtzee
+            self.position_mask |= YahtzeeGameState.BONUS_YAHTZEE_BIT
+        self.rolls_left = 3
+
+    def rounds_remaining(self):
+        return bin(self.position_mask & ~YahtzeeGameState.BONUS_YAHTZEE_BIT).count('1')
+
+    def total_score(self):
+        if self.upper_section >= YahtzeeGameState.UPPER_BONUS_THRESHOLD:
+            bonus = YahtzeeGameState.UPPER_BONUS
+        else:
+            bonus = 0
+        total = self.upper_section + bonus + self.lower_section
+        return total, self.upper_section, bonus, self.lower_section
@@ -0,0 +1,48 @@
+import numpy as np
+import argparse
+import sys
+from YahtzeeGame import YahtzeeGame, GameLog, GameLogReader
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeDefaults import POSITION_COSTS
+
+
+def record(path, num_games, position_costs, seed):
+    # plays num_games games in batches, appending every step to the log at path
+    game_log = GameLog(path)
+    batch_game = YahtzeeBatchGame(position_costs, np.random.default_rng(seed), game_log=game_log)
+    games_per_batch = 10000
+    for start in range(0, num_games, games_per_batch):
+        batch_game.play_games(min(games_per_batch, num_games - start), position_costs)
+    game_log.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record, summarize or replay a Yahtzee game log.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='play games and append them to a log')
+    record_parser.add_argument('log')
+    record_parser.add_argument('--games', type=int, default=10000)
+    record_parser.add_argument('--position-costs', type=int, nargs=YahtzeeGame.NUM_SLOTS,
+                               default=POSITION_COSTS)
+    record_parser.add_argument('--seed', type=int)
+    summary_parser = subparsers.add_parser('summary', help='summarize the games in a log')
+    summary_parser.add_argument('log')
+    replay_parser = subparsers.add_parser('replay', help='print the steps of games in a log')
+    replay_parser.add_argument('log')
+    replay_parser.add_argument('games', type=int, nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.log, args.games, args.position_costs, args.seed)
+        print(GameLogReader(args.log).summary())
+    elif args.command == 'summary':
+        print(GameLogReader(args.log).summary())
+    else:
+        reader = GameLogReader(args.log)
+        for game in args.games:
+            reader.print_game(game)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import numpy as np
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from YahtzeeGame import YahtzeeGame, YahtzeeRules, YahtzeeGameState
+from YahtzeeTableCache import YahtzeeTableCache
+
+
+class YahtzeeOptimalSolver:
+    # finds the strategy with the highest expected score by dynamic programming over the whole game.
+    # Between turns, the state of a game is which positions are still open, the upper section subtotal
+    # (capped at 63, since only reaching 63 matters) and whether Bonus Yahtzee is available.
+    # values[state] is the expected number of points still to be scored from that state.
+    VERSION = 1  # increase if a change to the solver changes the values it computes
+    REGULAR_POSITIONS = [pos for pos in range(YahtzeeGame.NUM_SLOTS) if pos != YahtzeeGame.BONUS_YAHTZEE]
+    YAHTZEE_BIT = REGULAR_POSITIONS.index(YahtzeeGame.YAHTZEE)
+    NUM_MASKS = 2 ** len(REGULAR_POSITIONS)
+    NUM_UPPER_VALUES = YahtzeeGameState.UPPER_BONUS_THRESHOLD + 1
+    NUM_STATES = NUM_MASKS * NUM_UPPER_VALUES * 2
+    NUM_COMBINATIONS = 252
+    STATES_PER_CHUNK = 256
+    # a decision for every state, rolls left and roll would take about 1.5 GB, so during play the turn values
+    # are worked out from values for each state a game reaches, and kept for this many recently used states
+    TURN_CACHE_STATES = 256
+    # a Bonus Yahtzee doesn't use up a position, so the value of a state with Bonus Yahtzee available
+    # depends on itself. It's found by iterating until it changes by less than this.
+    BONUS_YAHTZEE_TOLERANCE = 1e-9
+    FILE_PREFIX = 'yahtzee_optimal_values'
+    # set in each worker process by init_worker
+    worker_solver = None
+
+    @classmethod
+    def state_index(cls, mask, upper_section, bonus_yahtzee_available):
+        return (mask * cls.NUM_UPPER_VALUES + upper_section) * 2 + bonus_yahtzee_available
+
+    @classmethod
+    def split_state_index(cls, state):
+        mask = state // (cls.NUM_UPPER_VALUES * 2)
+        upper_section = (state // 2) % cls.NUM_UPPER_VALUES
+        bonus_yahtzee_available = state % 2
+        return mask, upper_section, bonus_yahtzee_available
+
+    @classmethod
+    def game_state_index(cls, game):
+        state = game.state
+        mask = 0
+        for bit, pos in enumerate(cls.REGULAR_POSITIONS):
+            if state.position_mask & (1 << pos):
+                mask |= 1 << bit
+        upper_section = min(state.upper_section, YahtzeeGameState.UPPER_BONUS_THRESHOLD)
+        return cls.state_index(mask, upper_section, (state.position_mask >> YahtzeeGame.BONUS_YAHTZEE) & 1)
+
+    @staticmethod
+    def init_worker(path):
+        YahtzeeOptimalSolver.worker_solver = YahtzeeOptimalSolver(path=path)
+
+    @staticmethod
+    def solve_chunk(states):
+        return YahtzeeOptimalSolver.worker_solver.solve_states(states)
+
+    def __init__(self, rules=None, path=None, num_workers=1):
+        if rules is None:
+            rules = YahtzeeRules.shared()
+        self.rules = rules
+        self.calculate_keep_transitions()
+        if path is None:
+            rules_version = YahtzeeTableCache.rules_version(type(rules))
+            file_name = f'{self.FILE_PREFIX}_v{self.VERSION}_{rules_version}.npy'
+            path = os.path.join(YahtzeeTableCache.cache_directory(), file_name)
+        self.path = path
+        try:
+            self.values = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            self.build_values(path, num_workers)
+            self.values = np.load(path, mmap_mode='r')
+        # turn values for the states recent decisions were made in
+        self.turn_cache = OrderedDict()
+
+    def calculate_keep_transitions(self):
+        rules = self.rules
+        self.keep_roll_probabilities = rules.keep_roll_matrix() / YahtzeeGame.ROLL_OUTCOMES
+        # rolling all 5 dice is keeping nothing, which is keep 0
+        self.first_roll_probabilities = self.keep_roll_probabilities[0]
+        self.roll_keep_ids = rules.roll_keep_ids
+
+    def best_keep_values(self, keep_values):
+        # keep_values has a row for each keep and a column for each state
+        return np.max(keep_values[self.roll_keep_ids], axis=1)
+
+    def position_values(self, states):
+        # value of using each roll for each position: the score plus the value of the state that leads to.
+        # -inf where the position can't be used. Bonus Yahtzee is filled in by solve_states and turn_values,
+        # since it leads back to the same state.
+        masks, upper_section, bonus_yahtzee_available = self.split_state_index(states)
+        position_values = np.full((len(states), YahtzeeGame.NUM_SLOTS, self.NUM_COMBINATIONS), -np.inf)
+        for bit, pos in enumerate(self.REGULAR_POSITIONS):
+            rows = np.flatnonzero(masks & (1 << bit))
+            if len(rows) == 0:
+                continue
+            scores = self.rules.dice_scores[:, pos].astype(np.int64)
+            points = scores
+            next_masks = masks[rows, np.newaxis] & ~(1 << bit)
+            next_upper_section = upper_section[rows, np.newaxis]
+            next_bonus_yahtzee_available = bonus_yahtzee_available[rows, np.newaxis]
+            if pos <= YahtzeeGame.UPPER_SECTION_END:
+                new_upper_section = next_upper_section + scores
+                reached_bonus = (next_upper_section < YahtzeeGameState.UPPER_BONUS_THRESHOLD) & \
+                                (new_upper_section >= YahtzeeGameState.UPPER_BONUS_THRESHOLD)
+                points = scores + YahtzeeGameState.UPPER_BONUS * reached_bonus
+                next_upper_section = np.minimum(new_upper_section, YahtzeeGameState.UPPER_BONUS_THRESHOLD)
+            elif pos == YahtzeeGame.YAHTZEE:
+                # bonus yahtzee not available if we put a zero in yahtzee
+                next_bonus_yahtzee_available = (scores > 0).astype(np.int64)[np.newaxis, :]
+            next_states = self.state_index(next_masks, next_upper_section, next_bonus_yahtzee_available)
+            position_values[rows, pos, :] = points + self.values[next_states]
+        return position_values
+
+    def turn_values(self, position_values):
+        # expected value of each state at the start of its turn, and the expected value of each keep
+        # with 1 and with 2 rolls left. These have a row for each roll or keep and a column for each state.
+        roll_values_0 = np.max(position_values, axis=1).T
+        keep_values_1 = np.dot(self.keep_roll_probabilities, roll_values_0)
+        roll_values_1 = self.best_keep_values(keep_values_1)
+        keep_values_2 = np.dot(self.keep_roll_probabilities, roll_values_1)
+        roll_values_2 = self.best_keep_values(keep_values_2)
+        state_values = np.dot(self.first_roll_probabilities, roll_values_2)
+        return state_values, keep_values_1, keep_values_2
+
+    def bonus_yahtzee_values(self, position_values, states, state_values):
+        bonus_yahtzee_rolls = self.rules.dice_scores[:, YahtzeeGame.BONUS_YAHTZEE] > 0
+        bonus_yahtzee_score = np.max(self.rules.dice_scores[:, YahtzeeGame.BONUS_YAHTZEE])
+        rows = np.flatnonzero(states % 2)
+        position_values[rows[:, np.newaxis], YahtzeeGame.BONUS_YAHTZEE, bonus_yahtzee_rolls] = \
+            bonus_yahtzee_score + state_values[rows, np.newaxis]
+
+    def solve_states(self, states):
+        position_values = self.position_values(states)
+        # without Bonus Yahtzees first, which is a lower bound for states where it's available
+        state_values = self.turn_values(position_values)[0]
+        rows = np.flatnonzero(states % 2)
+        while len(rows) > 0:
+            row_position_values = position_values[rows]
+            self.bonus_yahtzee_values(row_position_values, states[rows], state_values[rows])
+            new_values = self.turn_values(row_position_values)[0]
+            changed = np.abs(new_values - state_values[rows]) > self.BONUS_YAHTZEE_TOLERANCE
+            state_values[rows] = new_values
+            rows = rows[changed]
+        return state_values
+
+    def reachable_states(self):
+        # upper section subtotals that can be reached with each set of used upper section positions
+        num_upper_positions = YahtzeeGame.UPPER_SECTION_END + 1
+        reachable_upper_section = np.zeros((2 ** num_upper_positions, self.NUM_UPPER_VALUES), dtype=bool)
+        for used in range(2 ** num_upper_positions):
+            totals = {0}
+            for pos in range(num_upper_positions):
+                if used & (1 << pos):
+                    totals = {min(total + (pos + 1) * n, YahtzeeGameState.UPPER_BONUS_THRESHOLD)
+                              for total in totals for n in range(6)}
+            reachable_upper_section[used, list(totals)] = True
+        states = np.arange(self.NUM_STATES)
+        masks, upper_section, bonus_yahtzee_available = self.split_state_index(states)
+        used_upper = ~masks & (2 ** num_upper_positions - 1)
+        yahtzee_used = (masks & (1 << self.YAHTZEE_BIT)) == 0
+        reachable = reachable_upper_section[used_upper, upper_section] & (yahtzee_used | (bonus_yahtzee_available == 0))
+        num_open = np.zeros(self.NUM_STATES, dtype=np.int8)
+        for bit in range(len(self.REGULAR_POSITIONS)):
+            num_open += (masks >> bit) & 1
+        return states[reachable], num_open[reachable]
+
+    def build_values(self, path, num_workers=1):
+        YahtzeeTableCache.write_path_atomically(path, lambda temp_path: self.solve_values(temp_path, num_workers),
+                                                prefix=self.FILE_PREFIX)
+
+    def solve_values(self, temp_path, num_workers):
+        # works out the values into a new file at temp_path
+        self.values = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.float64, shape=(self.NUM_STATES,))
+        # states that can't be reached are left as nan
+        self.values[:] = np.nan
+        # game over when no positions are open
+        self.values[0:self.NUM_UPPER_VALUES * 2] = 0
+        self.values.flush()
+        states, num_open = self.reachable_states()
+        executor = None
+        if num_workers > 1:
+            executor = ProcessPoolExecutor(num_workers, initializer=self.init_worker, initargs=(temp_path,))
+            solve_chunk = self.solve_chunk
+        else:
+            solve_chunk = self.solve_states
+        try:
+            # states with fewer open positions first, since each turn uses up a position
+            for num_positions in range(1, len(self.REGULAR_POSITIONS) + 1):
+                level_states = states[num_open == num_positions]
+                chunks = np.array_split(level_states, -(-len(level_states) // self.STATES_PER_CHUNK))
+                if executor is None:
+                    chunk_values = map(solve_chunk, chunks)
+                else:
+                    chunk_values = executor.map(solve_chunk, chunks)
+                for chunk, values in zip(chunks, chunk_values):
+                    self.values[chunk] = values
+                # workers read this level from the file when solving the next one
+                self.values.flush()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        del self.values
+
+    def expected_score(self):
+        all_open = self.NUM_MASKS - 1
+        return self.values[self.state_index(all_open, 0, 0)]
+
+    def state_turn_values(self, state):
+        turn_values = self.turn_cache.get(state)
+        if turn_values is not None:
+            self.turn_cache.move_to_end(state)
+        else:
+            states = np.array([state])
+            position_values = self.position_values(states)
+            self.bonus_yahtzee_values(position_values, states, self.values[states])
+            keep_values = self.turn_values(position_values)[1:]
+            turn_values = (position_values[0], keep_values[0][:, 0], keep_values[1][:, 0])
+            if len(self.turn_cache) >= self.TURN_CACHE_STATES:
+                # the least recently used state
+                self.turn_cache.popitem(last=False)
+            self.turn_cache[state] = turn_values
+        return turn_values
+
+    def recommended_next_step(self, game, dice_values):
+        # same return values as YahtzeeGame.recommended_next_step
+        position_values, keep_values_1, keep_values_2 = self.state_turn_values(self.game_state_index(game))
+        dice_value_id = self.rules.dice_values_to_id(dice_values)
+        best_position = np.argmax(position_values[:, dice_value_id])
+        if game.state.rolls_left == 0:
+            return best_position, None
+        keep_values = keep_values_1 if game.state.rolls_left == 1 else keep_values_2
+        roll_keep_ids = self.roll_keep_ids[dice_value_id]
+        best_keep_id = roll_keep_ids[np.argmax(keep_values[roll_keep_ids])]
+        num_fixed = self.rules.keep_sizes[best_keep_id]
+        if num_fixed == 5:
+            return best_position, None
+        else:
+            return None, list(self.rules.keep_dice_values[best_keep_id, 0:num_fixed])
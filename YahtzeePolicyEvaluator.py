@@ -0,0 +1,165 @@
+import numpy as np
+from YahtzeeGame import YahtzeeGame, YahtzeeRules, YahtzeeGameState
+
+
+class YahtzeePolicyEvaluator:
+    # works out exactly how well the strategy YahtzeeGame.recommended_next_step follows for a position_costs
+    # does, without playing any games. Decisions depend only on the open positions, the rolls left and the
+    # roll, so a game is a Markov chain over the open positions, and a turn's outcome only depends on
+    # which positions are open. Turns always close a position, except a Bonus Yahtzee, so the chain is
+    # worked through from all positions open to none, for all the open positions at each step at once.
+    # The upper section subtotal (capped at 63) is carried along, for the chance of the upper bonus.
+    NUM_UPPER_VALUES = YahtzeeGameState.UPPER_BONUS_THRESHOLD + 1
+    NUM_MASKS = 2 ** YahtzeeGame.NUM_SLOTS
+    REGULAR_POSITIONS_MASK = YahtzeeGameState.ALL_POSITIONS_MASK & ~YahtzeeGameState.BONUS_YAHTZEE_BIT
+    # a turn's outcome is its position and how many of that position's dice counted (upper section),
+    # or for Yahtzee whether it scored. Other positions only have one outcome each.
+    OUTCOMES_PER_POSITION = 6
+    NUM_OUTCOMES = YahtzeeGame.NUM_SLOTS * OUTCOMES_PER_POSITION
+    MASKS_PER_CHUNK = 256  # masks worked on at once, which limits the size of the arrays
+    # added to the value of positions that can't be used, so they're never the best
+    UNUSABLE = -10000
+
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = YahtzeeRules.shared()
+        self.rules = rules
+        self.num_rolls = len(rules.dice_scores)
+        self.num_keeps = len(rules.keep_starts)
+        # probabilities of each roll after each keep. Rolling all 5 dice is keeping nothing, which is keep 0.
+        self.keep_roll_weights = rules.keep_roll_matrix()
+        self.keep_roll_probabilities = self.keep_roll_weights / YahtzeeGame.ROLL_OUTCOMES
+        self.bonus_yahtzee_rolls = rules.dice_scores[:, YahtzeeGame.BONUS_YAHTZEE] > 0
+        self.roll_outcomes = self.calculate_roll_outcomes()
+        # layers of masks with the same number of regular positions open, from all open down to one
+        masks = np.arange(self.NUM_MASKS)
+        open_positions = np.array([bin(mask & self.REGULAR_POSITIONS_MASK).count('1') for mask in masks])
+        self.mask_layers = [masks[open_positions == num_open] for num_open in range(YahtzeeGame.NUM_SLOTS - 1, 0, -1)]
+        self.position_means = None
+        self.upper_distribution = None
+        self.expected_score = None
+
+    def calculate_roll_outcomes(self):
+        # the outcome of using each roll for each position
+        dice_scores = self.rules.dice_scores.astype(np.int64)
+        outcome_counts = np.zeros_like(dice_scores)
+        for pos in range(YahtzeeGame.UPPER_SECTION_END + 1):
+            outcome_counts[:, pos] = dice_scores[:, pos] // (pos + 1)
+        outcome_counts[:, YahtzeeGame.YAHTZEE] = dice_scores[:, YahtzeeGame.YAHTZEE] > 0
+        return np.arange(YahtzeeGame.NUM_SLOTS) * self.OUTCOMES_PER_POSITION + outcome_counts
+
+    def turn_policy(self, masks, position_costs):
+        # for each mask and roll, the position best_position picks, and whether best_dice_to_fix would
+        # rather roll again, and with which keep. Same rules as YahtzeeBatchGame.best_positions and best_keeps.
+        # Arrays are indexed by position or keep first, so each step of the loops works on contiguous rows.
+        position_values = self.rules.dice_scores.T.astype(np.int16) - position_costs[:, np.newaxis]
+        # can only use the Bonus Yahtzee slot if we actually have a bonus yahtzee
+        position_values[YahtzeeGame.BONUS_YAHTZEE, ~self.bonus_yahtzee_rolls] = self.UNUSABLE
+        penalties = np.where(self.rules.available_positions[masks].T == 1, 0, self.UNUSABLE).astype(np.int16)
+        # make sure that infeasible numbers are not the max
+        feasible_values = position_values[:, np.newaxis, :] + penalties[:, :, np.newaxis]
+        # the first position with the highest value, like np.argmax.
+        # The best position's value is the roll value that YahtzeeGame.roll_values works out.
+        positions = np.zeros(feasible_values.shape[1:], dtype=np.int64)
+        roll_values = feasible_values[0].copy()
+        for pos in range(1, YahtzeeGame.NUM_SLOTS):
+            positions[feasible_values[pos] > roll_values] = pos
+            np.maximum(roll_values, feasible_values[pos], out=roll_values)
+        # weights and roll values are whole numbers, so these sums are exact and match the games.
+        # These are indexed by keep or roll, then mask.
+        keep_values = np.dot(self.keep_roll_weights, roll_values.T) / YahtzeeGame.ROLL_OUTCOMES
+        # the first of each roll's keeps with the highest expected value
+        roll_keep_ids = self.rules.roll_keep_ids
+        best_keeps = np.repeat(roll_keep_ids[:, 0:1], len(masks), axis=1)
+        best_values = keep_values[roll_keep_ids[:, 0]]
+        for keep in range(1, YahtzeeGame.MAX_KEEPS):
+            values = keep_values[roll_keep_ids[:, keep]]
+            np.copyto(best_keeps, roll_keep_ids[:, keep:keep + 1], where=values > best_values)
+            np.maximum(best_values, values, out=best_values)
+        roll_again = best_values.T > roll_values
+        return positions, roll_again, best_keeps.T
+
+    def turn_outcomes(self, masks, position_costs):
+        # probability of each roll being the one that's used, with a row for each mask, and the position it's used for
+        positions, roll_again, best_keeps = self.turn_policy(masks, position_costs)
+        rows = np.arange(len(masks))[:, np.newaxis]
+        roll_probabilities = np.broadcast_to(self.keep_roll_probabilities[0], positions.shape)
+        used = np.zeros(positions.shape)
+        for reroll in range(2):
+            used += np.where(roll_again, 0, roll_probabilities)
+            keep_probabilities = np.bincount((rows * self.num_keeps + best_keeps)[roll_again],
+                                             weights=roll_probabilities[roll_again],
+                                             minlength=len(masks) * self.num_keeps)
+            roll_probabilities = np.dot(keep_probabilities.reshape(len(masks), self.num_keeps),
+                                        self.keep_roll_probabilities)
+        # after the third roll, every roll is used
+        used += roll_probabilities
+        return used, positions
+
+    def evaluate(self, position_costs):
+        # returns the expected score. Also sets position_means, the expected score in each position,
+        # and upper_distribution, the probability of each upper section subtotal, capped at 63.
+        position_costs = np.array(position_costs, dtype=np.int16)
+        # probability of starting a turn with each mask and upper section subtotal
+        reach = np.zeros((self.NUM_MASKS, self.NUM_UPPER_VALUES))
+        reach[YahtzeeGameState.NEW_GAME_MASK, 0] = 1
+        position_means = np.zeros(YahtzeeGame.NUM_SLOTS)
+        for layer in self.mask_layers:
+            # turns never lead to masks in the same layer, so its masks can be done in any order
+            layer = layer[np.any(reach[layer] > 0, axis=1)]
+            for start in range(0, len(layer), self.MASKS_PER_CHUNK):
+                self.evaluate_masks(layer[start:start + self.MASKS_PER_CHUNK], position_costs, reach, position_means)
+        # the game is over once all the regular positions are used
+        finished = np.flatnonzero((np.arange(self.NUM_MASKS) & self.REGULAR_POSITIONS_MASK) == 0)
+        self.upper_distribution = np.sum(reach[finished], axis=0)
+        self.position_means = position_means
+        self.expected_score = np.sum(position_means) + YahtzeeGameState.UPPER_BONUS * self.upper_bonus_probability()
+        return self.expected_score
+
+    def evaluate_masks(self, masks, position_costs, reach, position_means):
+        # adds the turns starting from masks to position_means, and their probabilities to the masks they lead to
+        used, positions = self.turn_outcomes(masks, position_costs)
+        scores = self.rules.dice_scores[np.arange(self.num_rolls), positions]
+        # a Bonus Yahtzee leads back to the same mask, so each mask is visited 1 / (1 - that chance) times
+        bonus_yahtzee = positions == YahtzeeGame.BONUS_YAHTZEE
+        visits = 1 / (1 - np.sum(np.where(bonus_yahtzee, used, 0), axis=1))
+        mask_reach = reach[masks]
+        turns = np.sum(mask_reach, axis=1) * visits
+        position_means += np.bincount(positions.ravel(), weights=(used * scores * turns[:, np.newaxis]).ravel(),
+                                      minlength=YahtzeeGame.NUM_SLOTS)
+        # probability of each outcome, over all the visits to each mask
+        rows = np.arange(len(masks))[:, np.newaxis]
+        outcomes = self.roll_outcomes[np.arange(self.num_rolls), positions]
+        outcome_probabilities = np.bincount((rows * self.NUM_OUTCOMES + outcomes).ravel(), weights=used.ravel(),
+                                            minlength=len(masks) * self.NUM_OUTCOMES)
+        outcome_probabilities = outcome_probabilities.reshape(len(masks), self.NUM_OUTCOMES) * visits[:, np.newaxis]
+        for outcome in np.flatnonzero(np.any(outcome_probabilities > 0, axis=0)):
+            pos, count = divmod(outcome, self.OUTCOMES_PER_POSITION)
+            if pos == YahtzeeGame.BONUS_YAHTZEE:
+                continue
+            # only masks with pos open, so each leads to a different next mask and there's no need for np.add.at
+            outcome_rows = np.flatnonzero(outcome_probabilities[:, outcome] > 0)
+            next_masks = masks[outcome_rows] & ~(1 << pos)
+            if pos == YahtzeeGame.YAHTZEE and count > 0:
+                # if this was a yahtzee, then we can now score bonus yahtzees
+                next_masks |= YahtzeeGameState.BONUS_YAHTZEE_BIT
+            next_reach = mask_reach[outcome_rows] * outcome_probabilities[outcome_rows, outcome, np.newaxis]
+            if pos <= YahtzeeGame.UPPER_SECTION_END and count > 0:
+                # the upper section subtotal goes up, and stays at 63 once it gets there
+                shift = count * (pos + 1)
+                shifted = np.zeros_like(next_reach)
+                shifted[:, shift:] = next_reach[:, 0:self.NUM_UPPER_VALUES - shift]
+                shifted[:, YahtzeeGameState.UPPER_BONUS_THRESHOLD] += np.sum(next_reach[:, self.NUM_UPPER_VALUES - shift:],
+                                                                             axis=1)
+                next_reach = shifted
+            reach[next_masks] += next_reach
+
+    def upper_bonus_probability(self):
+        return self.upper_distribution[YahtzeeGameState.UPPER_BONUS_THRESHOLD]
+
+    def summary(self):
+        lines = [f'expected score {np.around(self.expected_score, 2)}, '
+                 f'upper bonus probability {np.around(100 * self.upper_bonus_probability(), 1)}%']
+        for pos in range(YahtzeeGame.NUM_SLOTS):
+            lines.append(f'{YahtzeeGame.position_name(pos):<16}{np.around(self.position_means[pos], 2):>8}')
+        return '\n'.join(lines)
@@ -1,58 +1,289 @@
 import numpy as np
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from YahtzeeGame import YahtzeeGame
+from YahtzeeBatchGame import YahtzeeBatchGame
+from DiceSet import DiceSet
+from DiceTape import DiceTape
+from YahtzeeDecisionCache import YahtzeeDecisionCache
+from YahtzeePolicyEvaluator import YahtzeePolicyEvaluator
+from YahtzeeProfiler import YahtzeeProfiler
+from YahtzeeScoreStatistics import YahtzeeScoreStatistics
 
 
 class YahtzeePositionCostOptimizer:
+    # games are played in chunks of this size, each with its own random stream,
+    # so results for a given seed don't depend on how many workers play the chunks
+    GAMES_PER_CHUNK = 100
+    # when racing, a try is dropped once its average score plus this many standard errors
+    # of the difference is still below the best average score
+    RACING_Z = 2.0
+    # set in each worker process by init_worker, so the tables are only built once per process
+    worker_batch_game = None
+
     @staticmethod
     def css(input_list):
         # convert a list to a comma-separated string
         return f'[{", ".join(str(i) for i in input_list)}]'
 
     @staticmethod
-    def random_change(position_costs, change_size):
-        position_to_change = np.random.randint(0, YahtzeeGame.NUM_SLOTS)
+    def random_change(position_costs, change_size, rng):
+        position_to_change = rng.integers(0, YahtzeeGame.NUM_SLOTS)
         choices = np.array([-1, 1], dtype=np.int8)
-        change_direction = np.random.choice(choices)
+        change_direction = rng.choice(choices)
         new_position_costs = np.copy(position_costs)
         new_position_costs[position_to_change] += change_size * change_direction
         return new_position_costs
 
-    def try_random_position_costs(self, num_tries, num_iterations_each_try, dice_type, position_costs=None, debug=False, dice_format=None):
-        change_size = 1
-        best_average_score = None
-        best_position_costs = None
+    @staticmethod
+    def init_worker(dice_tape_path=None, profile=False):
+        if profile:
+            YahtzeeProfiler.enable(report=False)
+        dice_tape = None if dice_tape_path is None else DiceTape(dice_tape_path)
+        YahtzeePositionCostOptimizer.worker_batch_game = YahtzeeBatchGame(dice_tape=dice_tape)
+
+    @staticmethod
+    def play_games_chunk(position_costs, num_games, seed_sequence, first_tape_game, position_scores=False):
+        # returns each game's total score, or if position_scores, each game's score for each position,
+        # and the profiler's stats for playing them, which only get to the main process this way
+        batch_game = YahtzeePositionCostOptimizer.worker_batch_game
+        batch_game.rng = np.random.default_rng(seed_sequence)
+        game_scores = batch_game.play_games(num_games, position_costs, first_tape_game)
+        if position_scores:
+            game_scores = batch_game.scores.copy()
+        return game_scores, YahtzeeProfiler.take_method_stats()
+
+    def __init__(self, num_workers=1, seed=None, decision_cache_size=0, racing_round_games=0, dice_tape=None,
+                 evaluation_store=None, collect_statistics=False):
+        self.num_workers = num_workers
+        # if more than 0, games are played one at a time with a YahtzeeDecisionCache of this size,
+        # instead of in batches. Games with manual dice or debug are always played one at a time.
+        self.decision_cache_size = decision_cache_size
+        # if more than 0, each try is played in rounds of this many games, and stops early
+        # once it's clearly worse than the best position costs so far
+        self.racing_round_games = racing_round_games
+        self.games_played = 0
+        # if set, a DiceTape that replaces automatic dice. Every try plays the same games from it,
+        # so tries are compared on the same dice.
+        self.dice_tape = dice_tape
+        # if set, a YahtzeeEvaluationStore with the results of earlier tries, which are used instead of
+        # playing those games again, and which the best earlier try is resumed from
+        self.evaluation_store = evaluation_store
+        # if set, a YahtzeeScoreStatistics is kept for the games of each try, and printed for the best one
+        self.collect_statistics = collect_statistics
+        self.try_statistics = None
+        self.best_statistics = None
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.rng = np.random.default_rng(self.seed_sequence.spawn(1)[0])
+        self.executor = None
+        self.position_costs = None
+
+    def play_games(self, position_costs, num_games, first_tape_game=0):
+        # the statistics of the current try get the games too, if they're being collected
+        num_chunks = -(-num_games // self.GAMES_PER_CHUNK)
+        chunk_sizes = [min(self.GAMES_PER_CHUNK, num_games - k * self.GAMES_PER_CHUNK) for k in range(num_chunks)]
+        chunk_seeds = self.seed_sequence.spawn(num_chunks)
+        chunk_tape_games = [first_tape_game + k * self.GAMES_PER_CHUNK for k in range(num_chunks)]
+        position_scores = itertools.repeat(self.try_statistics is not None)
+        if self.executor is None:
+            chunk_scores = map(self.play_games_chunk, itertools.repeat(position_costs), chunk_sizes, chunk_seeds,
+                               chunk_tape_games, position_scores)
+        else:
+            chunk_scores = self.executor.map(self.play_games_chunk, itertools.repeat(position_costs),
+                                             chunk_sizes, chunk_seeds, chunk_tape_games, position_scores)
+        chunk_results = list(chunk_scores)
+        for scores, method_stats in chunk_results:
+            YahtzeeProfiler.add_method_stats(method_stats)
+        game_scores = np.concatenate([scores for scores, method_stats in chunk_results])
+        if self.try_statistics is not None:
+            self.try_statistics.add_games(game_scores)
+            game_scores = YahtzeeScoreStatistics.game_columns(game_scores)[:, YahtzeeScoreStatistics.TOTAL]
+        return game_scores
+
+    @staticmethod
+    def mean_and_sem(game_scores):
+        if len(game_scores) == 1:
+            return np.mean(game_scores), 0
+        # standard error of the mean, using unbiased variance
+        return np.mean(game_scores), np.std(game_scores, ddof=1) / len(game_scores)**0.5
+
+    def play_try_games(self, yg, position_costs, num_games, first_tape_game=0):
+        # yg is None when games are played in batches
+        self.games_played += num_games
+        if yg is None:
+            return self.play_games(position_costs, num_games, first_tape_game)
+        game_scores = np.zeros(num_games, dtype=np.int32)
+        for j in range(num_games):
+            yg.reset_game(position_costs)
+            yg.dice.start_tape_game(first_tape_game + j)
+            game_scores[j] = yg.play_game()
+            if self.try_statistics is not None:
+                self.try_statistics.add_games(yg.scores)
+        return game_scores
+
+    def clearly_worse(self, game_scores, best_game_scores, best_average_score, best_score_sem):
+        if best_game_scores is not None:
+            # played on the same dice from a tape, so compare game by game
+            difference, sem = self.mean_and_sem(game_scores - best_game_scores[0:len(game_scores)])
+            return difference + self.RACING_Z * sem < 0
+        average_score, sem = self.mean_and_sem(game_scores)
+        return average_score + self.RACING_Z * np.hypot(sem, best_score_sem) < best_average_score
+
+    def race_try(self, yg, position_costs, max_games, best_game_scores, best_average_score, best_score_sem):
+        # plays games in rounds until max_games, or until position_costs is clearly worse than the best so far.
+        # The games go to tries that are close to the best.
+        game_scores = np.zeros(0, dtype=np.int32)
+        while len(game_scores) < max_games:
+            num_games = min(self.racing_round_games, max_games - len(game_scores))
+            game_scores = np.concatenate([game_scores,
+                                          self.play_try_games(yg, position_costs, num_games, len(game_scores))])
+            if best_average_score is not None and \
+                    self.clearly_worse(game_scores, best_game_scores, best_average_score, best_score_sem):
+                break
+        return game_scores
+
+    def starting_position_costs(self):
+        # here's a good starting point
+        position_costs = self.rng.integers(0, 30, YahtzeeGame.NUM_SLOTS)
+        upper_section_cost_multiplier = self.rng.integers(1, 4)
+        for k in range(YahtzeeGame.UPPER_SECTION_END + 1):
+            position_costs[k] = upper_section_cost_multiplier * (k + 1)
+        position_costs[YahtzeeGame.CHANCE] = 10
+        position_costs[YahtzeeGame.THREE_OF_A_KIND] = position_costs[YahtzeeGame.CHANCE] - 1
+        position_costs[YahtzeeGame.FOUR_OF_A_KIND] = position_costs[YahtzeeGame.THREE_OF_A_KIND] - 1
+        position_costs[YahtzeeGame.LARGE_STRAIGHT] = 0
+        position_costs[YahtzeeGame.YAHTZEE] = 0
+        position_costs[YahtzeeGame.BONUS_YAHTZEE] = 0
+        return position_costs
+
+    def try_position_costs_exactly(self, num_tries, position_costs=None):
+        # the same search as try_random_position_costs, but each try is scored by its exact expected score,
+        # from YahtzeePolicyEvaluator, instead of by playing games. There's no noise, so a try is better
+        # only if it really is better.
         if position_costs is None:
-            # here's a good starting point
-            position_costs = np.random.randint(0, 30, YahtzeeGame.NUM_SLOTS)
-            upper_section_cost_multiplier = np.random.randint(1, 4)
-            for k in range(YahtzeeGame.UPPER_SECTION_END + 1):
-                position_costs[k] = upper_section_cost_multiplier * (k + 1)
-            position_costs[YahtzeeGame.CHANCE] = 10
-            position_costs[YahtzeeGame.THREE_OF_A_KIND] = position_costs[YahtzeeGame.CHANCE] - 1
-            position_costs[YahtzeeGame.FOUR_OF_A_KIND] = position_costs[YahtzeeGame.THREE_OF_A_KIND] - 1
-            position_costs[YahtzeeGame.LARGE_STRAIGHT] = 0
-            position_costs[YahtzeeGame.YAHTZEE] = 0
-            position_costs[YahtzeeGame.BONUS_YAHTZEE] = 0
-        yg = YahtzeeGame(dice_type, position_costs, debug, dice_format=dice_format)
+            position_costs = self.starting_position_costs()
+        policy_evaluator = YahtzeePolicyEvaluator()
+        best_expected_score = None
+        best_position_costs = None
         for i in range(num_tries):
-            game_scores = np.zeros(num_iterations_each_try, dtype=np.int32)
-            for j in range(num_iterations_each_try):
-                yg.reset_game(position_costs)
-                game_scores[j] = yg.play_game()
-            average_score = np.mean(game_scores)
-            if len(game_scores) == 1:
-                sem = 0
-            else:
-                sem = np.std(game_scores, ddof=1) / len(game_scores)**0.5  # standard error of the mean, using unbiased variance
-            if best_average_score is None or average_score > best_average_score:
-                best_average_score = average_score
-                best_score_sem = sem
+            candidate_start = time.perf_counter()
+            expected_score = policy_evaluator.evaluate(position_costs)
+            YahtzeeProfiler.record_candidate(0, time.perf_counter() - candidate_start)
+            if best_expected_score is None or expected_score > best_expected_score:
+                best_expected_score = expected_score
                 best_position_costs = position_costs
             print(f'On try {i} with position costs {self.css(position_costs)}')
-            print(f'average score = {np.around(average_score,1)} +/- {np.around(sem, 1)}, '
-                  f'best average score so far = {np.around(best_average_score,1)} +/-{np.around(best_score_sem, 1)}')
+            print(f'expected score = {np.around(expected_score, 2)}, '
+                  f'best expected score so far = {np.around(best_expected_score, 2)}')
             # try a small change from our best position_costs so far
-            position_costs = self.random_change(best_position_costs, change_size)
+            position_costs = self.random_change(best_position_costs, 1, self.rng)
+        print(f'best expected score = {np.around(best_expected_score, 2)}')
+        print(f'best position costs = {self.css(best_position_costs)}')
+        policy_evaluator.evaluate(best_position_costs)
+        print(policy_evaluator.summary())
+        self.position_costs = best_position_costs
+
+    def try_random_position_costs(self, num_tries, num_iterations_each_try, dice_type, position_costs=None, debug=False, dice_format=None):
+        change_size = 1
+        best_average_score = None
+        best_score_sem = None
+        best_game_scores = None
+        best_position_costs = None
+        if position_costs is None:
+            position_costs = self.starting_position_costs()
+        dice_tape_path = None
+        if self.dice_tape is not None and dice_type == DiceSet.DICE_TYPE_AUTO:
+            if self.dice_tape.num_games < num_iterations_each_try:
+                raise ValueError(f'the dice tape has {self.dice_tape.num_games} games, '
+                                 f'fewer than the {num_iterations_each_try} games in each try')
+            dice_type = DiceSet.DICE_TYPE_TAPE
+            dice_tape_path = self.dice_tape.path
+        use_batch = dice_type != DiceSet.DICE_TYPE_MANUAL and not debug and self.decision_cache_size == 0
+        evaluation_store = None
+        if dice_type != DiceSet.DICE_TYPE_MANUAL:
+            evaluation_store = self.evaluation_store
+            dice_source = 'random' if dice_tape_path is None else f'tape {os.path.basename(dice_tape_path)}'
+        if evaluation_store is not None:
+            stored_position_costs, stored_entry = evaluation_store.best(dice_source, num_iterations_each_try)
+            if stored_position_costs is not None:
+                print(f'resuming from stored position costs {self.css(stored_position_costs)}, '
+                      f'average score = {np.around(stored_entry["mean"], 1)}')
+                position_costs = stored_position_costs
+        decision_cache = None
+        yg = None
+        if not use_batch:
+            if self.decision_cache_size > 0:
+                decision_cache = YahtzeeDecisionCache(self.decision_cache_size)
+            yg = YahtzeeGame(dice_type, position_costs, debug, dice_format=dice_format, decision_cache=decision_cache,
+                             dice_tape=self.dice_tape)
+        elif self.num_workers > 1:
+            # each worker plays whole chunks of a try's games
+            self.executor = ProcessPoolExecutor(self.num_workers, initializer=self.init_worker,
+                                                initargs=(dice_tape_path, YahtzeeProfiler.enabled))
+        else:
+            self.init_worker(dice_tape_path)
+        try:
+            for i in range(num_tries):
+                candidate_start = time.perf_counter()
+                if self.collect_statistics:
+                    self.try_statistics = YahtzeeScoreStatistics()
+                stored_games = 0
+                if evaluation_store is not None:
+                    entry = evaluation_store.get(dice_source, position_costs)
+                    if entry is not None:
+                        stored_games = entry['games']
+                game_scores = np.zeros(0, dtype=np.int32)
+                if self.racing_round_games > 0 and stored_games == 0:
+                    game_scores = self.race_try(yg, position_costs, num_iterations_each_try, best_game_scores,
+                                                best_average_score, best_score_sem)
+                elif stored_games < num_iterations_each_try:
+                    # the games not played yet. With a dice tape, they carry on from where the stored games stopped.
+                    game_scores = self.play_try_games(yg, position_costs, num_iterations_each_try - stored_games,
+                                                      stored_games)
+                YahtzeeProfiler.record_candidate(len(game_scores), time.perf_counter() - candidate_start)
+                if evaluation_store is not None:
+                    entry = evaluation_store.add(dice_source, position_costs, game_scores)
+                    games = entry['games']
+                    average_score, sem = evaluation_store.mean_and_sem(entry)
+                else:
+                    games = len(game_scores)
+                    average_score, sem = self.mean_and_sem(game_scores)
+                if games >= num_iterations_each_try and \
+                        (best_average_score is None or average_score > best_average_score):
+                    best_average_score = average_score
+                    best_score_sem = sem
+                    # kept for comparing game by game, if all of them were played on a dice tape just now
+                    best_game_scores = game_scores if dice_tape_path is not None and len(game_scores) == games else None
+                    best_position_costs = position_costs
+                    # only if all of the try's games were played just now
+                    self.best_statistics = self.try_statistics if games == len(game_scores) else None
+                print(f'On try {i} with position costs {self.css(position_costs)}')
+                if stored_games > 0:
+                    print(f'{stored_games} games from the evaluation store')
+                if games < num_iterations_each_try:
+                    print(f'dropped after {games} games')
+                print(f'average score = {np.around(average_score,1)} +/- {np.around(sem, 1)}, '
+                      f'best average score so far = {np.around(best_average_score,1)} +/-{np.around(best_score_sem, 1)}')
+                if best_game_scores is not None and best_game_scores is not game_scores and \
+                        stored_games == 0 and len(game_scores) > 0:
+                    difference, difference_sem = self.mean_and_sem(game_scores - best_game_scores[0:len(game_scores)])
+                    print(f'difference from best on the same dice = {np.around(difference, 1)} '
+                          f'+/- {np.around(difference_sem, 1)}')
+                if decision_cache is not None:
+                    print(decision_cache.summary())
+                # try a small change from our best position_costs so far
+                position_costs = self.random_change(best_position_costs, change_size, self.rng)
+        finally:
+            self.try_statistics = None
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
         print(f'best average score = {np.around(best_average_score,1)} +/- {np.around(best_score_sem,1)}')
         print(f'best position costs = {self.css(best_position_costs)}')
-        self.position_costs = best_position_costs
\ No newline at end of file
+        print(f'{self.games_played} games played')
+        if self.best_statistics is not None:
+            print(f'statistics for the best position costs:')
+            print(self.best_statistics.summary())
+        self.position_costs = best_position_costs
@@ -0,0 +1,142 @@
+import atexit
+import functools
+import json
+import os
+import time
+
+
+class YahtzeeProfiler:
+    # counts calls and time spent in the engine's hot methods, plus games and optimizer candidates.
+    # Methods are only wrapped with timers while profiling is enabled, so there's no cost when it's off.
+    # Set the YAHTZEE_PROFILE environment variable to 1 to print a summary table at exit,
+    # or to a file name ending in .json to write the results there.
+    ENVIRONMENT_VARIABLE = 'YAHTZEE_PROFILE'
+    enabled = False
+    output = None
+    registered_methods = []  # (class, method name) pairs to time when enabled
+    original_methods = {}
+    method_stats = {}  # name -> [calls, seconds]
+    games = 0
+    game_seconds = 0.0
+    candidate_seconds = []
+
+    @classmethod
+    def register(cls, owner, method_names):
+        for method_name in method_names:
+            cls.registered_methods.append((owner, method_name))
+            if cls.enabled:
+                cls.wrap(owner, method_name)
+
+    @classmethod
+    def wrap(cls, owner, method_name):
+        name = f'{owner.__name__}.{method_name}'
+        if name in cls.original_methods:
+            return
+        method = getattr(owner, method_name)
+        cls.original_methods[name] = (owner, method_name, method)
+        stats = cls.method_stats.setdefault(name, [0, 0.0])
+
+        @functools.wraps(method)
+        def timed_method(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats[0] += 1
+                stats[1] += time.perf_counter() - start
+
+        setattr(owner, method_name, timed_method)
+
+    @classmethod
+    def enable(cls, output=None, report=True):
+        # worker processes don't report, they send their stats to the main process with take_method_stats
+        if not cls.enabled:
+            cls.enabled = True
+            cls.output = output
+            for owner, method_name in cls.registered_methods:
+                cls.wrap(owner, method_name)
+            if report:
+                atexit.register(cls.report)
+
+    @classmethod
+    def disable(cls):
+        for owner, method_name, method in cls.original_methods.values():
+            setattr(owner, method_name, method)
+        cls.original_methods = {}
+        cls.enabled = False
+        atexit.unregister(cls.report)
+
+    @classmethod
+    def enable_from_environment(cls):
+        setting = os.environ.get(cls.ENVIRONMENT_VARIABLE, '')
+        if setting.endswith('.json'):
+            cls.enable(setting)
+        elif setting not in ['', '0']:
+            cls.enable()
+
+    @classmethod
+    def take_method_stats(cls):
+        # the stats since the last call, which are then cleared, for sending from a worker process to the main one
+        taken = {}
+        for name, stats in cls.method_stats.items():
+            if stats[0] > 0:
+                taken[name] = tuple(stats)
+                # cleared in place, since the timed methods hold on to these lists
+                stats[0] = 0
+                stats[1] = 0.0
+        return taken
+
+    @classmethod
+    def add_method_stats(cls, taken):
+        for name, (calls, seconds) in taken.items():
+            stats = cls.method_stats.setdefault(name, [0, 0.0])
+            stats[0] += calls
+            stats[1] += seconds
+
+    @classmethod
+    def record_games(cls, num_games, seconds):
+        if cls.enabled:
+            cls.games += num_games
+            cls.game_seconds += seconds
+
+    @classmethod
+    def record_candidate(cls, num_games, seconds):
+        # one optimizer candidate, evaluated by playing num_games games, or by working out its score exactly
+        if cls.enabled:
+            cls.candidate_seconds.append(seconds)
+            if num_games > 0:
+                cls.record_games(num_games, seconds)
+
+    @classmethod
+    def results(cls):
+        methods = {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in cls.method_stats.items()}
+        results = {'methods': methods, 'games': cls.games, 'game_seconds': cls.game_seconds,
+                   'candidates': len(cls.candidate_seconds), 'candidate_seconds': sum(cls.candidate_seconds)}
+        if cls.game_seconds > 0:
+            results['games_per_second'] = cls.games / cls.game_seconds
+        if len(cls.candidate_seconds) > 0:
+            results['seconds_per_candidate'] = sum(cls.candidate_seconds) / len(cls.candidate_seconds)
+        return results
+
+    @classmethod
+    def report(cls):
+        results = cls.results()
+        if cls.output is not None:
+            with open(cls.output, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f'profile written to {cls.output}')
+            return
+        print(f'===========PROFILE================')
+        print(f'{"method":<40}{"calls":>12}{"total s":>12}{"us/call":>12}')
+        for name, stats in sorted(results['methods'].items(), key=lambda item: -item[1]['seconds']):
+            calls = stats['calls']
+            us_per_call = 1e6 * stats['seconds'] / calls if calls > 0 else 0
+            print(f'{name:<40}{calls:>12}{stats["seconds"]:>12.3f}{us_per_call:>12.1f}')
+        if 'games_per_second' in results:
+            print(f'games simulated: {results["games"]}, {results["games_per_second"]:.1f} games/sec')
+        if 'seconds_per_candidate' in results:
+            print(f'candidates evaluated: {results["candidates"]}, '
+                  f'{1000 * results["seconds_per_candidate"]:.1f} ms per candidate')
+
+
+YahtzeeProfiler.enable_from_environment()
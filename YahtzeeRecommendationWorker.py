@@ -0,0 +1,138 @@
+import itertools
+import queue
+import threading
+from DiceSet import DiceSet
+from YahtzeeGame import YahtzeeGame
+
+
+class YahtzeeRecommendationWorker:
+    # keeps the YahtzeeGame for a GUI on a background thread, so loading the tables and working out
+    # recommendations never holds up the window. The GUI sends rolls with dice_rolled, and picks up
+    # the results with results, for example from a Tk after() callback.
+    # While the player is rolling, the worker works out the recommendation for every way the dice
+    # being rolled could come up, so when the roll is entered the answer is usually already there.
+    READY = 'ready'
+    RECOMMENDATION = 'recommendation'
+    ERROR = 'error'
+
+    def __init__(self, position_costs=None, debug=False):
+        self.position_costs = position_costs
+        self.debug = debug
+        self.requests = queue.Queue()
+        self.messages = queue.Queue()
+        # only used on the worker thread
+        self.yahtzee_game = None
+        # recommendations for the next roll, by its dice, if the dice kept are speculated_fixed_dice
+        self.speculated_fixed_dice = None
+        self.speculated_recommendations = {}
+        self.speculation_hits = 0
+        self.speculation_misses = 0
+        # the dice the player was told to keep, or None for a new turn
+        self.next_fixed_dice = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+
+    def dice_rolled(self, fixed_dice, dice_values):
+        # called by the GUI. The result is a RECOMMENDATION message.
+        self.requests.put((fixed_dice, dice_values))
+
+    def results(self):
+        # called by the GUI: the messages posted so far, without waiting. Each is a tuple starting with
+        # READY, or with RECOMMENDATION followed by the values of handle_roll, or with ERROR followed by
+        # the message and whether the worker can still take rolls.
+        while True:
+            try:
+                yield self.messages.get_nowait()
+            except queue.Empty:
+                return
+
+    def run(self):
+        try:
+            self.yahtzee_game = YahtzeeGame(DiceSet.DICE_TYPE_MANUAL, self.position_costs, self.debug, None)
+        except Exception as e:
+            self.messages.put((YahtzeeRecommendationWorker.ERROR, f'Could not start the game: {e}', False))
+            return
+        self.messages.put((YahtzeeRecommendationWorker.READY, self.yahtzee_game.rounds_remaining()))
+        self.speculate(None)
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            fixed_dice, dice_values = request
+            # so a roll that fails leaves the game as it was, and can be entered again
+            state = self.yahtzee_game.state.copy()
+            try:
+                result = self.handle_roll(fixed_dice, dice_values)
+            except Exception as e:
+                self.yahtzee_game.state = state
+                self.messages.put((YahtzeeRecommendationWorker.ERROR, f'Could not use the roll: {e}', True))
+                continue
+            self.messages.put((YahtzeeRecommendationWorker.RECOMMENDATION,) + result)
+            if self.debug:
+                print(f'speculation hits {self.speculation_hits}, misses {self.speculation_misses}')
+            if not self.yahtzee_game.game_complete():
+                # what the player will roll next
+                self.speculate(self.next_fixed_dice)
+
+    def handle_roll(self, fixed_dice, dice_values):
+        # returns the position used and its score, or None and the dice to keep. Then whether the game
+        # is complete, YahtzeeGame.total_score and the rounds remaining.
+        yg = self.yahtzee_game
+        yg.dice_rolled_manually(fixed_dice, dice_values)
+        position_to_take, dice_to_fix = self.recommendation(fixed_dice, dice_values)
+        score = None
+        if dice_to_fix is None:
+            yg.accept_score(position_to_take, dice_values)
+            # have to get score from the scores array, because bonus yahtzees are cumulative
+            score = yg.state.scores[position_to_take]
+        self.next_fixed_dice = dice_to_fix
+        return position_to_take, dice_to_fix, score, yg.game_complete(), yg.total_score(), yg.rounds_remaining()
+
+    def recommendation(self, fixed_dice, dice_values):
+        key = tuple(int(value) for value in dice_values)
+        decision = None
+        if self.speculated_fixed_dice == self.dice_key(fixed_dice):
+            decision = self.speculated_recommendations.get(key)
+        if decision is None:
+            self.speculation_misses += 1
+            return self.yahtzee_game.recommended_next_step(dice_values)
+        self.speculation_hits += 1
+        position_to_take, dice_to_fix = decision
+        if dice_to_fix is not None:
+            dice_to_fix = list(dice_to_fix)
+        return position_to_take, dice_to_fix
+
+    @staticmethod
+    def dice_key(dice):
+        if dice is None:
+            return ()
+        return tuple(int(value) for value in dice)
+
+    def speculate(self, fixed_dice):
+        # works out recommendations for every outcome of rolling the dice that aren't in fixed_dice.
+        # Stops as soon as a roll comes in, which then uses whatever has been worked out.
+        yg = self.yahtzee_game
+        fixed_key = self.dice_key(fixed_dice)
+        self.speculated_fixed_dice = fixed_key
+        self.speculated_recommendations = {}
+        state = yg.state
+        # the state after the roll is entered, without changing the real one
+        yg.state = state.copy()
+        yg.state.rolls_left -= 1
+        try:
+            for roll_results in itertools.combinations_with_replacement(DiceSet.POSSIBLE_VALUES, 5 - len(fixed_key)):
+                if not self.requests.empty():
+                    break
+                dice_values = sorted(fixed_key + roll_results)
+                self.speculated_recommendations[tuple(dice_values)] = yg.recommended_next_step(dice_values)
+        except Exception:
+            # the recommendation is then worked out when the roll comes in, which reports any error
+            self.speculated_recommendations = {}
+        finally:
+            yg.state = state
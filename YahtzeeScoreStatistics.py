@@ -0,0 +1,95 @@
+import numpy as np
+from YahtzeeGame import YahtzeeGame, YahtzeeGameState
+
+
+class YahtzeeScoreStatistics:
+    # running statistics of where games' points come from, in memory that doesn't grow with the number of games.
+    # Games are added as rows of their per-position scores, like YahtzeeGame.scores. For each position and
+    # for the upper section, upper bonus, lower section and total, it keeps the mean and variance, using
+    # the sum of squared differences from the mean so batches can be combined accurately, and a histogram.
+    BONUS_YAHTZEE_SCORE = 100
+    UPPER_SECTION = YahtzeeGame.NUM_SLOTS
+    UPPER_BONUS_COLUMN = YahtzeeGame.NUM_SLOTS + 1
+    LOWER_SECTION = YahtzeeGame.NUM_SLOTS + 2
+    TOTAL = YahtzeeGame.NUM_SLOTS + 3
+    NUM_COLUMNS = YahtzeeGame.NUM_SLOTS + 4
+    # histograms have a bin for each score up to this, and the last bin also counts anything higher.
+    # Bonus Yahtzee is counted in bins of BONUS_YAHTZEE_SCORE.
+    NUM_BINS = 1600
+
+    @classmethod
+    def column_name(cls, column):
+        if column < YahtzeeGame.NUM_SLOTS:
+            return YahtzeeGame.position_name(column)
+        return {cls.UPPER_SECTION: 'Upper section', cls.UPPER_BONUS_COLUMN: 'Upper bonus',
+                cls.LOWER_SECTION: 'Lower section', cls.TOTAL: 'Total'}[column]
+
+    @classmethod
+    def game_columns(cls, scores):
+        # the per-position scores, then the same breakdown as YahtzeeGame.total_score, with a row for each game
+        scores = np.asarray(scores, dtype=np.int64).reshape(-1, YahtzeeGame.NUM_SLOTS)
+        upper_section = np.dot(scores, YahtzeeGame.UPPER_SECTION_MASK)
+        bonus = np.where(upper_section >= YahtzeeGameState.UPPER_BONUS_THRESHOLD, YahtzeeGameState.UPPER_BONUS, 0)
+        lower_section = np.dot(scores, YahtzeeGame.LOWER_SECTION_MASK)
+        total = upper_section + bonus + lower_section
+        return np.column_stack([scores, upper_section, bonus, lower_section, total])
+
+    def __init__(self):
+        self.games = 0
+        self.means = np.zeros(self.NUM_COLUMNS)
+        self.sum_squares = np.zeros(self.NUM_COLUMNS)
+        self.zeros = np.zeros(self.NUM_COLUMNS, dtype=np.int64)
+        self.histograms = np.zeros((self.NUM_COLUMNS, self.NUM_BINS), dtype=np.int64)
+
+    def add_games(self, scores):
+        # scores has a row for each game, or is a single game's scores
+        columns = self.game_columns(scores)
+        games = len(columns)
+        if games == 0:
+            return
+        means = np.mean(columns, axis=0)
+        sum_squares = np.sum((columns - means) ** 2, axis=0)
+        self.combine(games, means, sum_squares)
+        self.zeros += np.count_nonzero(columns == 0, axis=0)
+        bins = columns.copy()
+        bins[:, YahtzeeGame.BONUS_YAHTZEE] //= self.BONUS_YAHTZEE_SCORE
+        bins = np.minimum(bins, self.NUM_BINS - 1)
+        for column in range(self.NUM_COLUMNS):
+            self.histograms[column] += np.bincount(bins[:, column], minlength=self.NUM_BINS)
+
+    def combine(self, games, means, sum_squares):
+        total_games = self.games + games
+        delta = means - self.means
+        self.sum_squares += sum_squares + delta ** 2 * self.games * games / total_games
+        self.means += delta * games / total_games
+        self.games = total_games
+
+    def variances(self):
+        if self.games <= 1:
+            return np.zeros(self.NUM_COLUMNS)
+        return self.sum_squares / (self.games - 1)
+
+    def zero_rates(self):
+        return self.zeros / max(self.games, 1)
+
+    def yahtzee_rate(self):
+        # games with a Yahtzee scored in the Yahtzee position
+        return 1 - self.zero_rates()[YahtzeeGame.YAHTZEE]
+
+    def upper_bonus_rate(self):
+        return 1 - self.zero_rates()[self.UPPER_BONUS_COLUMN]
+
+    def histogram(self, column):
+        # counts of each score; for Bonus Yahtzee, of each number of bonus yahtzees
+        return self.histograms[column, 0:np.max(np.flatnonzero(self.histograms[column]), initial=0) + 1]
+
+    def summary(self):
+        standard_deviations = self.variances() ** 0.5
+        zero_rates = self.zero_rates()
+        lines = [f'{self.games} games: Yahtzee rate {np.around(100 * self.yahtzee_rate(), 1)}%, '
+                 f'upper bonus rate {np.around(100 * self.upper_bonus_rate(), 1)}%',
+                 f'{"":<16}{"mean":>8}{"sd":>8}{"zeros":>8}']
+        for column in range(self.NUM_COLUMNS):
+            lines.append(f'{self.column_name(column):<16}{np.around(self.means[column], 2):>8}'
+                         f'{np.around(standard_deviations[column], 2):>8}{np.around(100 * zero_rates[column], 1):>7}%')
+        return '\n'.join(lines)
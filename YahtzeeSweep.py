@@ -0,0 +1,415 @@
+import numpy as np
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from DiceTape import DiceTape
+from YahtzeeGame import YahtzeeGame
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeEvaluationStore import YahtzeeEvaluationStore
+from YahtzeePositionCostOptimizer import YahtzeePositionCostOptimizer
+from YahtzeeTableCache import YahtzeeTableCache
+from YahtzeeDefaults import POSITION_COSTS
+
+
+class YahtzeeWorkQueue:
+    # a queue of batches of work in a directory that every node can see, such as an NFS mount, with no
+    # other services. Each batch is a JSON file, which moves from pending to claimed to results:
+    #   pending/<batch>.json           written by the coordinator
+    #   claimed/<batch>@<worker>.json  a worker claims a batch by renaming it here. Renames are atomic,
+    #                                  so if two workers try for the same batch, only one gets it.
+    #   results/<batch>.json           written by the worker, which then deletes its claim
+    # A worker touches its claim while it works. If a claim isn't touched for a while, the worker is
+    # assumed to have died, and the batch goes back to pending. How long a claim has gone untouched is
+    # timed with the coordinator's own clock, so the nodes' clocks don't have to agree.
+    # Files are always written to a temporary name in the same directory first and then renamed,
+    # so nobody ever reads a partly written file. A directory is used for one sweep at a time.
+    PENDING = 'pending'
+    CLAIMED = 'claimed'
+    RESULTS = 'results'
+    STOP_FILE = 'stop'  # written to tell workers to exit. One that's there when a worker starts is left over.
+    SUFFIX = '.json'
+    CLAIM_SEPARATOR = '@'
+
+    def __init__(self, directory):
+        self.directory = directory
+        for name in [self.PENDING, self.CLAIMED, self.RESULTS]:
+            os.makedirs(os.path.join(directory, name), exist_ok=True)
+        # for the coordinator: the last modification time seen for each claim, and when it was first seen
+        self.claim_times = {}
+
+    def path(self, name, file_name=''):
+        return os.path.join(self.directory, name, file_name)
+
+    @staticmethod
+    def write_json(path, data):
+        # temporary files start with '.', so batch_files leaves them out
+        YahtzeeTableCache.write_atomically(path, lambda f: json.dump(data, f), binary=False)
+
+    @staticmethod
+    def read_json(path):
+        with open(path) as f:
+            return json.load(f)
+
+    def batch_files(self, name):
+        # the JSON files in one of the directories, leaving out temporary files
+        return sorted(file_name for file_name in os.listdir(self.path(name))
+                      if file_name.endswith(self.SUFFIX) and not file_name.startswith('.'))
+
+    def clear(self):
+        # removes all batches, results and the stop file, for a new sweep
+        for name in [self.PENDING, self.CLAIMED, self.RESULTS]:
+            for file_name in self.batch_files(name):
+                self.remove(self.path(name, file_name))
+        self.remove(os.path.join(self.directory, self.STOP_FILE))
+        self.claim_times = {}
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # used by the coordinator
+
+    def submit(self, batch_id, batch):
+        self.write_json(self.path(self.PENDING, batch_id + self.SUFFIX), batch)
+
+    def collect_results(self):
+        # returns the results written since the last call, by batch id, and removes their files
+        results = {}
+        for file_name in self.batch_files(self.RESULTS):
+            path = self.path(self.RESULTS, file_name)
+            results[file_name[0:-len(self.SUFFIX)]] = self.read_json(path)
+            self.remove(path)
+        return results
+
+    def requeue_stale_claims(self, stale_seconds):
+        # puts batches whose claims haven't been touched for stale_seconds back in pending.
+        # Returns their batch ids.
+        now = time.monotonic()
+        claim_times = {}
+        requeued = []
+        for file_name in self.batch_files(self.CLAIMED):
+            path = self.path(self.CLAIMED, file_name)
+            try:
+                modified = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue  # the worker just finished it
+            last_modified, first_seen = self.claim_times.get(file_name, (None, now))
+            if modified != last_modified:
+                first_seen = now
+            if now - first_seen < stale_seconds:
+                claim_times[file_name] = (modified, first_seen)
+                continue
+            batch_id = file_name.split(self.CLAIM_SEPARATOR)[0]
+            try:
+                os.rename(path, self.path(self.PENDING, batch_id + self.SUFFIX))
+                requeued.append(batch_id)
+            except FileNotFoundError:
+                pass
+        self.claim_times = claim_times
+        return requeued
+
+    def stop_workers(self):
+        with open(os.path.join(self.directory, self.STOP_FILE), 'w'):
+            pass
+
+    # used by workers
+
+    def stop_time(self):
+        # when the stop file was written, or None if there isn't one
+        try:
+            return os.stat(os.path.join(self.directory, self.STOP_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def claim(self, worker_name):
+        # returns the id, contents and claim path of a pending batch this worker now owns, or None if there isn't one
+        for file_name in self.batch_files(self.PENDING):
+            batch_id = file_name[0:-len(self.SUFFIX)]
+            claim_path = self.path(self.CLAIMED, f'{batch_id}{self.CLAIM_SEPARATOR}{worker_name}{self.SUFFIX}')
+            try:
+                os.rename(self.path(self.PENDING, file_name), claim_path)
+            except FileNotFoundError:
+                continue  # another worker got it first
+            # the claim's modification time is when it was claimed, not when it was submitted
+            os.utime(claim_path)
+            return batch_id, self.read_json(claim_path), claim_path
+        return None
+
+    def complete(self, batch_id, claim_path, result):
+        self.write_json(self.path(self.RESULTS, batch_id + self.SUFFIX), result)
+        # if the claim was thought stale and requeued, the batch might be done twice, which does no harm
+        self.remove(claim_path)
+
+
+class YahtzeeSweepWorker:
+    # plays the games for batches of position costs from a YahtzeeWorkQueue, until it's told to stop
+    POLL_SECONDS = 1.0
+    HEARTBEAT_SECONDS = 5.0
+
+    def __init__(self, directory, poll_seconds=POLL_SECONDS, heartbeat_seconds=HEARTBEAT_SECONDS, max_batches=None):
+        self.queue = YahtzeeWorkQueue(directory)
+        self.name = f'{socket.gethostname()}-{os.getpid()}'.replace(YahtzeeWorkQueue.CLAIM_SEPARATOR, '_')
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        # if set, the worker exits after this many batches, for testing
+        self.max_batches = max_batches
+        self.engine_version = YahtzeeEvaluationStore.engine_version()
+        self.batch_game = YahtzeeBatchGame()
+        self.batches_done = 0
+        # a stop file that's already there is left over from an earlier sweep, and the next sweep's coordinator
+        # removes it, so the worker only stops for a different one
+        self.old_stop_time = self.queue.stop_time()
+
+    def stopping(self):
+        stop_time = self.queue.stop_time()
+        return stop_time is not None and stop_time != self.old_stop_time
+
+    def run(self):
+        while not self.stopping():
+            claimed = self.queue.claim(self.name)
+            if claimed is None:
+                time.sleep(self.poll_seconds)
+                continue
+            batch_id, batch, claim_path = claimed
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self.heartbeat, args=(claim_path, done), daemon=True)
+            heartbeat.start()
+            try:
+                result = self.play_batch(batch)
+            finally:
+                done.set()
+                heartbeat.join()
+            result['worker'] = self.name
+            self.queue.complete(batch_id, claim_path, result)
+            self.batches_done += 1
+            if self.max_batches is not None and self.batches_done >= self.max_batches:
+                break
+        print(f'worker {self.name} did {self.batches_done} batches')
+
+    def heartbeat(self, claim_path, done):
+        while not done.wait(self.heartbeat_seconds):
+            try:
+                os.utime(claim_path)
+            except FileNotFoundError:
+                return  # requeued, so someone else may be doing it too
+
+    def play_batch(self, batch):
+        # a result entry like YahtzeeEvaluationStore's for each candidate, or an error if the games
+        # wouldn't be played the same way as on the coordinator
+        if batch['engine_version'] != self.engine_version:
+            return {'error': f'worker {self.name} has engine version {self.engine_version}, '
+                             f'not {batch["engine_version"]}'}
+        # every node makes the same tape from the same games and seed, as the optimizer does
+        tape_path = DiceTape.default_path(batch['tape_games'], batch['tape_seed'])
+        if self.batch_game.dice_tape is None or self.batch_game.dice_tape.path != tape_path:
+            self.batch_game.dice_tape = DiceTape.load_or_create(batch['tape_games'], batch['tape_seed'])
+        entries = []
+        for candidate in batch['candidates']:
+            game_scores = self.batch_game.play_games(candidate['games'], candidate['position_costs'],
+                                                     candidate['first_game'])
+            entries.append(YahtzeeEvaluationStore.games_entry(game_scores))
+        return {'entries': entries}
+
+
+class YahtzeeSweepCoordinator:
+    # a search for better position costs like YahtzeePositionCostOptimizer.try_random_position_costs, with the
+    # games played by YahtzeeSweepWorkers on any number of nodes. Each round tries many random changes of the
+    # best position costs so far at once, in batches on a YahtzeeWorkQueue. All tries play the same games of
+    # a dice tape, and results go in the evaluation store under the same dice source as the optimizer's.
+    # Making a coordinator clears the directory for its sweep, so workers can be started after that.
+    POLL_SECONDS = 0.5
+    STALE_SECONDS = 60.0
+    # the sweep fails if no worker has a batch claimed, and no results come in, for this long
+    IDLE_SECONDS = 600.0
+
+    def __init__(self, directory, games_per_try=300, tape_seed=0, seed=None, evaluation_store=None,
+                 poll_seconds=POLL_SECONDS, stale_seconds=STALE_SECONDS, idle_seconds=IDLE_SECONDS):
+        self.queue = YahtzeeWorkQueue(directory)
+        self.queue.clear()
+        self.games_per_try = games_per_try
+        self.tape_seed = tape_seed
+        self.dice_source = f'tape {os.path.basename(DiceTape.default_path(games_per_try, tape_seed))}'
+        self.rng = np.random.default_rng(seed)
+        self.evaluation_store = evaluation_store
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.idle_seconds = idle_seconds
+        # worker processes started on this machine. If they've all exited, nothing will do the work.
+        self.local_workers = []
+        self.engine_version = YahtzeeEvaluationStore.engine_version()
+        # each sweep's batch ids are different, so results left over from another sweep are never mistaken for its own
+        self.sweep_id = f'{int(time.time())}-{os.getpid()}'
+        self.next_batch = 0
+        # entries for the tries played in this sweep, when there's no evaluation store
+        self.entries = {}
+        self.games_played = 0
+        self.requeued = 0
+
+    def entry(self, position_costs):
+        if self.evaluation_store is not None:
+            return self.evaluation_store.get(self.dice_source, position_costs)
+        return self.entries.get(YahtzeeEvaluationStore.key(position_costs))
+
+    def add_entry(self, position_costs, entry):
+        if self.evaluation_store is not None:
+            return self.evaluation_store.add_entry(self.dice_source, position_costs, entry)
+        key = YahtzeeEvaluationStore.key(position_costs)
+        self.entries[key] = YahtzeeEvaluationStore.combine_entries(self.entries.get(key), entry)
+        return self.entries[key]
+
+    def evaluate(self, tries, batch_size):
+        # plays whatever games each of tries still needs, and returns their entries
+        candidates = []
+        for position_costs in tries:
+            entry = self.entry(position_costs)
+            stored_games = 0 if entry is None else entry['games']
+            if stored_games < self.games_per_try:
+                # with a dice tape, they carry on from where the stored games stopped
+                candidates.append({'position_costs': [int(cost) for cost in position_costs],
+                                   'first_game': stored_games, 'games': self.games_per_try - stored_games})
+        batches = {}
+        for start in range(0, len(candidates), batch_size):
+            batch_id = f'{self.sweep_id}-{self.next_batch:06d}'
+            self.next_batch += 1
+            batches[batch_id] = {'engine_version': self.engine_version, 'tape_games': self.games_per_try,
+                                 'tape_seed': self.tape_seed, 'candidates': candidates[start:start + batch_size]}
+            self.queue.submit(batch_id, batches[batch_id])
+        last_progress = time.monotonic()
+        while len(batches) > 0:
+            time.sleep(self.poll_seconds)
+            results = self.queue.collect_results()
+            for batch_id, result in results.items():
+                batch = batches.pop(batch_id, None)
+                if batch is None:
+                    continue  # done twice after being requeued, or from an earlier sweep
+                if 'error' in result:
+                    raise RuntimeError(result['error'])
+                for candidate, entry in zip(batch['candidates'], result['entries']):
+                    self.add_entry(candidate['position_costs'], entry)
+                    self.games_played += entry['games']
+            requeued = self.queue.requeue_stale_claims(self.stale_seconds)
+            if len(requeued) > 0:
+                print(f'requeued {len(requeued)} batches whose workers stopped responding')
+                self.requeued += len(requeued)
+            # claims that are still being touched are workers at work
+            if len(results) > 0 or len(self.queue.claim_times) > 0:
+                last_progress = time.monotonic()
+            elif time.monotonic() - last_progress > self.idle_seconds:
+                raise RuntimeError(f'no worker has claimed a batch or sent a result for {self.idle_seconds} s')
+            if len(self.local_workers) > 0 and all(worker.poll() is not None for worker in self.local_workers):
+                raise RuntimeError(f'all {len(self.local_workers)} local workers have exited')
+        return [self.entry(position_costs) for position_costs in tries]
+
+    def run(self, num_rounds, tries_per_round, batch_size, position_costs=None, stop_workers=True):
+        best_position_costs = position_costs
+        if self.evaluation_store is not None:
+            stored_position_costs, stored_entry = self.evaluation_store.best(self.dice_source, self.games_per_try)
+            if stored_position_costs is not None:
+                print(f'resuming from stored position costs {YahtzeePositionCostOptimizer.css(stored_position_costs)}, '
+                      f'average score = {np.around(stored_entry["mean"], 1)}')
+                best_position_costs = stored_position_costs
+        if best_position_costs is None:
+            # the same place as the optimizer starts from
+            best_position_costs = POSITION_COSTS
+        best_position_costs = np.array(best_position_costs, dtype=np.int8)
+        start = time.perf_counter()
+        try:
+            best_entry = self.evaluate([best_position_costs], batch_size)[0]
+            for i in range(num_rounds):
+                # different small changes from our best position_costs so far
+                tries = {}
+                for attempt in range(10 * tries_per_round):
+                    change = YahtzeePositionCostOptimizer.random_change(best_position_costs, 1, self.rng)
+                    tries[YahtzeeEvaluationStore.key(change)] = change
+                    if len(tries) == tries_per_round:
+                        break
+                tries = list(tries.values())
+                entries = self.evaluate(tries, batch_size)
+                k = int(np.argmax([entry['mean'] for entry in entries]))
+                if entries[k]['mean'] > best_entry['mean']:
+                    best_position_costs = tries[k]
+                    best_entry = entries[k]
+                average_score, sem = YahtzeeEvaluationStore.mean_and_sem(best_entry)
+                print(f'round {i}: best of {len(tries)} tries = {np.around(entries[k]["mean"], 1)}, '
+                      f'best average score so far = {np.around(average_score, 1)} +/- {np.around(sem, 1)} '
+                      f'with position costs {YahtzeePositionCostOptimizer.css(best_position_costs)}')
+        finally:
+            if stop_workers:
+                self.queue.stop_workers()
+        elapsed = time.perf_counter() - start
+        average_score, sem = YahtzeeEvaluationStore.mean_and_sem(best_entry)
+        print(f'best average score = {np.around(average_score, 1)} +/- {np.around(sem, 1)}')
+        print(f'best position costs = {YahtzeePositionCostOptimizer.css(best_position_costs)}')
+        print(f'{self.games_played} games played by workers, {np.around(self.games_played / elapsed)} games/sec, '
+              f'{self.requeued} batches requeued')
+        return best_position_costs
+
+
+def start_local_workers(directory, num_workers, heartbeat_seconds):
+    # worker processes on this machine, for running or testing a sweep on one box
+    command = [sys.executable, os.path.abspath(__file__), '--directory', directory, 'worker',
+               '--heartbeat-seconds', str(heartbeat_seconds)]
+    return [subprocess.Popen(command) for i in range(num_workers)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search for position costs with workers on many machines, '
+                                                 'through a shared directory.')
+    parser.add_argument('--directory', required=True, help='the shared directory, the same on every node')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    coordinator_parser = subparsers.add_parser('coordinator')
+    coordinator_parser.add_argument('--rounds', type=int, default=20)
+    coordinator_parser.add_argument('--tries-per-round', type=int, default=16)
+    coordinator_parser.add_argument('--batch-size', type=int, default=2, help='tries in each batch of work')
+    coordinator_parser.add_argument('--games-per-try', type=int, default=300)
+    coordinator_parser.add_argument('--tape-seed', type=int, default=0)
+    coordinator_parser.add_argument('--seed', type=int)
+    coordinator_parser.add_argument('--position-costs', type=int, nargs=YahtzeeGame.NUM_SLOTS,
+                                    default=POSITION_COSTS, help='where the search starts')
+    coordinator_parser.add_argument('--no-store', action='store_true', help="don't use the evaluation store")
+    coordinator_parser.add_argument('--stale-seconds', type=float, default=YahtzeeSweepCoordinator.STALE_SECONDS,
+                                    help='requeue batches whose claims have gone this long without a heartbeat')
+    coordinator_parser.add_argument('--idle-seconds', type=float, default=YahtzeeSweepCoordinator.IDLE_SECONDS,
+                                    help='give up if no worker claims a batch or sends a result for this long')
+    coordinator_parser.add_argument('--local-workers', type=int, default=0,
+                                    help='also start this many worker processes on this machine')
+    coordinator_parser.add_argument('--keep-workers', action='store_true', help="don't stop the workers when done")
+    worker_parser = subparsers.add_parser('worker')
+    worker_parser.add_argument('--poll-seconds', type=float, default=YahtzeeSweepWorker.POLL_SECONDS)
+    worker_parser.add_argument('--heartbeat-seconds', type=float, default=YahtzeeSweepWorker.HEARTBEAT_SECONDS)
+    worker_parser.add_argument('--max-batches', type=int, help='exit after this many batches')
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        YahtzeeSweepWorker(args.directory, args.poll_seconds, args.heartbeat_seconds, args.max_batches).run()
+        return 0
+    evaluation_store = None if args.no_store else YahtzeeEvaluationStore()
+    coordinator = YahtzeeSweepCoordinator(args.directory, args.games_per_try, args.tape_seed, args.seed,
+                                          evaluation_store, stale_seconds=args.stale_seconds,
+                                          idle_seconds=args.idle_seconds)
+    # the workers' heartbeats have to come well within the time a claim is allowed to go untouched
+    workers = start_local_workers(args.directory, args.local_workers, min(YahtzeeSweepWorker.HEARTBEAT_SECONDS,
+                                                                          args.stale_seconds / 4))
+    coordinator.local_workers = workers
+    try:
+        coordinator.run(args.rounds, args.tries_per_round, args.batch_size, args.position_costs,
+                        not args.keep_workers)
+    finally:
+        for worker in workers:
+            if args.keep_workers:
+                # nothing will stop them, and they only work for this sweep
+                worker.terminate()
+            worker.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import numpy as np
+import hashlib
+import inspect
+import os
+import tempfile
+from DiceSet import DiceSet
+
+
+class YahtzeeTableCache:
+    # saves the precomputed YahtzeeRules tables to a file, so they're only built once.
+    # The file name includes a hash of the code and constants that build and index the tables, so a change
+    # to the scoring rules makes a new file that gets built the next time a game is created.
+    FORMAT_VERSION = 4  # increase if the layout of the saved file changes
+    FILE_PREFIX = 'yahtzee_tables'
+    CACHE_DIR_VARIABLE = 'YAHTZEE_CACHE_DIR'
+    TABLE_NAMES = ['dice_scores', 'combination_ids', 'keep_ids', 'keep_dice_values', 'keep_sizes', 'keep_starts',
+                   'transition_roll_ids', 'transition_weights', 'roll_keep_ids']
+    RULE_FUNCTIONS = ['score_dice_batch', 'calculate_dice_combination_scores', 'calculate_next_roll_possibilities',
+                      'dice_values_to_id']
+    # YahtzeeGame's positions and roll sizes, which the tables are laid out by
+    GAME_CONSTANTS = ['UPPER_SECTION_END', 'THREE_OF_A_KIND', 'FOUR_OF_A_KIND', 'FULL_HOUSE', 'SMALL_STRAIGHT',
+                      'LARGE_STRAIGHT', 'YAHTZEE', 'BONUS_YAHTZEE', 'CHANCE', 'NUM_SLOTS', 'ROLL_OUTCOMES', 'MAX_KEEPS']
+    # dice keys index combination_ids
+    DICE_CONSTANTS = ['FACE_KEYS', 'NUM_DICE_KEYS']
+    DICE_FUNCTIONS = ['dice_key', 'dice_keys']
+    # tables already loaded in this process, by file path
+    loaded_tables = {}
+
+    @classmethod
+    def cache_directory(cls):
+        default_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.yahtzee_cache')
+        return os.environ.get(cls.CACHE_DIR_VARIABLE, default_directory)
+
+    @classmethod
+    def rules_version(cls, rules_class):
+        # imported here, since YahtzeeGame imports this module
+        from YahtzeeGame import YahtzeeGame
+        rules_hash = hashlib.sha1(f'{cls.FORMAT_VERSION}'.encode())
+        for function_name in cls.RULE_FUNCTIONS:
+            rules_hash.update(inspect.getsource(getattr(rules_class, function_name)).encode())
+        for function_name in cls.DICE_FUNCTIONS:
+            rules_hash.update(inspect.getsource(getattr(DiceSet, function_name)).encode())
+        for owner, names in [(YahtzeeGame, cls.GAME_CONSTANTS), (DiceSet, cls.DICE_CONSTANTS)]:
+            for name in names:
+                rules_hash.update(f'{name}={getattr(owner, name)!r}'.encode())
+        return rules_hash.hexdigest()[0:12]
+
+    @classmethod
+    def table_path(cls, rules_class):
+        return os.path.join(cls.cache_directory(), f'{cls.FILE_PREFIX}_{cls.rules_version(rules_class)}.npy')
+
+    @classmethod
+    def tables_to_record(cls, rules):
+        tables = [getattr(rules, name) for name in cls.TABLE_NAMES]
+        # one record with a field for each table, so everything is in a single file
+        record_dtype = [(name, table.dtype, table.shape) for name, table in zip(cls.TABLE_NAMES, tables)]
+        record = np.zeros(1, dtype=record_dtype)
+        for name, table in zip(cls.TABLE_NAMES, tables):
+            record[name][0] = table
+        return record
+
+    @classmethod
+    def record_to_tables(cls, record):
+        return {name: record[name][0] for name in cls.TABLE_NAMES}
+
+    @staticmethod
+    def write_path_atomically(path, write, prefix='.'):
+        # calls write with the path of a temporary file to write to, which then replaces path. The file is
+        # in the same directory, so other processes, and this one after a crash, never see a partly written
+        # file. Its name is unique even in a directory shared between machines, and it's removed if write fails.
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        file_handle, temp_path = tempfile.mkstemp(dir=directory or '.', prefix=prefix, suffix='.tmp')
+        os.close(file_handle)
+        try:
+            write(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    @classmethod
+    def write_atomically(cls, path, write, binary=True, prefix='.'):
+        # the same, for write taking a file object
+        def write_file(temp_path):
+            with open(temp_path, 'wb' if binary else 'w') as f:
+                write(f)
+        cls.write_path_atomically(path, write_file, prefix)
+
+    @classmethod
+    def save(cls, record, path):
+        cls.write_atomically(path, lambda f: np.save(f, record), prefix=cls.FILE_PREFIX)
+
+    @classmethod
+    def load_or_build(cls, rules):
+        # sets each of TABLE_NAMES on rules
+        path = cls.table_path(type(rules))
+        tables = cls.loaded_tables.get(path)
+        if tables is None:
+            try:
+                tables = cls.record_to_tables(np.load(path, mmap_mode='r'))
+            except (OSError, ValueError, KeyError):
+                # no file yet, or an unreadable one
+                rules.calculate_dice_combination_scores()
+                rules.calculate_next_roll_possibilities()
+                record = cls.tables_to_record(rules)
+                try:
+                    cls.save(record, path)
+                except OSError:
+                    pass  # can't write the cache directory, so just use the tables built here
+                tables = cls.record_to_tables(record)
+            cls.loaded_tables[path] = tables
+        for name, table in tables.items():
+            setattr(rules, name, table)
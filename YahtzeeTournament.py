@@ -0,0 +1,295 @@
+import numpy as np
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from DiceTape import DiceTape
+from YahtzeeGame import YahtzeeGame
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeDecisionTable import YahtzeeDecisionTable
+from YahtzeePositionCostOptimizer import YahtzeePositionCostOptimizer
+from YahtzeeDefaults import POSITION_COSTS
+
+
+class YahtzeeTournament:
+    # ranks strategies (position_costs) by how often they beat each other, head to head.
+    # Games are played in chunks, and every strategy in a chunk plays the same games, on an in-memory
+    # DiceTape made from the chunk's seed, so two strategies see the same dice for as long as they make
+    # the same choices. A strategy's score in a game doesn't depend on who it's matched against, so each
+    # strategy plays each chunk once, and is compared with all the others on it. Only counts are kept:
+    # how often each strategy beat each other one, and each strategy's score sums.
+    ROUND_ROBIN = 'round-robin'
+    BRACKET = 'bracket'
+    GAMES_PER_CHUNK = 10000
+    Z = 1.96  # for 95% confidence intervals
+    # set in each worker process by init_worker
+    worker_strategies = None
+    worker_table_paths = None
+    worker_batch_game = None
+    worker_tables = None
+
+    @staticmethod
+    def init_worker(strategies, table_paths):
+        YahtzeeTournament.worker_strategies = strategies
+        YahtzeeTournament.worker_table_paths = table_paths
+        YahtzeeTournament.worker_batch_game = YahtzeeBatchGame()
+        # decision tables are memory-mapped the first time a strategy plays in this process
+        YahtzeeTournament.worker_tables = {}
+
+    @staticmethod
+    def worker_table(strategy):
+        table_paths = YahtzeeTournament.worker_table_paths
+        if table_paths is None:
+            return None
+        tables = YahtzeeTournament.worker_tables
+        if strategy not in tables:
+            tables[strategy] = YahtzeeDecisionTable(table_paths[strategy])
+        return tables[strategy]
+
+    @staticmethod
+    def play_chunk(strategies, num_games, seed_sequence):
+        # plays the chunk's games with each of strategies, which are indexes into the worker's strategies.
+        # Returns how often each beat each other one, and the sum of each one's scores and squared scores.
+        batch_game = YahtzeeTournament.worker_batch_game
+        batch_game.dice_tape = DiceTape.in_memory(num_games, np.random.default_rng(seed_sequence))
+        scores = np.zeros((len(strategies), num_games), dtype=np.int16)
+        for k, strategy in enumerate(strategies):
+            batch_game.decision_table = YahtzeeTournament.worker_table(strategy)
+            scores[k] = batch_game.play_games(num_games, YahtzeeTournament.worker_strategies[strategy])
+        wins = np.zeros((len(strategies), len(strategies)), dtype=np.int64)
+        for k in range(len(strategies)):
+            wins[k] = np.count_nonzero(scores[k] > scores, axis=1)
+        scores = scores.astype(np.int64)
+        return wins, np.sum(scores, axis=1), np.sum(scores * scores, axis=1)
+
+    def __init__(self, strategies, num_workers=1, seed=None, use_decision_tables=True,
+                 games_per_chunk=GAMES_PER_CHUNK):
+        self.strategies = [tuple(int(cost) for cost in strategy) for strategy in strategies]
+        num_strategies = len(self.strategies)
+        self.num_workers = num_workers
+        self.games_per_chunk = games_per_chunk
+        self.seed_sequence = np.random.SeedSequence(seed)
+        # looking decisions up is much faster than working them out, once the tables are compiled
+        self.use_decision_tables = use_decision_tables
+        self.table_paths = None
+        # wins[i, j] is how many games strategy i scored more than strategy j, of games[i, j] they both played
+        self.wins = np.zeros((num_strategies, num_strategies), dtype=np.int64)
+        self.games = np.zeros((num_strategies, num_strategies), dtype=np.int64)
+        self.score_sums = np.zeros(num_strategies, dtype=np.int64)
+        self.score_sum_squares = np.zeros(num_strategies, dtype=np.int64)
+        self.games_played = np.zeros(num_strategies, dtype=np.int64)
+        # for a bracket, the strategies left after each round, starting with all of them
+        self.rounds = []
+        self.executor = None
+
+    def play(self, strategies, num_games):
+        # plays num_games new games with each of strategies, adding the results to the counts
+        strategies = np.array(strategies)
+        num_chunks = -(-num_games // self.games_per_chunk)
+        chunk_sizes = [min(self.games_per_chunk, num_games - k * self.games_per_chunk) for k in range(num_chunks)]
+        chunk_seeds = self.seed_sequence.spawn(num_chunks)
+        if self.executor is None:
+            results = map(self.play_chunk, itertools.repeat(strategies), chunk_sizes, chunk_seeds)
+        else:
+            results = self.executor.map(self.play_chunk, itertools.repeat(strategies), chunk_sizes, chunk_seeds)
+        pairs = np.ix_(strategies, strategies)
+        for chunk_size, (wins, score_sums, score_sum_squares) in zip(chunk_sizes, results):
+            self.wins[pairs] += wins
+            self.games[pairs] += chunk_size
+            self.score_sums[strategies] += score_sums
+            self.score_sum_squares[strategies] += score_sum_squares
+            self.games_played[strategies] += chunk_size
+
+    def compile_tables(self, directory):
+        # each strategy's decision table: the one in the cache if it's there, otherwise one compiled into
+        # directory, so a tournament of many strategies doesn't leave a table for each of them in the cache.
+        # They're compiled here, so workers never compile the same table at the same time.
+        table_paths = {}
+        for strategy in self.strategies:
+            if strategy in table_paths:
+                continue
+            path = YahtzeeDecisionTable.default_path(strategy)
+            if not os.path.exists(path):
+                file_name = '_'.join(str(cost) for cost in strategy) + '.npy'
+                path = YahtzeeDecisionTable.compile(strategy, os.path.join(directory, file_name))
+            table_paths[strategy] = path
+        return [table_paths[strategy] for strategy in self.strategies]
+
+    def run(self, tournament_format, num_games):
+        # num_games is the number of games in each match
+        with tempfile.TemporaryDirectory(prefix='yahtzee_tournament_') as table_directory:
+            if self.use_decision_tables:
+                self.table_paths = self.compile_tables(table_directory)
+            try:
+                self.play_format(tournament_format, num_games)
+            finally:
+                # the tables in table_directory are about to be deleted
+                self.table_paths = None
+                YahtzeeTournament.worker_tables = None
+
+    def play_format(self, tournament_format, num_games):
+        start = time.perf_counter()
+        all_strategies = list(range(len(self.strategies)))
+        if self.num_workers > 1:
+            self.executor = ProcessPoolExecutor(self.num_workers, initializer=self.init_worker,
+                                                initargs=(self.strategies, self.table_paths))
+        else:
+            self.init_worker(self.strategies, self.table_paths)
+        try:
+            if tournament_format == self.ROUND_ROBIN:
+                self.play(all_strategies, num_games)
+            elif tournament_format == self.BRACKET:
+                self.play_bracket(all_strategies, num_games)
+            else:
+                raise ValueError(f'unknown tournament format {tournament_format}')
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+        elapsed = time.perf_counter() - start
+        total_games = np.sum(self.games_played)
+        print(f'{total_games} games in {np.around(elapsed, 1)} s, {np.around(total_games / elapsed)} games/sec')
+
+    def play_bracket(self, strategies, num_games):
+        # single elimination, seeded in the order given: the first plays the last, the second plays the
+        # second last, and so on, with a bye for the middle one if there's an odd number. Each round is
+        # played on new games, so the winners of a round aren't judged on the games that picked them.
+        self.rounds = [list(strategies)]
+        while len(strategies) > 1:
+            self.play(strategies, num_games)
+            winners = []
+            for k in range((len(strategies) + 1) // 2):
+                first, second = strategies[k], strategies[len(strategies) - 1 - k]
+                winners.append(first if first == second else self.match_winner(first, second))
+            strategies = winners
+            self.rounds.append(list(strategies))
+
+    def match_winner(self, first, second):
+        # the one that won more of their games, then the one with the higher average score, then first
+        if self.wins[first, second] != self.wins[second, first]:
+            return first if self.wins[first, second] > self.wins[second, first] else second
+        return second if self.mean_scores()[second] > self.mean_scores()[first] else first
+
+    def win_rates(self):
+        # the chance of strategy i beating strategy j, counting ties as half, and the half width of its
+        # confidence interval. NaN for pairs that haven't played each other.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            games = self.games.astype(float)
+            ties = self.games - self.wins - self.wins.T
+            win_rates = (self.wins + ties / 2) / games
+            # a game scores 1 for a win, 1/2 for a tie and 0 for a loss
+            variances = (self.wins + ties / 4) / games - win_rates ** 2
+            half_widths = self.Z * np.sqrt(variances / games)
+        np.fill_diagonal(win_rates, np.nan)
+        np.fill_diagonal(half_widths, np.nan)
+        return win_rates, half_widths
+
+    def mean_scores(self):
+        return self.score_sums / np.maximum(self.games_played, 1)
+
+    def score_sems(self):
+        games = np.maximum(self.games_played, 2)
+        variances = (self.score_sum_squares - self.score_sums ** 2 / games) / (games - 1)
+        return np.sqrt(np.maximum(variances, 0) / games)
+
+    def ranking(self):
+        # strategies by their average win rate against the ones they played, best first
+        win_rates, half_widths = self.win_rates()
+        played = np.any(self.games > 0, axis=1)
+        with np.errstate(invalid='ignore'):
+            average_win_rates = np.where(played, np.nanmean(np.where(played, win_rates, np.nan), axis=1), np.nan)
+        order = np.argsort(-np.nan_to_num(average_win_rates, nan=-1), kind='stable')
+        return order, average_win_rates
+
+    def save(self, path):
+        win_rates, half_widths = self.win_rates()
+        np.savez_compressed(path, strategies=np.array(self.strategies, dtype=np.int8), wins=self.wins,
+                            games=self.games, win_rates=win_rates, half_widths=half_widths,
+                            mean_scores=self.mean_scores(), score_sems=self.score_sems())
+
+    def summary(self, max_strategies=20):
+        order, average_win_rates = self.ranking()
+        win_rates, half_widths = self.win_rates()
+        mean_scores = self.mean_scores()
+        score_sems = self.score_sems()
+        lines = []
+        if len(self.rounds) > 0:
+            winner = self.rounds[-1][0]
+            lines.append(f'bracket winner: {YahtzeePositionCostOptimizer.css(self.strategies[winner])} '
+                         f'after {len(self.rounds) - 1} rounds')
+        lines.append(f'{"rank":>4}  {"win rate":>8}  {"average score":>15}  position costs')
+        for rank, strategy in enumerate(order[0:max_strategies]):
+            if np.isnan(average_win_rates[strategy]):
+                break
+            lines.append(f'{rank + 1:>4}  {np.around(100 * average_win_rates[strategy], 1):>7}%  '
+                         f'{np.around(mean_scores[strategy], 1):>7} +/- {np.around(score_sems[strategy], 1):<4}  '
+                         f'{YahtzeePositionCostOptimizer.css(self.strategies[strategy])}')
+        if len(order) >= 2 and self.games[order[0], order[1]] > 0:
+            first, second = order[0], order[1]
+            lines.append(f'rank 1 beats rank 2 {np.around(100 * win_rates[first, second], 1)}% '
+                         f'+/- {np.around(100 * half_widths[first, second], 1)}% of the time')
+        return '\n'.join(lines)
+
+
+def read_strategies(path):
+    # one position_costs per line, as whitespace or comma separated numbers. # starts a comment.
+    strategies = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#')[0].replace(',', ' ').replace('[', ' ').replace(']', ' ')
+            if line.strip() == '':
+                continue
+            strategy = [int(cost) for cost in line.split()]
+            if len(strategy) != YahtzeeGame.NUM_SLOTS:
+                raise ValueError(f'{path}: position costs need {YahtzeeGame.NUM_SLOTS} numbers, not {len(strategy)}')
+            strategies.append(strategy)
+    return strategies
+
+
+def random_strategies(num_strategies, position_costs, max_change, rng):
+    # position_costs, and random changes of up to max_change to each of its costs
+    position_costs = np.array(position_costs, dtype=np.int8)
+    changes = rng.integers(-max_change, max_change + 1, (num_strategies - 1, YahtzeeGame.NUM_SLOTS), dtype=np.int8)
+    return [position_costs] + list(position_costs + changes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Head-to-head tournament between position costs.')
+    parser.add_argument('--format', choices=[YahtzeeTournament.ROUND_ROBIN, YahtzeeTournament.BRACKET],
+                        default=YahtzeeTournament.ROUND_ROBIN)
+    parser.add_argument('--strategies', help='file with one position costs per line')
+    parser.add_argument('--random', type=int, default=8,
+                        help='without --strategies, this many random changes of --position-costs')
+    parser.add_argument('--position-costs', type=int, nargs=YahtzeeGame.NUM_SLOTS,
+                        default=POSITION_COSTS)
+    parser.add_argument('--max-change', type=int, default=2)
+    parser.add_argument('--games', type=int, default=100000, help='games in each match')
+    parser.add_argument('--games-per-chunk', type=int, default=YahtzeeTournament.GAMES_PER_CHUNK)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--no-decision-tables', action='store_true',
+                        help="work out decisions while playing, instead of compiling each strategy's decision table")
+    parser.add_argument('--output', help='save the win rate matrix and counts to this .npz file')
+    parser.add_argument('--show', type=int, default=20, help='strategies to list')
+    args = parser.parse_args()
+
+    if args.strategies is not None:
+        strategies = read_strategies(args.strategies)
+    else:
+        strategies = random_strategies(args.random, args.position_costs, args.max_change,
+                                       np.random.default_rng(args.seed))
+    tournament = YahtzeeTournament(strategies, args.workers, args.seed, not args.no_decision_tables,
+                                   args.games_per_chunk)
+    tournament.run(args.format, args.games)
+    print(tournament.summary(args.show))
+    if args.output is not None:
+        tournament.save(args.output)
+        print(f'saved results to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
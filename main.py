@@ -1,38 +1,172 @@
-from YahtzeeGame import YahtzeeGame
-from YahtzeePositionCostOptimizer import YahtzeePositionCostOptimizer
-from DiceSet import DiceSet
-from YahtzeeGUI import YahtzeeGUI
+import argparse
+import os
+import sys
+from YahtzeeDefaults import POSITION_COSTS
+
+# each command imports only the modules it uses, so a headless optimizer worker starts quickly
+# and doesn't need tkinter
+
+#todo: accepted 56666 as 3 of a kind instead of 4 of a kind when both were open
+
+#position_costs = [1, 2, 3, 4, 5, 6, 9, 5, 1, 3, 0, 0, 0, 10]
+#position_costs = [0, 2, 2, 6, 5, 7, 9, 5, 1, 4, 0, -1, 0, 11]  #average 222.4 +/- 1.8
+#position_costs = [1, 1, 2, 6, 5, 7, 10, 5, 1, 4, 0, -1, 1, 11]  # average 223.7 +/- 1.7
+#position_costs = [1, 1, 2, 6, 6, 7, 11, 5, 1, 4, 0, -1, 1, 9]  # best average score = 238.5 +/- 2.9
+#position_costs = [1, 1, 2, 6, 6, 7, 11, 5, 1, 5, 0, -3, 1, 9]  # best average score = 240.7 +/- 3.2
+#position_costs = [1, 1, 2, 5, 6, 7, 11, 6, 2, 4, 0, -3, 1, 9]  # best average score = 230.8 +/- 3.5
+# the current best is YahtzeeDefaults.POSITION_COSTS
+NUM_SLOTS = 14  # YahtzeeGame.NUM_SLOTS, without importing it just to parse arguments
+
 
 def dice_format(input_list):
     return "".join(str(i) for i in input_list)
 
-def main():
-    #todo: accepted 56666 as 3 of a kind instead of 4 of a kind when both were open
-
-    debug = False
-    modes = ["optimize position_costs", "test GUI", "play text mode"]
-    mode = 1
-    #position_costs = [1, 2, 3, 4, 5, 6, 9, 5, 1, 3, 0, 0, 0, 10]
-    #position_costs = [0, 2, 2, 6, 5, 7, 9, 5, 1, 4, 0, -1, 0, 11]  #average 222.4 +/- 1.8
-    #position_costs = [1, 1, 2, 6, 5, 7, 10, 5, 1, 4, 0, -1, 1, 11]  # average 223.7 +/- 1.7
-    #position_costs = [1, 1, 2, 6, 6, 7, 11, 5, 1, 4, 0, -1, 1, 9]  # best average score = 238.5 +/- 2.9
-    #position_costs = [1, 1, 2, 6, 6, 7, 11, 5, 1, 5, 0, -3, 1, 9]  # best average score = 240.7 +/- 3.2
-    #position_costs = [1, 1, 2, 5, 6, 7, 11, 6, 2, 4, 0, -3, 1, 9]  # best average score = 230.8 +/- 3.5
-    position_costs = [1, 1, 2, 6, 6, 7, 11, 6, 2, 4, 0, -3, 1, 9]  # best average score = 231.6 +/- 3.2
-
-    if mode == 0:
-        pco = YahtzeePositionCostOptimizer()
-        dice_type = DiceSet.DICE_TYPE_AUTO
-        num_tries = 200
-        num_iterations_each_try = 300
-        pco.try_random_position_costs(num_tries, num_iterations_each_try, dice_type, position_costs, debug, dice_format)
-    elif mode == 1:
-        gui = YahtzeeGUI()
-        gui.show_form()
+
+def optimize(args):
+    from DiceSet import DiceSet
+    from DiceTape import DiceTape
+    from YahtzeeEvaluationStore import YahtzeeEvaluationStore
+    from YahtzeePositionCostOptimizer import YahtzeePositionCostOptimizer
+    if args.exact:
+        pco = YahtzeePositionCostOptimizer(seed=args.seed)
+        pco.try_position_costs_exactly(args.tries, args.position_costs)
+        return
+    dice_tape = None
+    if not args.no_tape:
+        # every try plays the same dice, so differences between tries aren't lost in the noise
+        dice_tape = DiceTape.load_or_create(args.games_per_try, args.tape_seed)
+    evaluation_store = None
+    if not args.no_store:
+        # results are saved, so a later run carries on from the best position costs found so far
+        evaluation_store = YahtzeeEvaluationStore()
+    pco = YahtzeePositionCostOptimizer(num_workers=args.workers, seed=args.seed,
+                                       decision_cache_size=args.decision_cache_size,
+                                       racing_round_games=args.racing_round_games, dice_tape=dice_tape,
+                                       evaluation_store=evaluation_store, collect_statistics=True)
+    pco.try_random_position_costs(args.tries, args.games_per_try, DiceSet.DICE_TYPE_AUTO, args.position_costs,
+                                  args.debug, dice_format)
+
+
+def gui(args):
+    from YahtzeeGUI import YahtzeeGUI
+    gui = YahtzeeGUI(args.position_costs, args.debug)
+    gui.show_form()
+
+
+def play(args):
+    import numpy as np
+    from DiceSet import DiceSet
+    from YahtzeeGame import YahtzeeGame
+    dice_type = DiceSet.DICE_TYPE_AUTO if args.auto_dice else DiceSet.DICE_TYPE_MANUAL
+    rng = np.random.default_rng(args.seed)
+    if args.optimal:
+        from YahtzeeOptimalSolver import YahtzeeOptimalSolver
+        # the first run builds the optimal strategy's value table, which takes a few minutes
+        solver = YahtzeeOptimalSolver(num_workers=args.workers)
+        print(f'optimal expected score = {round(solver.expected_score(), 2)}')
+        yg = YahtzeeGame(dice_type, None, args.debug, dice_format, solver=solver, rng=rng)
     else:
-        dice_type = DiceSet.DICE_TYPE_MANUAL
-        yg = YahtzeeGame(dice_type, position_costs, debug, dice_format)
-        yg.play_game()
+        decision_table = None
+        if args.decision_table:
+            from YahtzeeDecisionTable import YahtzeeDecisionTable
+            decision_table = YahtzeeDecisionTable.load_or_compile(args.position_costs)
+        yg = YahtzeeGame(dice_type, args.position_costs, args.debug, dice_format, rng=rng,
+                         decision_table=decision_table)
+    yg.play_game()
+
+
+def benchmark(args):
+    from YahtzeeBenchmark import main as benchmark_main
+    return benchmark_main(args.benchmark_args)
+
+
+def precompute(args):
+    from DiceTape import DiceTape
+    from YahtzeeGame import YahtzeeRules
+    from YahtzeeTableCache import YahtzeeTableCache
+    YahtzeeRules.shared()
+    print(f'tables: {YahtzeeTableCache.table_path(YahtzeeRules)}')
+    if args.tape_games > 0:
+        print(f'dice tape: {DiceTape.load_or_create(args.tape_games, args.tape_seed).path}')
+    if args.optimal:
+        from YahtzeeOptimalSolver import YahtzeeOptimalSolver
+        solver = YahtzeeOptimalSolver(num_workers=args.workers)
+        print(f'optimal values: {solver.path}, expected score {round(solver.expected_score(), 2)}')
+    if args.decision_table:
+        from YahtzeeDecisionTable import YahtzeeDecisionTable
+        print(f'decision table: {YahtzeeDecisionTable.load_or_compile(args.position_costs).path}')
+
+
+def main(argv=None):
+    # options every command has
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument('--debug', action='store_true')
+    common_parser.add_argument('--profile', action='store_true',
+                               help='print call counts and timings at exit. Or set the YAHTZEE_PROFILE environment variable.')
+    parser = argparse.ArgumentParser(description='Yahtzee strategy optimizer and helper. With no command, shows the GUI.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    optimize_parser = subparsers.add_parser('optimize', parents=[common_parser], help='search for better position costs')
+    optimize_parser.add_argument('--tries', type=int, default=200)
+    optimize_parser.add_argument('--games-per-try', type=int, default=300)
+    optimize_parser.add_argument('--seed', type=int)
+    optimize_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    optimize_parser.add_argument('--racing-round-games', type=int, default=30,
+                                 help='games between checks for dropping a try early, or 0 to play every game')
+    optimize_parser.add_argument('--tape-seed', type=int, default=0)
+    optimize_parser.add_argument('--no-tape', action='store_true', help='roll random dice instead of a dice tape')
+    optimize_parser.add_argument('--no-store', action='store_true', help="don't use the evaluation store")
+    optimize_parser.add_argument('--decision-cache-size', type=int, default=0,
+                                 help='play games one at a time, caching up to this many decisions, '
+                                      'instead of in batches')
+    optimize_parser.add_argument('--exact', action='store_true',
+                                 help='score each try by its exact expected score, instead of by playing games')
+    optimize_parser.add_argument('--position-costs', type=int, nargs=NUM_SLOTS, default=POSITION_COSTS,
+                                 help='where the search starts')
+    optimize_parser.set_defaults(run=optimize)
+
+    gui_parser = subparsers.add_parser('gui', parents=[common_parser], help='get recommendations for a game played with real dice')
+    gui_parser.add_argument('--position-costs', type=int, nargs=NUM_SLOTS, default=POSITION_COSTS)
+    gui_parser.set_defaults(run=gui)
+
+    play_parser = subparsers.add_parser('play', parents=[common_parser], help='play a game in text mode')
+    play_parser.add_argument('--position-costs', type=int, nargs=NUM_SLOTS, default=POSITION_COSTS)
+    play_parser.add_argument('--optimal', action='store_true', help='use the optimal strategy')
+    play_parser.add_argument('--auto-dice', action='store_true', help='roll the dice instead of entering them')
+    play_parser.add_argument('--decision-table', action='store_true',
+                             help='look up decisions in the precompiled decision table for the position costs')
+    play_parser.add_argument('--seed', type=int)
+    play_parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                             help='for building the optimal strategy')
+    play_parser.set_defaults(run=play)
+
+    # any other arguments are passed on to YahtzeeBenchmark
+    benchmark_parser = subparsers.add_parser('benchmark', parents=[common_parser],
+                                             help='run YahtzeeBenchmark. Other arguments are passed on to it.')
+    benchmark_parser.set_defaults(run=benchmark)
+
+    precompute_parser = subparsers.add_parser('precompute', parents=[common_parser], help='build the cached tables ahead of time')
+    precompute_parser.add_argument('--tape-games', type=int, default=300,
+                                   help='games on the dice tape for optimize, or 0 for no tape')
+    precompute_parser.add_argument('--tape-seed', type=int, default=0)
+    precompute_parser.add_argument('--optimal', action='store_true', help="also build the optimal strategy's values")
+    precompute_parser.add_argument('--workers', type=int, default=os.cpu_count())
+    precompute_parser.add_argument('--decision-table', action='store_true',
+                                   help='also compile the decision table for the position costs')
+    precompute_parser.add_argument('--position-costs', type=int, nargs=NUM_SLOTS, default=POSITION_COSTS)
+    precompute_parser.set_defaults(run=precompute)
+
+    args, extra_args = parser.parse_known_args(argv)
+    if args.command is None:
+        args, extra_args = parser.parse_known_args(['gui'] + (sys.argv[1:] if argv is None else list(argv)))
+    if args.command == 'benchmark':
+        args.benchmark_args = extra_args
+    elif len(extra_args) > 0:
+        parser.error(f'unrecognized arguments: {" ".join(extra_args)}')
+    if args.profile:
+        from YahtzeeProfiler import YahtzeeProfiler
+        YahtzeeProfiler.enable()
+    return args.run(args) or 0
 
 # UPPER_SECTION_END = 5
 # THREE_OF_A_KIND = 6
@@ -46,4 +180,4 @@ def main():
 # NUM_SLOTS = 14
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from DiceSet import DiceSet
+from YahtzeeAdvisorServer import YahtzeeAdvisorServer
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeeGame import YahtzeeGame
+
+
+async def play_games(server, num_games, seed):
+    # plays games with YahtzeeGame, asking the server about each roll of a session that follows along.
+    # Returns the number of recommendations compared.
+    yg = YahtzeeGame(DiceSet.DICE_TYPE_AUTO, POSITION_COSTS, rng=np.random.default_rng(seed))
+    num_recommendations = 0
+    for game in range(num_games):
+        session = (await server.handle_request({'op': 'new_session'}))['session']
+        yg.reset_game(POSITION_COSTS)
+        dice_to_fix = None
+        while not yg.game_complete():
+            dice_values = [int(value) for value in yg.roll_dice(dice_to_fix)]
+            await server.handle_request({'op': 'dice_rolled', 'session': session})
+            response = await server.handle_request({'op': 'recommend', 'session': session, 'dice': dice_values})
+            position, dice_to_fix = yg.recommended_next_step(dice_values)
+            num_recommendations += 1
+            if dice_to_fix is None:
+                assert response.get('position') == position, (dice_values, response)
+                score = yg.accept_score(position, dice_values)
+                response = await server.handle_request({'op': 'accept_score', 'session': session,
+                                                        'position': int(position), 'dice': dice_values})
+                assert response['score'] == score
+                assert response['rounds_remaining'] == yg.rounds_remaining()
+            else:
+                assert sorted(response.get('keep', [])) == sorted(int(value) for value in dice_to_fix), \
+                    (dice_values, response)
+        await server.handle_request({'op': 'end_session', 'session': session})
+    return num_recommendations
+
+
+def test_recommendations_match_the_game():
+    server = YahtzeeAdvisorServer(POSITION_COSTS)
+    assert asyncio.run(play_games(server, 10, seed=21)) > 0
+
+
+@pytest.mark.parametrize('request_', [
+    'not a dict',
+    {'op': 'recommend', 'session': 12345, 'dice': [1, 2, 3, 4, 5]},
+    {'op': 'recommend', 'session': [1], 'dice': [1, 2, 3, 4, 5]},
+    {'op': 'recommend', 'session': True, 'dice': [1, 2, 3, 4, 5]},
+    {'op': 'recommend', 'session': 1, 'dice': [True, 2, 3, 4, 5]},
+    {'op': 'recommend', 'session': 1, 'dice': [1.0, 2, 3, 4, 5]},
+    {'op': 'recommend', 'session': 1, 'dice': [1, 2, 3, 4]},
+    {'op': 'accept_score', 'session': 1, 'position': True, 'dice': [1, 2, 3, 4, 5]},
+    {'op': 'accept_score', 'session': 1, 'position': YahtzeeGame.NUM_SLOTS, 'dice': [1, 2, 3, 4, 5]},
+    {'op': 'no such op'},
+])
+def test_bad_requests_get_errors(request_):
+    server = YahtzeeAdvisorServer(POSITION_COSTS)
+
+    async def ask():
+        assert (await server.handle_request({'op': 'new_session'}))['session'] == 1
+        return await server.handle_request(request_)
+    response = asyncio.run(ask())
+    assert set(response) == {'error'}
+    # the session is unchanged
+    assert server.batch_game.scores[server.sessions[1]].sum() == 0
@@ -0,0 +1,40 @@
+import numpy as np
+
+from DiceSet import DiceSet
+from DiceTape import DiceTape
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeeGame import GameLog, GameLogReader, YahtzeeGame
+
+NUM_GAMES = 200
+
+
+def test_batch_game_matches_scalar_game(tmp_path):
+    # both engines play the same games from a dice tape, so every roll, keep and score should be the same
+    tape_path = str(tmp_path / 'dice.npy')
+    DiceTape.create(tape_path, NUM_GAMES, seed=12345)
+    tape = DiceTape(tape_path)
+
+    scalar_log_path = str(tmp_path / 'scalar.log')
+    yg = YahtzeeGame(DiceSet.DICE_TYPE_TAPE, POSITION_COSTS, dice_tape=tape, game_log_path=scalar_log_path)
+    scalar_scores = np.zeros((NUM_GAMES, YahtzeeGame.NUM_SLOTS), dtype=np.int16)
+    scalar_totals = np.zeros(NUM_GAMES, dtype=np.int32)
+    for g in range(NUM_GAMES):
+        yg.reset_game(POSITION_COSTS)
+        yg.dice.start_tape_game(g)
+        scalar_totals[g] = yg.play_game()
+        scalar_scores[g] = yg.scores
+    yg.game_log.flush()
+
+    batch_log = GameLog(str(tmp_path / 'batch.log'))
+    batch_game = YahtzeeBatchGame(dice_tape=tape, game_log=batch_log)
+    batch_totals = batch_game.play_games(NUM_GAMES, POSITION_COSTS)
+    batch_log.flush()
+
+    np.testing.assert_array_equal(batch_game.scores, scalar_scores)
+    np.testing.assert_array_equal(batch_totals, scalar_totals)
+    scalar_steps = GameLogReader(scalar_log_path).steps
+    batch_steps = GameLogReader(batch_log.path).steps
+    assert len(batch_steps) == len(scalar_steps)
+    for field in GameLog.STEP_DTYPE.names:
+        np.testing.assert_array_equal(batch_steps[field], scalar_steps[field], err_msg=field)
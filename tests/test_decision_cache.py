@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from DiceSet import DiceSet
+from YahtzeeDecisionCache import YahtzeeDecisionCache
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeeGame import YahtzeeGame
+
+
+def test_least_recently_used_is_evicted_at_capacity():
+    cache = YahtzeeDecisionCache(capacity=2)
+    cache.put(1, 'one')
+    cache.put(2, 'two')
+    assert cache.get(1) == 'one'  # now 2 is the least recently used
+    cache.put(3, 'three')
+    assert len(cache.decisions) == 2
+    assert cache.evictions == 1
+    assert cache.get(2) is None
+    assert cache.get(1) == 'one'
+    assert cache.get(3) == 'three'
+
+
+def test_oldest_is_evicted_at_capacity():
+    cache = YahtzeeDecisionCache(capacity=2, eviction=YahtzeeDecisionCache.EVICT_OLDEST)
+    cache.put(1, 'one')
+    cache.put(2, 'two')
+    assert cache.get(1) == 'one'  # being used doesn't keep it
+    cache.put(3, 'three')
+    assert cache.get(1) is None
+    assert cache.get(2) == 'two'
+    assert cache.get(3) == 'three'
+
+
+def test_cache_needs_room_for_a_decision():
+    with pytest.raises(ValueError):
+        YahtzeeDecisionCache(capacity=0)
+
+
+def test_changing_position_costs_clears_the_cache():
+    cache = YahtzeeDecisionCache(capacity=10)
+    cache.set_position_costs(np.array(POSITION_COSTS))
+    cache.put(1, 'one')
+    cache.set_position_costs(np.array(POSITION_COSTS))
+    assert cache.get(1) == 'one'
+    cache.set_position_costs(np.zeros(YahtzeeGame.NUM_SLOTS))
+    assert cache.get(1) is None
+    assert cache.invalidations == 1
+
+
+def test_small_cache_gives_the_same_games():
+    # a cache that keeps evicting must still give the decisions it would have worked out
+    scores = []
+    for decision_cache in [None, YahtzeeDecisionCache(capacity=300)]:
+        yg = YahtzeeGame(DiceSet.DICE_TYPE_AUTO, POSITION_COSTS, rng=np.random.default_rng(11),
+                         decision_cache=decision_cache)
+        scores.append([yg.play_game() for game in range(50)])
+    assert scores[0] == scores[1]
+    assert decision_cache.evictions > 0
+    assert decision_cache.hits > 0
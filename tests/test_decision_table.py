@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from DiceSet import DiceSet
+from YahtzeeDecisionTable import YahtzeeDecisionTable
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeeGame import YahtzeeGame, YahtzeeGameState
+
+NUM_STATES = 5000
+REGULAR_POSITIONS_MASK = YahtzeeGameState.ALL_POSITIONS_MASK & ~YahtzeeGameState.BONUS_YAHTZEE_BIT
+
+
+@pytest.fixture(scope='module')
+def decision_table(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('decisions') / 'decisions.npy')
+    return YahtzeeDecisionTable(YahtzeeDecisionTable.compile(POSITION_COSTS, path))
+
+
+def test_table_matches_live_decisions(decision_table):
+    rng = np.random.default_rng(7)
+    yg = YahtzeeGame(DiceSet.DICE_TYPE_AUTO, POSITION_COSTS, rng=rng)
+    for i in range(NUM_STATES):
+        position_mask = int(rng.integers(0, YahtzeeGameState.ALL_POSITIONS_MASK + 1))
+        if position_mask & REGULAR_POSITIONS_MASK == 0:
+            # the game would be over
+            continue
+        if position_mask & YahtzeeGameState.BONUS_YAHTZEE_BIT:
+            # Bonus Yahtzees only count once the Yahtzee position has been used for a yahtzee
+            position_mask &= ~(1 << YahtzeeGame.YAHTZEE)
+        yg.state.position_mask = position_mask
+        yg.rolls_left = int(rng.integers(0, 3))
+        dice_values = sorted(rng.integers(1, 7, 5).tolist())
+        position, dice_to_fix = yg.recommended_next_step(dice_values)
+        table_position, table_dice_to_fix = decision_table.recommended_next_step(yg, dice_values)
+        state = f'mask {position_mask:b}, {yg.rolls_left} rolls left, dice {dice_values}'
+        if dice_to_fix is None:
+            assert table_dice_to_fix is None, state
+            assert table_position == position, state
+        else:
+            assert table_dice_to_fix is not None, state
+            assert sorted(table_dice_to_fix) == sorted(dice_to_fix), state
+
+
+def test_table_check_finds_no_differences(decision_table):
+    num_decisions, num_different = decision_table.check(num_games=20, seed=3)
+    assert num_decisions > 0
+    assert num_different == 0
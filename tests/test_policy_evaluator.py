@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeeGame import YahtzeeGame
+from YahtzeePolicyEvaluator import YahtzeePolicyEvaluator
+
+NUM_GAMES = 10000
+MAX_STANDARD_ERRORS = 4
+
+
+@pytest.mark.parametrize('position_costs', [POSITION_COSTS, [0] * YahtzeeGame.NUM_SLOTS])
+def test_evaluator_agrees_with_simulation(position_costs):
+    evaluator = YahtzeePolicyEvaluator()
+    expected_score = evaluator.evaluate(position_costs)
+
+    batch_game = YahtzeeBatchGame(rng=np.random.default_rng(2024))
+    game_scores = batch_game.play_games(NUM_GAMES, position_costs)
+
+    sem = np.std(game_scores) / np.sqrt(NUM_GAMES)
+    assert abs(np.mean(game_scores) - expected_score) < MAX_STANDARD_ERRORS * sem
+    position_sems = np.std(batch_game.scores, axis=0) / np.sqrt(NUM_GAMES)
+    position_errors = np.abs(np.mean(batch_game.scores, axis=0) - evaluator.position_means)
+    assert np.all(position_errors <= MAX_STANDARD_ERRORS * position_sems + 1e-9)
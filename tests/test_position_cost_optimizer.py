@@ -0,0 +1,18 @@
+from DiceSet import DiceSet
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeePositionCostOptimizer import YahtzeePositionCostOptimizer
+
+
+def optimize(num_workers, capsys):
+    optimizer = YahtzeePositionCostOptimizer(num_workers=num_workers, seed=5)
+    optimizer.try_random_position_costs(4, 250, DiceSet.DICE_TYPE_AUTO, POSITION_COSTS)
+    return optimizer, capsys.readouterr().out
+
+
+def test_same_seed_gives_same_results_with_more_workers(capsys):
+    one_worker, one_worker_output = optimize(1, capsys)
+    two_workers, two_workers_output = optimize(2, capsys)
+    # the scores of every try are printed, so the outputs only match if every game did
+    assert two_workers_output == one_worker_output
+    assert list(two_workers.position_costs) == list(one_worker.position_costs)
+    assert two_workers.games_played == one_worker.games_played == 4 * 250
@@ -0,0 +1,54 @@
+import itertools
+
+import numpy as np
+
+from YahtzeeGame import YahtzeeGame
+
+ALL_ROLLS = np.array(list(itertools.product(range(1, 7), repeat=5)), dtype=np.int8)
+
+
+def reference_scores(dice_values):
+    # the scoring rules, one roll at a time
+    scores = np.zeros(YahtzeeGame.NUM_SLOTS, dtype=np.int16)
+    counts = [list(dice_values).count(face) for face in range(1, 7)]
+    dice_sum = sum(dice_values)
+    for face in range(1, 7):
+        scores[face - 1] = face * counts[face - 1]
+    if max(counts) >= 3:
+        scores[YahtzeeGame.THREE_OF_A_KIND] = dice_sum
+    if max(counts) >= 4:
+        scores[YahtzeeGame.FOUR_OF_A_KIND] = dice_sum
+    if sorted(count for count in counts if count > 0) == [2, 3]:
+        scores[YahtzeeGame.FULL_HOUSE] = 25
+    faces = set(dice_values)
+    if any(set(range(first, first + 4)) <= faces for first in range(1, 4)):
+        scores[YahtzeeGame.SMALL_STRAIGHT] = 30
+    if any(set(range(first, first + 5)) <= faces for first in range(1, 3)):
+        scores[YahtzeeGame.LARGE_STRAIGHT] = 40
+    if max(counts) == 5:
+        scores[YahtzeeGame.YAHTZEE] = 50
+        scores[YahtzeeGame.BONUS_YAHTZEE] = 100
+    scores[YahtzeeGame.CHANCE] = dice_sum
+    return scores
+
+
+def test_score_dice_batch_matches_score_dice_on_every_roll():
+    batch_scores = YahtzeeGame.score_dice_batch(ALL_ROLLS)
+    assert batch_scores.shape == (len(ALL_ROLLS), YahtzeeGame.NUM_SLOTS)
+    for dice_values, scores in zip(ALL_ROLLS, batch_scores):
+        np.testing.assert_array_equal(scores, YahtzeeGame.score_dice(dice_values), err_msg=str(dice_values))
+        np.testing.assert_array_equal(scores, reference_scores(dice_values.tolist()), err_msg=str(dice_values))
+
+
+def test_score_dice_batch_accepts_unsigned_dice():
+    np.testing.assert_array_equal(YahtzeeGame.score_dice_batch(ALL_ROLLS.astype(np.uint8)),
+                                  YahtzeeGame.score_dice_batch(ALL_ROLLS))
+
+
+def test_scoring_does_not_sort_the_dice():
+    dice = ALL_ROLLS.copy()
+    YahtzeeGame.score_dice_batch(dice)
+    np.testing.assert_array_equal(dice, ALL_ROLLS)
+    dice_values = np.array([5, 3, 1, 4, 2], dtype=np.int8)
+    YahtzeeGame.score_dice(dice_values)
+    np.testing.assert_array_equal(dice_values, [5, 3, 1, 4, 2])
@@ -0,0 +1,43 @@
+import numpy as np
+
+from YahtzeeBatchGame import YahtzeeBatchGame
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeeScoreStatistics import YahtzeeScoreStatistics
+
+
+def play(num_games):
+    batch_game = YahtzeeBatchGame(rng=np.random.default_rng(17))
+    batch_game.play_games(num_games, POSITION_COSTS)
+    return batch_game.scores.copy()
+
+
+def test_two_halves_give_the_same_statistics_as_one_pass():
+    scores = play(2001)
+    one_pass = YahtzeeScoreStatistics()
+    one_pass.add_games(scores)
+    halves = YahtzeeScoreStatistics()
+    halves.add_games(scores[0:700])
+    halves.add_games(scores[700:])
+    # combine is what adds the second half to the first
+    separate = YahtzeeScoreStatistics()
+    separate.add_games(scores[700:])
+    combined = YahtzeeScoreStatistics()
+    combined.add_games(scores[0:700])
+    combined.combine(separate.games, separate.means, separate.sum_squares)
+
+    columns = YahtzeeScoreStatistics.game_columns(scores)
+    for statistics in [halves, combined]:
+        assert statistics.games == one_pass.games == len(scores)
+        np.testing.assert_allclose(statistics.means, one_pass.means)
+        np.testing.assert_allclose(statistics.variances(), one_pass.variances())
+    np.testing.assert_allclose(one_pass.means, np.mean(columns, axis=0))
+    np.testing.assert_allclose(one_pass.variances(), np.var(columns, axis=0, ddof=1))
+    np.testing.assert_array_equal(halves.zeros, one_pass.zeros)
+    np.testing.assert_array_equal(halves.histograms, one_pass.histograms)
+
+
+def test_totals_match_the_batch_game():
+    batch_game = YahtzeeBatchGame(rng=np.random.default_rng(3))
+    game_scores = batch_game.play_games(500, POSITION_COSTS)
+    columns = YahtzeeScoreStatistics.game_columns(batch_game.scores)
+    np.testing.assert_array_equal(columns[:, YahtzeeScoreStatistics.TOTAL], game_scores)
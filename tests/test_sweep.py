@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from YahtzeeDefaults import POSITION_COSTS
+from YahtzeeEvaluationStore import YahtzeeEvaluationStore
+from YahtzeeGame import YahtzeeRules
+from YahtzeeSweep import YahtzeeSweepCoordinator, YahtzeeSweepWorker, YahtzeeWorkQueue
+from YahtzeeTableCache import YahtzeeTableCache
+
+GAMES_PER_TRY = 20
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    # the rules tables come from the usual cache, and the dice tapes the workers make go in tmp_path
+    YahtzeeRules.shared()
+    monkeypatch.setenv(YahtzeeTableCache.CACHE_DIR_VARIABLE, str(tmp_path / 'cache'))
+    return str(tmp_path / 'sweep')
+
+
+def make_worker(directory, name, completed):
+    # a worker that notes each batch it completes
+    worker = YahtzeeSweepWorker(directory, poll_seconds=0.01, heartbeat_seconds=0.05)
+    worker.name = name
+    complete = worker.queue.complete
+
+    def complete_and_note(batch_id, claim_path, result):
+        completed.append(batch_id)
+        complete(batch_id, claim_path, result)
+    worker.queue.complete = complete_and_note
+    return worker
+
+
+def start_workers(workers):
+    threads = [threading.Thread(target=worker.run, daemon=True) for worker in workers]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_claims_are_exclusive(directory):
+    queue = YahtzeeWorkQueue(directory)
+    batch_ids = [f'batch-{k:03d}' for k in range(50)]
+    for batch_id in batch_ids:
+        queue.submit(batch_id, {'k': batch_id})
+    claimed = {'a': [], 'b': []}
+
+    def claim_all(worker_name):
+        while True:
+            claim = YahtzeeWorkQueue(directory).claim(worker_name)
+            if claim is None:
+                return
+            claimed[worker_name].append(claim[0])
+    threads = [threading.Thread(target=claim_all, args=(worker_name,)) for worker_name in claimed]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed['a'] + claimed['b']) == batch_ids
+    assert queue.batch_files(YahtzeeWorkQueue.PENDING) == []
+
+
+def test_stale_claims_are_requeued(directory):
+    queue = YahtzeeWorkQueue(directory)
+    queue.submit('batch', {})
+    batch_id, batch, claim_path = queue.claim('dead-worker')
+    assert queue.requeue_stale_claims(60) == []
+    assert queue.requeue_stale_claims(0) == ['batch']
+    assert queue.claim('live-worker')[0] == 'batch'
+
+
+def test_worker_ignores_a_left_over_stop_file(directory):
+    queue = YahtzeeWorkQueue(directory)
+    queue.stop_workers()
+    worker = YahtzeeSweepWorker(directory)
+    assert not worker.stopping()
+    queue.remove(f'{directory}/{YahtzeeWorkQueue.STOP_FILE}')
+    queue.stop_workers()
+    assert worker.stopping()
+
+
+def test_sweep_completes_every_batch_once(directory):
+    coordinator = YahtzeeSweepCoordinator(directory, GAMES_PER_TRY, seed=1, poll_seconds=0.01)
+    completed = []
+    workers = [make_worker(directory, name, completed) for name in ['a', 'b']]
+    threads = start_workers(workers)
+    coordinator.run(num_rounds=3, tries_per_round=4, batch_size=2)
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive()
+    assert len(completed) == coordinator.next_batch
+    assert len(set(completed)) == len(completed)
+    assert sum(worker.batches_done for worker in workers) == coordinator.next_batch
+    # every try played its games once, starting from the default position costs
+    assert coordinator.games_played == GAMES_PER_TRY * len(coordinator.entries)
+    assert all(entry['games'] == GAMES_PER_TRY for entry in coordinator.entries.values())
+    assert YahtzeeEvaluationStore.key(POSITION_COSTS) in coordinator.entries
+
+
+def test_batch_of_a_dead_worker_is_done_by_another(directory):
+    coordinator = YahtzeeSweepCoordinator(directory, GAMES_PER_TRY, seed=2, poll_seconds=0.01, stale_seconds=0.5)
+    queue = YahtzeeWorkQueue(directory)
+    dead_claims = []
+
+    def die_with_a_claim():
+        # claims the first batch, then stops without finishing it or touching the claim again
+        while len(dead_claims) == 0:
+            claim = queue.claim('dead-worker')
+            if claim is None:
+                time.sleep(0.01)
+            else:
+                dead_claims.append(claim[0])
+    completed = []
+    live_worker = make_worker(directory, 'live-worker', completed)
+
+    def run_live_worker():
+        # starts once the dead worker has its batch
+        while len(dead_claims) == 0:
+            time.sleep(0.01)
+        live_worker.run()
+    threads = [threading.Thread(target=target, daemon=True) for target in [die_with_a_claim, run_live_worker]]
+    for thread in threads:
+        thread.start()
+    coordinator.run(num_rounds=1, tries_per_round=3, batch_size=1)
+    for thread in threads:
+        thread.join(10)
+        assert not thread.is_alive()
+    assert coordinator.requeued == 1
+    assert dead_claims[0] in completed
+    assert sorted(completed) == sorted(set(completed))
+    assert len(completed) == coordinator.next_batch
+    assert all(entry['games'] == GAMES_PER_TRY for entry in coordinator.entries.values())
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+from YahtzeeGame import YahtzeeGame, YahtzeeRules
+from YahtzeeTableCache import YahtzeeTableCache
+
+
+class DoubleChanceRules(YahtzeeRules):
+    # the same rules, except that Chance scores double
+
+    @classmethod
+    def score_dice_batch(cls, dice):
+        position_scores = YahtzeeRules.score_dice_batch(dice)
+        position_scores[:, YahtzeeGame.CHANCE] *= 2
+        return position_scores
+
+
+@pytest.fixture
+def cache_directory(tmp_path, monkeypatch):
+    monkeypatch.setenv(YahtzeeTableCache.CACHE_DIR_VARIABLE, str(tmp_path))
+    return str(tmp_path)
+
+
+def test_changed_rules_get_a_new_table_file(cache_directory):
+    rules = YahtzeeRules()
+    changed_rules = DoubleChanceRules()
+    path = YahtzeeTableCache.table_path(YahtzeeRules)
+    changed_path = YahtzeeTableCache.table_path(DoubleChanceRules)
+    assert changed_path != path
+    assert sorted(os.listdir(cache_directory)) == sorted([os.path.basename(path), os.path.basename(changed_path)])
+    # the changed rules' tables were built from their own scores, not loaded from the other file
+    np.testing.assert_array_equal(changed_rules.dice_scores[:, YahtzeeGame.CHANCE],
+                                  2 * rules.dice_scores[:, YahtzeeGame.CHANCE])
+    np.testing.assert_array_equal(np.load(changed_path)['dice_scores'][0], changed_rules.dice_scores)
+
+
+def test_changed_constants_change_the_version(monkeypatch):
+    version = YahtzeeTableCache.rules_version(YahtzeeRules)
+    monkeypatch.setattr(YahtzeeGame, 'MAX_KEEPS', YahtzeeGame.MAX_KEEPS + 1)
+    assert YahtzeeTableCache.rules_version(YahtzeeRules) != version
+    monkeypatch.undo()
+    assert YahtzeeTableCache.rules_version(YahtzeeRules) == version